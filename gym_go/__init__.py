@@ -1,10 +1,45 @@
-from gym.envs.registration import register
-
-register(
-    id='go-v0',
-    entry_point='gym_go.envs:GoEnv',
-)
-register(
-    id='go-extrahard-v0',
-    entry_point='gym_go.envs:GoExtraHardEnv',
-)
+import importlib
+import sys
+
+
+def register_envs():
+    """
+    Registers the gym environments. Importing gym is slow, so importing gym_go only runs this if gym is already
+    loaded. Otherwise gym runs it through the package's 'gym.envs' entry point (gym >= 0.22), and importing
+    gym_go.envs or making 'gym_go:go-v0' runs it as well.
+    """
+    from gym.envs.registration import register, registry
+
+    # Newer gym versions keep the specs in the registry itself
+    env_specs = getattr(registry, 'env_specs', registry)
+    if 'go-v0' not in env_specs:
+        register(
+            id='go-v0',
+            entry_point='gym_go.envs:GoEnv',
+        )
+    if 'go-extrahard-v0' not in env_specs:
+        register(
+            id='go-extrahard-v0',
+            entry_point='gym_go.envs:GoExtraHardEnv',
+        )
+
+
+def stats(reset=False):
+    """
+    Snapshot of the rules engine's profiling counters and timings (see gym_go.profiling)
+    :param reset: Whether to clear them after taking the snapshot
+    """
+    from gym_go import profiling
+
+    return profiling.stats(reset)
+
+
+def __getattr__(name):
+    # Lazily load the gym and rendering layers
+    if name in ('envs', 'rendering'):
+        return importlib.import_module('gym_go.' + name)
+    raise AttributeError("module 'gym_go' has no attribute '{}'".format(name))
+
+
+if 'gym' in sys.modules:
+    register_envs()
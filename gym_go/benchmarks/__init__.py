@@ -0,0 +1,327 @@
+"""
+Benchmark suite for the rules engine and environments.
+
+Every benchmark is timed for each board size and (where it applies) batch size. Results are plain dicts
+that serialize to JSON and can be compared against a stored baseline:
+
+    python -m gym_go.benchmarks --quick --baseline gym_go/benchmarks/baseline.json
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import scipy
+
+from gym_go import gogame, govars, state_utils
+
+BOARD_SIZES = (5, 9, 13, 19)
+BATCH_SIZES = (1, 16, 256, 4096)
+QUICK_BOARD_SIZES = (5, 9)
+QUICK_BATCH_SIZES = (1, 16, 256)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 1.5
+
+# Distinct positions per board size, tiled to fill larger batches
+POOL_SIZE = 32
+
+BENCHMARKS = {}
+
+
+def benchmark(name, batched=True, max_batch=None):
+    """
+    Registers a benchmark. The decorated function takes (pool, batch_size, rng) and returns a no-argument callable
+    that is timed. pool is a (POOL_SIZE, NUM_CHNLS, SIZE, SIZE) array of mid-game positions.
+    Unbatched benchmarks only run with batch size 1.
+    """
+
+    def decorator(setup):
+        BENCHMARKS[name] = {'setup': setup, 'batched': batched, 'max_batch': max_batch}
+        return setup
+
+    return decorator
+
+
+def no_pass_weights(batch_states):
+    weights = np.ones((len(batch_states), gogame.action_size(batch_states[0])))
+    weights[:, -1] = 0
+    return weights
+
+
+def position_pool(size, rng, pool_size=POOL_SIZE):
+    """
+    Mid-game positions, reached by playing random non-pass moves on about a third of the board
+    """
+    batch_states = gogame.batch_init_state(pool_size, size)
+    for _ in range(size ** 2 // 3):
+        actions = gogame.batch_random_action(batch_states, no_pass_weights(batch_states), rng=rng)
+        batch_states = gogame.batch_next_states(batch_states, actions)
+    return batch_states
+
+
+def tile(pool, batch_size):
+    return np.resize(pool, (batch_size, *pool.shape[1:]))
+
+
+@benchmark('next_state', batched=False)
+def bench_next_state(pool, batch_size, rng):
+    state = pool[0]
+    action = gogame.random_action(state, rng)
+    return lambda: gogame.next_state(state, action)
+
+
+@benchmark('batch_next_states')
+def bench_batch_next_states(pool, batch_size, rng):
+    batch_states = tile(pool, batch_size)
+    actions = gogame.batch_random_action(batch_states, no_pass_weights(batch_states), rng=rng)
+    return lambda: gogame.batch_next_states(batch_states, actions)
+
+
+@benchmark('compute_invalid_moves', batched=False)
+def bench_compute_invalid_moves(pool, batch_size, rng):
+    state = pool[0]
+    player = gogame.turn(state)
+    return lambda: state_utils.compute_invalid_moves(state, player)
+
+
+@benchmark('batch_compute_invalid_moves')
+def bench_batch_compute_invalid_moves(pool, batch_size, rng):
+    batch_states = tile(pool, batch_size)
+    batch_players = gogame.batch_turn(batch_states)
+    batch_ko_protect = np.empty(batch_size, dtype=object)
+    return lambda: state_utils.batch_compute_invalid_moves(batch_states, batch_players, batch_ko_protect)
+
+
+@benchmark('areas', batched=False)
+def bench_areas(pool, batch_size, rng):
+    return lambda: gogame.areas(pool[0])
+
+
+@benchmark('batch_areas')
+def bench_batch_areas(pool, batch_size, rng):
+    batch_states = tile(pool, batch_size)
+    return lambda: gogame.batch_areas(batch_states)
+
+
+@benchmark('children', batched=False)
+def bench_children(pool, batch_size, rng):
+    return lambda: gogame.children(pool[0], canonical=True)
+
+
+@benchmark('canonical_form', batched=False)
+def bench_canonical_form(pool, batch_size, rng):
+    return lambda: gogame.canonical_form(pool[1])
+
+
+@benchmark('batch_canonical_form')
+def bench_batch_canonical_form(pool, batch_size, rng):
+    batch_states = tile(pool, batch_size)
+    return lambda: gogame.batch_canonical_form(batch_states)
+
+
+@benchmark('all_symmetries', batched=False)
+def bench_all_symmetries(pool, batch_size, rng):
+    return lambda: [np.ascontiguousarray(s) for s in gogame.all_symmetries(pool[0])]
+
+
+@benchmark('random_symmetry', batched=False)
+def bench_random_symmetry(pool, batch_size, rng):
+    return lambda: np.ascontiguousarray(gogame.random_symmetry(pool[0], rng))
+
+
+@benchmark('batch_features')
+def bench_batch_features(pool, batch_size, rng):
+    from gym_go import features
+
+    batch_states = tile(pool, batch_size)
+    return lambda: features.batch_features(batch_states)
+
+
+def random_episode(env, rng):
+    env.reset()
+    max_steps = 2 * env.size ** 2
+    for _ in range(max_steps):
+        state = env.state_
+        weights = no_pass_weights(state[np.newaxis])
+        if np.sum(weights * gogame.batch_valid_moves(state[np.newaxis])) == 0:
+            weights = None
+        action = gogame.batch_random_action(state[np.newaxis], weights, rng=rng)[0]
+        _, _, done, _ = env.step(action)
+        if done:
+            break
+
+
+@benchmark('env_episode', batched=False)
+def bench_env_episode(pool, batch_size, rng):
+    from gym_go.envs import GoEnv
+
+    env = GoEnv(size=pool.shape[-1])
+    return lambda: random_episode(env, rng)
+
+
+def random_vec_episode(envs, rng):
+    envs.reset()
+    max_steps = 2 * envs.size ** 2
+    for _ in range(max_steps):
+        weights = no_pass_weights(envs.states_)
+        actions = gogame.batch_random_action(envs.states_, weights, rng=rng)
+        _, _, dones, _ = envs.step(actions)
+        if dones.all():
+            break
+
+
+@benchmark('vec_env_episode', max_batch=16)
+def bench_vec_env_episode(pool, batch_size, rng):
+    from gym_go.envs import GoVecEnv
+
+    envs = GoVecEnv(batch_size, size=pool.shape[-1])
+    return lambda: random_vec_episode(envs, rng)
+
+
+def measure(fn, min_time, max_runs=1000):
+    """
+    Calls fn at least once and until min_time seconds have been spent
+    :return: Per call durations in seconds
+    """
+    durs = []
+    total = 0
+    while not durs or (total < min_time and len(durs) < max_runs):
+        start = time.perf_counter()
+        fn()
+        dur = time.perf_counter() - start
+        durs.append(dur)
+        total += dur
+    return np.array(durs)
+
+
+def measure_core_import(runs=5):
+    """
+    Cold start of a worker that only needs the rules engine, including interpreter startup
+    """
+    durs = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import gym_go.core'], check=True)
+        durs.append(time.perf_counter() - start)
+    return np.array(durs)
+
+
+def summarize(durs, batch_size):
+    median = float(np.median(durs))
+    return {
+        'median': median,
+        'min': float(np.min(durs)),
+        'mean': float(np.mean(durs)),
+        'std': float(np.std(durs)),
+        'runs': len(durs),
+        'boards_per_sec': batch_size / median if median > 0 else float('inf'),
+    }
+
+
+def result_key(name, size, batch_size):
+    return '{}/size={}/batch={}'.format(name, size, batch_size)
+
+
+def run(names=None, board_sizes=BOARD_SIZES, batch_sizes=BATCH_SIZES, min_time=0.2, seed=0, startup=True,
+        verbose=True):
+    """
+    :param names: Benchmarks to run, defaults to all
+    :param startup: Whether to also time a cold import of gym_go.core
+    :return: Results dict with a 'meta' and a 'results' entry, ready for json.dump
+    """
+    names = list(BENCHMARKS) if names is None else names
+    rng = gogame.make_rng(seed)
+    results = {}
+
+    if startup:
+        results['core_import'] = summarize(measure_core_import(), 1)
+        if verbose:
+            print('{:<48} {:>10.3f} ms'.format('core_import', results['core_import']['median'] * 1e3), flush=True)
+
+    for size in board_sizes:
+        pool = position_pool(size, rng)
+        for name in names:
+            bench = BENCHMARKS[name]
+            for batch_size in batch_sizes if bench['batched'] else [1]:
+                if bench['max_batch'] is not None and batch_size > bench['max_batch']:
+                    continue
+                fn = bench['setup'](pool, batch_size, rng)
+                key = result_key(name, size, batch_size)
+                results[key] = summarize(measure(fn, min_time), batch_size)
+                if verbose:
+                    print('{:<48} {:>10.3f} ms {:>12.0f} boards/s'.format(key, results[key]['median'] * 1e3,
+                                                                         results[key]['boards_per_sec']),
+                          flush=True)
+
+    return {'meta': metadata(), 'results': results}
+
+
+def cpu_model():
+    """
+    :return: The CPU's model name, platform.processor() is empty on most Linux systems
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def git_commit():
+    """
+    :return: The checked out commit of the repo, with -dirty for uncommitted changes, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(__file__),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu': cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'commit': git_commit(),
+        'num_chnls': govars.NUM_CHNLS,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares median times of the benchmarks present in both runs
+    :param threshold: A benchmark regressed if it's more than threshold times slower than the baseline
+    :return: List of (key, baseline median, current median, ratio, regressed) sorted by ratio
+    """
+    rows = []
+    for key, current in results['results'].items():
+        if key not in baseline['results']:
+            continue
+        base_median = baseline['results'][key]['median']
+        ratio = current['median'] / base_median if base_median > 0 else float('inf')
+        rows.append((key, base_median, current['median'], ratio, ratio > threshold))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from gym_go import benchmarks
+
+parser = argparse.ArgumentParser(description='Benchmark the Go rules engine and environments')
+parser.add_argument('--sizes', type=int, nargs='+', default=None, help='Board sizes')
+parser.add_argument('--batch-sizes', type=int, nargs='+', default=None, help='Batch sizes')
+parser.add_argument('--quick', action='store_true',
+                    help='Only small boards and batches, unless sizes are given explicitly')
+parser.add_argument('--only', nargs='+', default=None, choices=sorted(benchmarks.BENCHMARKS),
+                    help='Only run these benchmarks')
+parser.add_argument('--no-startup', action='store_true', help='Skip the cold import benchmark')
+parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds spent timing each case')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--out', default=None, help='Write results as JSON to this path')
+parser.add_argument('--baseline', default=None,
+                    help='Compare against this results JSON (the stored one is {})'.format(benchmarks.DEFAULT_BASELINE))
+parser.add_argument('--threshold', type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                    help='Slowdown ratio over the baseline median that counts as a regression')
+parser.add_argument('--save-baseline', action='store_true', help='Overwrite the baseline with these results')
+args = parser.parse_args()
+
+sizes = args.sizes or (benchmarks.QUICK_BOARD_SIZES if args.quick else benchmarks.BOARD_SIZES)
+batch_sizes = args.batch_sizes or (benchmarks.QUICK_BATCH_SIZES if args.quick else benchmarks.BATCH_SIZES)
+
+results = benchmarks.run(args.only, sizes, batch_sizes, args.min_time, args.seed, startup=not args.no_startup)
+
+if args.out is not None:
+    benchmarks.save(results, args.out)
+
+if args.save_baseline:
+    benchmarks.save(results, args.baseline or benchmarks.DEFAULT_BASELINE)
+elif args.baseline is not None:
+    rows = benchmarks.compare(results, benchmarks.load(args.baseline), args.threshold)
+    print('\n{:<48} {:>12} {:>12} {:>8}'.format('benchmark', 'baseline ms', 'current ms', 'ratio'))
+    for key, base_median, median, ratio, regressed in rows:
+        print('{:<48} {:>12.3f} {:>12.3f} {:>8.2f}{}'.format(key, base_median * 1e3, median * 1e3, ratio,
+                                                             '  REGRESSED' if regressed else ''))
+    num_regressed = sum(row[-1] for row in rows)
+    print('{} of {} benchmarks regressed beyond {:.2f}x'.format(num_regressed, len(rows), args.threshold))
+    sys.exit(1 if num_regressed > 0 else 0)
@@ -0,0 +1,9 @@
+"""
+Slim import path to the game logic, for worker processes that don't need gym or rendering.
+Only numpy and scipy are imported.
+
+    from gym_go.core import gogame, govars
+"""
+from gym_go import govars, gogame, state_utils
+
+__all__ = ['govars', 'gogame', 'state_utils']
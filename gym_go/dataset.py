@@ -0,0 +1,248 @@
+"""
+On-disk position datasets made of fixed size, memory-mapped shards.
+
+A dataset is a directory with an index.json and shard-XXXXX.bin files. Every position is one fixed size record
+holding the bit-packed black, white and invalid move planes, the turn/pass/game over flags, the outcome and the
+policy target, so position i lives at row i % shard_size of shard i // shard_size.
+
+    with DatasetWriter('data/', board_size=9) as writer:
+        writer.append(states, policies, outcomes)
+
+    dataset = PositionDataset('data/')
+    states, policies, outcomes = dataset.sample(256, rng)
+"""
+import json
+import os
+
+import numpy as np
+
+from gym_go import gogame, govars
+
+FORMAT_VERSION = 1
+INDEX_FILE = 'index.json'
+PACKED_CHNLS = [govars.BLACK, govars.WHITE, govars.INVD_CHNL]
+TURN_FLAG = 1
+PASS_FLAG = 2
+DONE_FLAG = 4
+
+
+def packed_size(board_size):
+    return (len(PACKED_CHNLS) * board_size ** 2 + 7) // 8
+
+
+def record_dtype(board_size):
+    return np.dtype([
+        ('planes', np.uint8, (packed_size(board_size),)),
+        ('flags', np.uint8),
+        ('outcome', np.float32),
+        ('policy', np.float16, (gogame.action_size(board_size=board_size),)),
+    ])
+
+
+def pack_states(batch_states):
+    """
+    :param batch_states: (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE) states
+    :return: (BATCH_SIZE, packed size) uint8 planes and (BATCH_SIZE,) uint8 flags
+    """
+    n = len(batch_states)
+    planes = np.packbits(batch_states[:, PACKED_CHNLS].reshape(n, -1) > 0, axis=1)
+    flags = (TURN_FLAG * (batch_states[:, govars.TURN_CHNL, 0, 0] > 0)
+             + PASS_FLAG * (batch_states[:, govars.PASS_CHNL, 0, 0] > 0)
+             + DONE_FLAG * (batch_states[:, govars.DONE_CHNL, 0, 0] > 0)).astype(np.uint8)
+    return planes, flags
+
+
+def unpack_states(planes, flags, board_size, out=None):
+    """
+    Inverse of pack_states
+    :param out: Optional (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE) array to decode into
+    """
+    n = len(planes)
+    if out is None:
+        out = np.empty((n, govars.NUM_CHNLS, board_size, board_size))
+    bits = np.unpackbits(planes, axis=1, count=len(PACKED_CHNLS) * board_size ** 2)
+    out[:, PACKED_CHNLS] = bits.reshape(n, len(PACKED_CHNLS), board_size, board_size)
+    for chnl, flag in [(govars.TURN_CHNL, TURN_FLAG), (govars.PASS_CHNL, PASS_FLAG), (govars.DONE_CHNL, DONE_FLAG)]:
+        out[:, chnl] = ((flags & flag) > 0)[:, np.newaxis, np.newaxis]
+    return out
+
+
+def _shard_path(path, shard):
+    return os.path.join(path, 'shard-{:05d}.bin'.format(shard))
+
+
+def _read_index(path):
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = json.load(f)
+    if index['version'] != FORMAT_VERSION:
+        raise ValueError('Unsupported dataset version {}'.format(index['version']))
+    return index
+
+
+class DatasetWriter:
+    """
+    Append-only writer. Positions only become visible to readers once the index is flushed,
+    and reopening an existing dataset continues after its last indexed position.
+    """
+
+    def __init__(self, path, board_size=None, shard_size=1 << 20):
+        '''
+        @param board_size: Required for new datasets
+        @param shard_size: Positions per shard, for new datasets
+        '''
+        self.path = path
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            index = _read_index(path)
+            if board_size is not None and board_size != index['board_size']:
+                raise ValueError('Dataset has board size {}'.format(index['board_size']))
+            self.board_size = index['board_size']
+            self.shard_size = index['shard_size']
+            self.count = index['count']
+        else:
+            if board_size is None:
+                raise ValueError('board_size is required for a new dataset')
+            os.makedirs(path, exist_ok=True)
+            self.board_size = board_size
+            self.shard_size = shard_size
+            self.count = 0
+        self.dtype = record_dtype(self.board_size)
+        self.num_actions = gogame.action_size(board_size=self.board_size)
+
+        # Drop records that were written after the last flush, also in later shards
+        shard, row = divmod(self.count, self.shard_size)
+        if os.path.exists(_shard_path(path, shard)):
+            with open(_shard_path(path, shard), 'r+b') as f:
+                f.truncate(row * self.dtype.itemsize)
+        later = shard + 1
+        while os.path.exists(_shard_path(path, later)):
+            os.remove(_shard_path(path, later))
+            later += 1
+        self._file = None
+        self._file_shard = None
+        self.flush()
+
+    def append(self, batch_states, policies=None, outcomes=None):
+        """
+        :param batch_states: (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE)
+        :param policies: (BATCH_SIZE, NUM OF MOVES) policy targets or (BATCH_SIZE,) actions, stored as one-hots
+        :param outcomes: (BATCH_SIZE,) value targets
+        """
+        n = len(batch_states)
+        records = np.zeros(n, dtype=self.dtype)
+        records['planes'], records['flags'] = pack_states(batch_states)
+        if outcomes is not None:
+            records['outcome'] = outcomes
+        if policies is not None:
+            policies = np.asarray(policies)
+            if policies.ndim == 1:
+                records['policy'][np.arange(n), policies] = 1
+            else:
+                records['policy'] = policies
+
+        start = 0
+        while start < n:
+            shard, row = divmod(self.count, self.shard_size)
+            end = min(n, start + self.shard_size - row)
+            self._shard_file(shard).write(records[start:end].tobytes())
+            self.count += end - start
+            start = end
+
+    def _shard_file(self, shard):
+        if self._file_shard != shard:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(_shard_path(self.path, shard), 'ab')
+            self._file_shard = shard
+        return self._file
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        index = {
+            'version': FORMAT_VERSION,
+            'board_size': self.board_size,
+            'shard_size': self.shard_size,
+            'count': self.count,
+        }
+        tmp_path = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_shard = None
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PositionDataset:
+    """
+    Random access reader. Shards are memory-mapped on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        """
+        Picks up positions flushed by a writer since opening
+        """
+        index = _read_index(self.path)
+        self.board_size = index['board_size']
+        self.shard_size = index['shard_size']
+        self.count = index['count']
+        self.dtype = record_dtype(self.board_size)
+        self._shards = {}
+
+    def _shard(self, shard):
+        if shard not in self._shards:
+            rows = min(self.shard_size, self.count - shard * self.shard_size)
+            self._shards[shard] = np.memmap(_shard_path(self.path, shard), dtype=self.dtype, mode='r',
+                                            shape=(rows,))
+        return self._shards[shard]
+
+    def records(self, indices):
+        """
+        :return: Raw records of the positions, in the order of indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() >= self.count):
+            raise IndexError('Position index out of range')
+        shards, rows = np.divmod(indices, self.shard_size)
+        records = np.empty(len(indices), dtype=self.dtype)
+        for shard in np.unique(shards):
+            mask = shards == shard
+            records[mask] = self._shard(shard)[rows[mask]]
+        return records
+
+    def batch(self, indices, out=None):
+        """
+        :param out: Optional preallocated (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE) array for the states
+        :return: states in gogame's layout, policies, outcomes
+        """
+        records = self.records(indices)
+        states = unpack_states(records['planes'], records['flags'], self.board_size, out)
+        return states, records['policy'].astype(np.float32), records['outcome']
+
+    def sample(self, batch_size, rng=None, out=None):
+        rng = gogame.make_rng(rng)
+        return self.batch(rng.integers(0, self.count, size=batch_size), out)
+
+    def __getitem__(self, idx):
+        states, policies, outcomes = self.batch([idx])
+        return states[0], policies[0], outcomes[0]
+
+    def __len__(self):
+        return self.count
@@ -1,2 +1,7 @@
+from gym_go import register_envs
 from gym_go.envs.go_env import GoEnv
-from gym_go.envs.go_extrahard_env import GoExtraHardEnv
+from gym_go.envs.go_vec_env import GoVecEnv
+from gym_go.envs.go_multiagent_env import GoMultiAgentVecEnv
+from gym_go.envs.go_extrahard_env import GoExtraHardEnv, GoExtraHardVecEnv
+
+register_envs()
@@ -1,10 +1,13 @@
+import copy
+from collections import namedtuple
 from enum import Enum
 
 import gym
 import numpy as np
 
-from gym_go import govars, rendering, gogame
-from gym_go.gogame import turn
+from gym_go import govars, gogame, hashing
+from gym_go.dataset import pack_states, unpack_states
+from gym_go.history import HistoryBuffer
 
 
 class RewardMethod(Enum):
@@ -12,9 +15,20 @@ class RewardMethod(Enum):
     REAL: 0 = game is ongoing, 1 = black won, -1 = game tied or white won
     HEURISTIC: If game is ongoing, the reward is the area difference between black and white.
     Otherwise the game has ended, and if black has more area, the reward is BOARD_SIZE**2, otherwise it's -BOARD_SIZE**2
+    INFLUENCE: Like HEURISTIC, but ongoing games are scored with the estimated territory of gogame.influence_areas
     """
     REAL = 'real'
     HEURISTIC = 'heuristic'
+    INFLUENCE = 'influence'
+
+
+SUPERKO_RULES = ('positional', 'situational')
+
+# Game state of a GoEnv, everything else is configuration (see GoEnv.snapshot)
+EnvSnapshot = namedtuple('EnvSnapshot', ['state', 'done', 'position_hashes', 'history', 'moves', 'streak',
+                                         'adjudication'])
+
+RENDERING_ATTRS = ('window', 'pyglet', 'user_action')
 
 
 class GoEnv(gym.Env):
@@ -22,13 +36,24 @@ class GoEnv(gym.Env):
     govars = govars
     gogame = gogame
 
-    def __init__(self, size, komi=0, reward_method='real', learn_rules=False):
+    def __init__(self, size, komi=0, reward_method='real', learn_rules=False, superko=None, history=None,
+                 history_extra=('turn',), adjudicate_margin=None, adjudicate_moves=10):
         '''
-        @param reward_method: either 'heuristic' or 'real'
+        @param reward_method: either 'heuristic', 'influence' or 'real'
         heuristic: gives # black pieces - # white pieces.
+        influence: like heuristic, but counts the territory estimated by gogame.ownership while the game is ongoing
         real: gives 0 for in-game move, 1 for winning, -1 for losing,
             0 for draw, all from black player's perspective
+        @param superko: None (simple ko only), 'positional' or 'situational'.
+        Moves that repeat an earlier board (with the same player to move if situational) are marked invalid
+        @param history: If set to k, observations are the black and white stones of the last k positions
+        (newest first) followed by the history_extra feature planes, see history.HistoryBuffer
+        @param adjudicate_margin: If set, the game ends early once the estimated score favours one player by more than
+        this for adjudicate_moves moves in a row, or when both players can only fill their own eyes
+        (see gogame.batch_adjudicate). The adjudicated winner is then the winner, and steps_saved counts
+        the moves this cut off
         '''
+        assert superko is None or superko in SUPERKO_RULES, superko
         self.size = size
         self.komi = komi
         self.learn_rules = learn_rules
@@ -36,17 +61,59 @@ class GoEnv(gym.Env):
         self.reward_method = RewardMethod(reward_method)
         self.observation_space = gym.spaces.Box(np.float32(0), np.float32(govars.NUM_CHNLS),
                                                 shape=(govars.NUM_CHNLS, size, size))
+        self.history = None
+        if history is not None:
+            self.history = HistoryBuffer(1, size, history, history_extra)
+            self.observation_space = gym.spaces.Box(np.float32(0), np.float32(size ** 2),
+                                                    shape=(self.history.num_planes, size, size))
         self.action_space = gym.spaces.Discrete(gogame.action_size(self.state_))
         self.done = False
+        self.np_random = gogame.make_rng()
+        self.superko = superko
+        self.position_hashes = set()
+        self._update_superko()
+        self.adjudicate_margin = adjudicate_margin
+        self.adjudicate_moves = adjudicate_moves
+        self.steps_saved = 0
+        self._reset_adjudication()
+
+    def seed(self, seed=None):
+        '''
+        @param seed: None, an int, a SeedSequence (e.g. from gogame.spawn_rngs / SeedSequence.spawn)
+        or a Generator to use directly
+        '''
+        self.np_random = gogame.make_rng(seed)
+        return [seed]
 
-    def reset(self):
+    def reset(self, seed=None, options=None):
         '''
         Reset state, go_board, curr_player, prev_player_passed,
         done, return state
+        @param seed: If given, reseeds the environment's generator (see seed)
+        @param options: Optional dict. 'opening_book': a position_index.PositionIndex to start from one of its
+        positions, sampled by visits in a random orientation ('min_visits' filters rare ones).
+        'state': a (NUM_CHNLS, SIZE, SIZE) state to start from, e.g. from a start_states.StartStatePool.
+        Its earlier positions are unknown, so superko only covers the positions from there on
         '''
-        self.state_ = gogame.init_state(self.size)
-        self.done = False
-        return np.copy(self.state_)
+        if seed is not None:
+            self.seed(seed)
+        options = options or {}
+        if options.get('opening_book') is not None:
+            book = options['opening_book']
+            assert book.board_size == self.size
+            self.state_ = book.sample(1, self.np_random, options.get('min_visits', 1))[0]
+        elif options.get('state') is not None:
+            self.state_ = np.array(options['state'], dtype=np.float64)
+            assert self.state_.shape == (govars.NUM_CHNLS, self.size, self.size), self.state_.shape
+        else:
+            self.state_ = gogame.init_state(self.size)
+        self.done = bool(gogame.game_ended(self.state_))
+        self.position_hashes = set()
+        self._update_superko()
+        self._reset_adjudication()
+        if self.history is not None:
+            self.history.reset(self.state_[np.newaxis])
+        return self.observation()
 
     def step(self, action):
         '''
@@ -63,8 +130,14 @@ class GoEnv(gym.Env):
 
         try:
             self.state_ = gogame.next_state(self.state_, action, canonical=False)
-            reward = self.reward()
+            self.moves += 1
+            if self.adjudicate_margin is not None and not gogame.game_ended(self.state_):
+                self._adjudicate()
             self.done = gogame.game_ended(self.state_)
+            reward = self.reward()
+            self._update_superko()
+            if self.history is not None:
+                self.history.push(self.state_[np.newaxis])
             # if self.learn_rules:
             #     reward += 10
         except AssertionError as e:
@@ -75,7 +148,45 @@ class GoEnv(gym.Env):
             # else:
             #     raise e
 
-        return np.copy(self.state_), reward, self.done, self.info()
+        return self.observation(), reward, self.done, self.info()
+
+    def observation(self, out=None):
+        """
+        :param out: Optional array to write the stacked history observation into (history mode only)
+        :return: Copy of the state, or the stacked history observation if the env has a history
+        """
+        if self.history is None:
+            return np.copy(self.state_)
+        return self.history.observation(self.state_[np.newaxis], None if out is None else out[np.newaxis])[0]
+
+    def _reset_adjudication(self):
+        self.moves = 0
+        self.streak = 0
+        self.adjudication = None
+
+    def _adjudicate(self):
+        """
+        Ends the game if its result is already clear. The moves it would have had left until the usual
+        2 * size ** 2 cut off are added to steps_saved
+        """
+        adjudicated, winners, streaks = gogame.batch_adjudicate(self.state_[np.newaxis], np.array([self.streak]),
+                                                                self.adjudicate_margin, self.adjudicate_moves,
+                                                                self.komi)
+        self.streak = int(streaks[0])
+        if adjudicated[0]:
+            self.state_[govars.DONE_CHNL] = 1
+            self.adjudication = winners[0]
+            self.steps_saved += max(2 * self.size ** 2 - self.moves, 0)
+
+    def _update_superko(self):
+        """
+        Records the current position and marks the moves that would repeat a recorded one as invalid
+        """
+        if self.superko is None:
+            return
+        position_hashes = hashing.batch_mark_superko(self.state_[np.newaxis], [self.position_hashes],
+                                                     self.superko == 'situational')
+        self.position_hashes.add(int(position_hashes[0]))
 
     def game_ended(self):
         return self.done
@@ -93,9 +204,7 @@ class GoEnv(gym.Env):
         return [bool(i) for i in self.valid_moves()]
 
     def uniform_random_action(self):
-        valid_moves = self.valid_moves()
-        valid_move_idcs = np.argwhere(valid_moves).flatten()
-        return np.random.choice(valid_move_idcs)
+        return gogame.random_action(self.state_, self.np_random)
 
     def info(self):
         """
@@ -105,6 +214,7 @@ class GoEnv(gym.Env):
             'turn': gogame.turn(self.state_),
             'invalid_moves': gogame.invalid_moves(self.state_),
             'prev_player_passed': gogame.prev_player_passed(self.state_),
+            'adjudicated': self.adjudication is not None,
         }
 
     def state(self):
@@ -113,6 +223,53 @@ class GoEnv(gym.Env):
         """
         return np.copy(self.state_)
 
+    def snapshot(self):
+        """
+        :return: EnvSnapshot of the game state only (position, flags, superko hashes, history), for restore
+        """
+        history = None if self.history is None else self.history.snapshot()
+        return EnvSnapshot(np.copy(self.state_), self.done, frozenset(self.position_hashes), history, self.moves,
+                           self.streak, self.adjudication)
+
+    def restore(self, snapshot):
+        """
+        Returns to a snapshot of this env (or of an env with the same configuration). It can be restored again later
+        """
+        self.state_ = np.copy(snapshot.state)
+        self.done = snapshot.done
+        self.position_hashes = set(snapshot.position_hashes)
+        if self.history is not None:
+            self.history.restore(snapshot.history)
+        self.moves, self.streak, self.adjudication = snapshot.moves, snapshot.streak, snapshot.adjudication
+
+    def clone(self):
+        """
+        Cheaper than copy.deepcopy. The clone shares the configuration (spaces, reward method, ...),
+        has its own game state and generator, and no rendering handles
+        """
+        env = object.__new__(type(self))
+        env.__dict__.update((key, value) for key, value in self.__dict__.items() if key not in RENDERING_ATTRS)
+        env.np_random = copy.deepcopy(self.np_random)
+        if self.history is not None:
+            env.history = copy.copy(self.history)
+        env.restore(self.snapshot())
+        return env
+
+    def __getstate__(self):
+        # The position is pickled as packed bits (see dataset.pack_states) and the superko hashes as a uint64 array,
+        # which pickle protocol 5 can pass out-of-band
+        state = {key: value for key, value in self.__dict__.items() if key not in RENDERING_ATTRS}
+        planes, flags = pack_states(self.state_[np.newaxis])
+        state['state_'] = planes[0], flags[0]
+        state['position_hashes'] = np.fromiter(self.position_hashes, dtype=np.uint64, count=len(self.position_hashes))
+        return state
+
+    def __setstate__(self, state):
+        planes, flags = state['state_']
+        state['state_'] = unpack_states(planes[np.newaxis], flags[np.newaxis], state['size'])[0]
+        state['position_hashes'] = set(state['position_hashes'].tolist())
+        self.__dict__.update(state)
+
     def canonical_state(self):
         """
         :return: canonical shallow copy of state
@@ -129,12 +286,9 @@ class GoEnv(gym.Env):
         """
         :return: Who's currently winning in BLACK's perspective, regardless if the game is over
         """
-        result = gogame.winning(self.state_, self.komi)
-        state = np.copy(self.state_)
-        player = turn(state)
-        if player == 0:
-            return result
-        return result * -1
+        if self.adjudication is not None:
+            return self.adjudication
+        return gogame.winning(self.state_, self.komi)
 
     def winner(self):
         """
@@ -151,24 +305,25 @@ class GoEnv(gym.Env):
         '''
         Return reward based on reward_method.
         heuristic: black total area - white total area
-        real: 0 for in-game move, 1 for winning, 0 for losing,
-            0.5 for draw, from black player's perspective.
+        influence: black estimated area - white estimated area, the real areas once the game has ended
+        real: 0 for in-game move, 1 for winning, -1 for losing,
+            0 for draw, from black player's perspective.
             Winning and losing based on the Area rule
             Also known as Trump Taylor Scoring
         Area rule definition: https://en.wikipedia.org/wiki/Rules_of_Go#End
         '''
         if self.reward_method == RewardMethod.REAL:
-            return self.winner() * 1000
-
-        elif self.reward_method == RewardMethod.HEURISTIC:
-            black_area, white_area = gogame.areas(self.state_)
-            area_difference = black_area - white_area
-            state = np.copy(self.state_)
-            player = turn(state)
-            if player == 1:
-                area_difference *= -1
-            komi_correction = area_difference - self.komi
+            return self.winner()
+
+        elif self.reward_method in (RewardMethod.HEURISTIC, RewardMethod.INFLUENCE):
+            if self.reward_method == RewardMethod.INFLUENCE and not self.game_ended():
+                black_area, white_area = gogame.influence_areas(self.state_)
+            else:
+                black_area, white_area = gogame.areas(self.state_)
+            komi_correction = black_area - white_area - self.komi
             if self.game_ended():
+                if self.adjudication is not None:
+                    komi_correction = self.adjudication
                 return (1 if komi_correction > 0 else -1) * self.size ** 2
             return komi_correction
         else:
@@ -188,6 +343,7 @@ class GoEnv(gym.Env):
             print(self.__str__())
         elif mode == 'human':
             import pyglet
+            from gym_go import rendering
             from pyglet.window import mouse
             from pyglet.window import key
 
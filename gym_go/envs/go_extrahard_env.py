@@ -1,5 +1,143 @@
-import gym
+import numpy as np
 
+from gym_go import govars, gogame
+from gym_go.envs.go_env import GoEnv
+from gym_go.envs.go_vec_env import GoVecEnv
+from gym_go.search import MCTS
 
-class GoExtraHardEnv(gym.Env):
+
+class GoExtraHardEnv(GoEnv):
+    """
+    Single agent Go against a built-in MCTS opponent (see search.MCTS) that replies within every step.
+    Observations are the states after the opponent's reply. Rewards are GoEnv's, in the agent's perspective
+    instead of black's, e.g. 1 for a won game with the real reward method.
+    """
     metadata = {'render.modes': ['human', 'terminal']}
+
+    def __init__(self, size, komi=0, reward_method='real', agent_color='black', simulations=64, time_ms=None,
+                 leaves_per_root=8, seed=None, **kwargs):
+        '''
+        @param agent_color: 'black' or 'white'. The opponent opens if the agent is white
+        @param simulations: Opponent's playouts per move (None to only use time_ms)
+        @param time_ms: Opponent's optional time budget per move in milliseconds
+        @param seed: Seeds the env and the opponent
+        Other arguments are passed to GoEnv. The opponent's search follows the env's superko rule
+        '''
+        super().__init__(size, komi, reward_method, **kwargs)
+        self.agent = {'black': govars.BLACK, 'white': govars.WHITE}[agent_color]
+        self.opponent = MCTS(simulations, time_ms, leaves_per_root, komi=komi, superko=self.superko)
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        if isinstance(seed, np.random.Generator):
+            env_rng, opponent_rng = seed, seed
+        else:
+            env_rng, opponent_rng = gogame.spawn_rngs(seed, 2)
+        super().seed(env_rng)
+        if hasattr(self, 'opponent'):
+            self.opponent.rng = opponent_rng
+        return [seed]
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed, options)
+        if self.turn() != self.agent:
+            self._opponent_step()
+        return self.observation()
+
+    def step(self, action):
+        '''
+        Plays the agent's action, then the opponent's reply
+        return observation, reward, done, info
+        '''
+        _, reward, done, info = super().step(action)
+        if not done:
+            _, reward, done, info = self._opponent_step()
+        if self.agent == govars.WHITE and np.isfinite(reward):
+            # GoEnv rewards are in black's perspective, -inf stays the penalty for an invalid action
+            reward = -reward
+        return self.observation(), reward, done, info
+
+    def _opponent_step(self):
+        action = self.opponent.search(self.state_[np.newaxis], [self.position_hashes])[0]
+        return super().step(action)
+
+
+class GoExtraHardVecEnv(GoVecEnv):
+    """
+    Batch of GoExtraHardEnv games. The opponent searches all games that are waiting for a reply at once,
+    so its playouts are batched across envs. An invalid action ends only its own game, with a reward of -inf
+    as in GoEnv.
+    """
+
+    def __init__(self, num_envs, size, komi=0, reward_method='real', agent_color='black', simulations=64,
+                 time_ms=None, leaves_per_root=8, seed=None, **kwargs):
+        self.agent = {'black': govars.BLACK, 'white': govars.WHITE}[agent_color]
+        self.opponent = MCTS(simulations, time_ms, leaves_per_root, komi=komi, superko=kwargs.get('superko'))
+        super().__init__(num_envs, size, komi, reward_method, seed, **kwargs)
+        self.invalid = np.zeros(num_envs, dtype=bool)
+
+    def seed(self, seed=None):
+        seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        games_seed, opponent_seed = seed.spawn(2)
+        self.opponent.rng = gogame.make_rng(opponent_seed)
+        return super().seed(games_seed)
+
+    def reset(self, seed=None):
+        super().reset(seed)
+        self.invalid = np.zeros(self.num_envs, dtype=bool)
+        if self.agent == govars.WHITE:
+            self._opponent_step()
+        return self.observations()
+
+    def reset_to(self, indices, states):
+        '''
+        Restarts the games at indices from the given states (see GoVecEnv.reset_to). The opponent replies right away
+        in the restarted games where it is to move, whose history then starts from the position after its reply
+        return observations of all games
+        '''
+        super().reset_to(indices, states)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        self.invalid[indices] = False
+        waiting = indices[(gogame.batch_turn(self.states_[indices]) != self.agent) & ~self.dones[indices]]
+        if len(waiting) > 0:
+            actions = self.opponent.search(self.states_[waiting], [self.position_hashes[i] for i in waiting])
+            self.states_[waiting] = gogame.batch_next_states(self.states_[waiting], actions)
+            self.dones[waiting] = gogame.batch_game_ended(self.states_[waiting]) > 0
+            self.moves[waiting] += 1
+            self._update_superko(waiting)
+            if self.history is not None:
+                self.history.reset(self.states_[waiting], waiting)
+        return self.observations()
+
+    def step(self, actions):
+        '''
+        Plays the agents' actions, then the opponent's replies in the games that have not ended.
+        Games with an invalid action end without playing it
+        '''
+        actions = np.asarray(actions)
+        active = np.nonzero(~self.dones)[0]
+        on_board = (actions[active] >= 0) & (actions[active] <= self.size ** 2)
+        legal, _ = gogame.batch_is_legal(self.states_[active], np.where(on_board, actions[active], self.size ** 2))
+        invalid = active[~(legal & on_board)]
+        self.states_[invalid, govars.DONE_CHNL] = 1
+        self.dones[invalid] = True
+        self.invalid[invalid] = True
+
+        _, rewards, dones, info = super().step(actions)
+        if not dones.all():
+            _, rewards, dones, info = self._opponent_step()
+        if self.agent == govars.WHITE:
+            # -inf stays the penalty for an invalid action
+            rewards = np.where(np.isfinite(rewards), -rewards, rewards)
+        return self.observations(), rewards, dones, info
+
+    def rewards(self):
+        rewards = super().rewards()
+        rewards[self.invalid] = -np.inf
+        return rewards
+
+    def _opponent_step(self):
+        actions = np.full(self.num_envs, self.size ** 2)
+        waiting = np.nonzero(~self.dones)[0]
+        actions[waiting] = self.opponent.search(self.states_[waiting], [self.position_hashes[i] for i in waiting])
+        return super().step(actions)
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+import numpy as np
+
+from gym_go import govars, gogame
+from gym_go.envs.go_vec_env import GoVecEnv
+
+Turn = namedtuple('Turn', ['indices', 'observations', 'action_masks'])
+
+
+class GoMultiAgentVecEnv(GoVecEnv):
+    """
+    Two-player view of a batch of games. Every step reports, for each agent, the games where it is to move with their
+    canonical observations and valid move masks, so each agent's policy runs one batched inference per ply.
+    """
+    agents = ('black', 'white')
+
+    def __init__(self, num_envs, size, **kwargs):
+        '''
+        Arguments are passed to GoVecEnv. Rewards are reported for both agents
+        '''
+        super().__init__(num_envs, size, **kwargs)
+        self.observe()
+
+    def reset(self, seed=None):
+        super().reset(seed)
+        return self.observe()
+
+    def reset_to(self, indices, states):
+        super().reset_to(indices, states)
+        return self.observe()
+
+    def observe(self):
+        """
+        :return: {agent: Turn(indices, observations, action_masks)} of the ongoing games where the agent is to move.
+        Observations are canonical, i.e. the agent's stones come first
+        (also in the stacked history observations if the envs have a history)
+        """
+        players = gogame.batch_turn(self.states_)
+        masks = gogame.batch_valid_moves(self.states_) > 0
+        canonical = gogame.batch_canonical_form(self.states_)
+        if self.history is not None:
+            observations = self.history.observation(canonical)
+            # Swap the black and white planes of every past position for the games where white is to move
+            stones = observations[:, :2 * self.history.history].reshape(self.num_envs, self.history.history, 2,
+                                                                         self.size, self.size)
+            white = players == govars.WHITE
+            stones[white] = stones[white][:, :, ::-1]
+        else:
+            observations = canonical
+
+        self._turns = {}
+        for player, agent in enumerate(self.agents):
+            indices = np.nonzero((players == player) & ~self.dones)[0]
+            self._turns[agent] = Turn(indices, observations[indices], masks[indices])
+        return self._turns
+
+    def step(self, actions):
+        '''
+        @param actions: {agent: actions} aligned with the indices of the agent's last Turn (see observe).
+        Agents without games to move in can be left out
+        return turns (see observe), rewards {agent: (NUM_ENVS,) rewards in the agent's perspective}, dones, info
+        '''
+        batch_actions = np.full(self.num_envs, self.size ** 2)
+        for agent, turn in self._turns.items():
+            if len(turn.indices) > 0:
+                agent_actions = np.asarray(actions[agent])
+                assert agent_actions.shape == turn.indices.shape, (agent, agent_actions.shape)
+                batch_actions[turn.indices] = agent_actions
+        _, rewards, dones, info = super().step(batch_actions)
+        return self.observe(), {'black': rewards, 'white': -rewards}, dones, info
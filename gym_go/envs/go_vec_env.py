@@ -0,0 +1,201 @@
+import numpy as np
+
+from gym_go import govars, gogame, hashing
+from gym_go.envs.go_env import RewardMethod, SUPERKO_RULES
+from gym_go.history import HistoryBuffer
+
+
+class GoVecEnv:
+    """
+    A batch of independent Go games that are stepped together with gogame's batch functions.
+    Each game has its own numpy Generator stream spawned from a single SeedSequence,
+    so parallel rollouts are reproducible from one seed. Rewards are the same as GoEnv's, in black's perspective.
+    """
+    govars = govars
+    gogame = gogame
+
+    def __init__(self, num_envs, size, komi=0, reward_method='real', seed=None, superko=None, history=None,
+                 history_extra=('turn',), adjudicate_margin=None, adjudicate_moves=10):
+        '''
+        @param num_envs: Number of games in the batch
+        @param reward_method: either 'heuristic', 'influence' or 'real' (see GoEnv). Rewards are in black's perspective
+        @param seed: None, an int or a SeedSequence. One child stream is spawned per game
+        @param superko: None, 'positional' or 'situational' (see GoEnv)
+        @param history: If set to k, observations are stacked histories (see GoEnv). Ended games repeat their
+        final position
+        @param adjudicate_margin: If set, games end early once the estimated score favours one player by more than this
+        for adjudicate_moves moves in a row, or when both players can only fill their own eyes
+        (see gogame.batch_adjudicate). steps_saved counts the moves this cut off
+        '''
+        assert superko is None or superko in SUPERKO_RULES, superko
+        self.num_envs = num_envs
+        self.size = size
+        self.komi = komi
+        self.reward_method = RewardMethod(reward_method)
+        self.states_ = gogame.batch_init_state(num_envs, size)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.superko = superko
+        self.position_hashes = [set() for _ in range(num_envs)]
+        self._update_superko(np.arange(num_envs))
+        self.history = None if history is None else HistoryBuffer(num_envs, size, history, history_extra)
+        self.adjudicate_margin = adjudicate_margin
+        self.adjudicate_moves = adjudicate_moves
+        self.steps_saved = 0
+        self._reset_adjudication()
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.rngs = gogame.spawn_rngs(seed, self.num_envs)
+        return [seed]
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self.states_ = gogame.batch_init_state(self.num_envs, self.size)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self.position_hashes = [set() for _ in range(self.num_envs)]
+        self._update_superko(np.arange(self.num_envs))
+        self._reset_adjudication()
+        if self.history is not None:
+            self.history.reset(self.states_)
+        return self.observations()
+
+    def reset_to(self, indices, states):
+        '''
+        Restarts the games at indices from the given states (e.g. from a start_states.StartStatePool), the other
+        games go on. Superko only covers the positions from the new states on
+        @param states: (len(indices), NUM_CHNLS, SIZE, SIZE) states
+        return observations of all games
+        '''
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        states = np.asarray(states)
+        assert states.shape == (len(indices), govars.NUM_CHNLS, self.size, self.size), states.shape
+        if len(indices) > 0:
+            self.states_[indices] = states
+            self.dones[indices] = gogame.batch_game_ended(self.states_[indices]) > 0
+            for i in indices:
+                self.position_hashes[i] = set()
+            self._update_superko(indices)
+            self.moves[indices] = 0
+            self.streaks[indices] = 0
+            self.adjudicated[indices] = False
+            self.adjudications[indices] = 0
+            if self.history is not None:
+                self.history.reset(self.states_[indices], indices)
+        return self.observations()
+
+    def step(self, actions):
+        '''
+        Steps every game that has not ended. Actions of ended games are ignored.
+        return observations, rewards, dones, info
+        '''
+        actions = np.asarray(actions)
+        active = np.nonzero(~self.dones)[0]
+        if len(active) > 0:
+            self.states_[active] = gogame.batch_next_states(self.states_[active], actions[active])
+            self.moves[active] += 1
+        self.dones = gogame.batch_game_ended(self.states_) > 0
+        if self.adjudicate_margin is not None:
+            self._adjudicate(active[~self.dones[active]])
+        self._update_superko(active)
+        if self.history is not None:
+            self.history.push(self.states_)
+
+        return self.observations(), self.rewards(), np.copy(self.dones), self.info()
+
+    def observations(self, out=None):
+        """
+        :param out: Optional array to write the stacked history observations into (history mode only)
+        :return: Copy of the states, or the stacked history observations if the envs have a history
+        """
+        if self.history is None:
+            return np.copy(self.states_)
+        return self.history.observation(self.states_, out)
+
+    def _reset_adjudication(self):
+        self.moves = np.zeros(self.num_envs, dtype=np.int64)
+        self.streaks = np.zeros(self.num_envs, dtype=np.int64)
+        self.adjudicated = np.zeros(self.num_envs, dtype=bool)
+        self.adjudications = np.zeros(self.num_envs)
+
+    def _adjudicate(self, idcs):
+        """
+        Ends the given ongoing games whose result is already clear. The moves they would have had left until the usual
+        2 * size ** 2 cut off are added to steps_saved
+        """
+        if len(idcs) == 0:
+            return
+        adjudicated, winners, self.streaks[idcs] = gogame.batch_adjudicate(self.states_[idcs], self.streaks[idcs],
+                                                                           self.adjudicate_margin,
+                                                                           self.adjudicate_moves, self.komi)
+        idcs = idcs[adjudicated]
+        self.states_[idcs, govars.DONE_CHNL] = 1
+        self.dones[idcs] = True
+        self.adjudicated[idcs] = True
+        self.adjudications[idcs] = winners[adjudicated]
+        self.steps_saved += int(np.maximum(2 * self.size ** 2 - self.moves[idcs], 0).sum())
+
+    def _update_superko(self, idcs):
+        """
+        Records the games' current positions and marks the moves that would repeat a recorded one as invalid
+        """
+        if self.superko is None or len(idcs) == 0:
+            return
+        states = self.states_[idcs]
+        position_hashes = hashing.batch_mark_superko(states, [self.position_hashes[i] for i in idcs],
+                                                     self.superko == 'situational')
+        self.states_[idcs] = states
+        for i, position_hash in zip(idcs, position_hashes.tolist()):
+            self.position_hashes[i].add(position_hash)
+
+    def uniform_random_actions(self):
+        """
+        :return: A valid action per game, drawn from each game's own stream
+        """
+        return gogame.batch_random_action(self.states_, rng=self.rngs)
+
+    def valid_moves(self):
+        return gogame.batch_valid_moves(self.states_)
+
+    def turns(self):
+        return gogame.batch_turn(self.states_)
+
+    def info(self):
+        return {
+            'turn': gogame.batch_turn(self.states_),
+            'prev_player_passed': gogame.batch_prev_player_passed(self.states_),
+            'adjudicated': np.copy(self.adjudicated),
+        }
+
+    def rewards(self):
+        if self.reward_method == RewardMethod.REAL:
+            rewards = np.zeros(self.num_envs)
+            if self.dones.any():
+                rewards[self.dones] = gogame.batch_winning(self.states_[self.dones], self.komi)
+
+        elif self.reward_method == RewardMethod.HEURISTIC:
+            black_areas, white_areas = gogame.batch_areas(self.states_)
+            komi_correction = black_areas - white_areas - self.komi
+            ended_rewards = np.where(komi_correction > 0, 1, -1) * self.size ** 2
+            rewards = np.where(self.dones, ended_rewards, komi_correction)
+
+        elif self.reward_method == RewardMethod.INFLUENCE:
+            black_areas, white_areas = gogame.batch_influence_areas(self.states_)
+            rewards = (black_areas - white_areas - self.komi).astype(float)
+            if self.dones.any():
+                black_areas, white_areas = gogame.batch_areas(self.states_[self.dones])
+                komi_correction = black_areas - white_areas - self.komi
+                rewards[self.dones] = np.where(komi_correction > 0, 1, -1) * self.size ** 2
+        else:
+            raise Exception("Unknown Reward Method")
+
+        # Adjudicated games are scored by their adjudicated winner
+        if self.adjudicated.any():
+            winners = self.adjudications[self.adjudicated]
+            if self.reward_method != RewardMethod.REAL:
+                winners = np.where(winners > 0, 1, -1) * self.size ** 2
+            rewards[self.adjudicated] = winners
+        return rewards
+
+    def __len__(self):
+        return self.num_envs
@@ -0,0 +1,140 @@
+"""
+Feature planes for network inputs, computed for a whole batch at once.
+
+A spec is a list of feature names, stacked in order. Stone features are relative to the player to move
+(own, then opponent), so they are the same for a state and its canonical form.
+
+    planes = features.batch_features(batch_states, ['stones', 'liberties', 'atari', 'capture_size'])
+
+Groups are labelled once per call and shared by every feature that needs them. Callers that already have
+them (e.g. from batch_group_data for another spec) can pass them in.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from gym_go import gogame, govars, state_utils
+
+MAX_LIBERTIES = 4
+
+GroupData = namedtuple('GroupData', ['own_labels', 'own_liberties', 'opp_labels', 'opp_liberties', 'empties'])
+
+
+def batch_group_data(batch_states):
+    """
+    Labels of both players' groups and their liberty counts (see state_utils.batch_group_liberties)
+    """
+    idcs = np.arange(len(batch_states))
+    players = gogame.batch_turn(batch_states)
+    empties = 1 - np.sum(batch_states[:, [govars.BLACK, govars.WHITE]], axis=1)
+    own_labels, own_liberties = state_utils.batch_group_liberties(batch_states[idcs, players], empties)
+    opp_labels, opp_liberties = state_utils.batch_group_liberties(batch_states[idcs, 1 - players], empties)
+    return GroupData(own_labels, own_liberties, opp_labels, opp_liberties, empties)
+
+
+def _stone_liberties(groups):
+    return groups.own_liberties[groups.own_labels], groups.opp_liberties[groups.opp_labels]
+
+
+def _stones(batch_states, groups):
+    return np.stack([groups.own_labels > 0, groups.opp_labels > 0], axis=1)
+
+
+def _empty(batch_states, groups):
+    return groups.empties[:, np.newaxis]
+
+
+def _liberties(batch_states, groups):
+    # Own stones with 1, 2, 3 and 4+ liberties, then the opponent's
+    planes = []
+    for stone_liberties in _stone_liberties(groups):
+        for count in range(1, MAX_LIBERTIES):
+            planes.append(stone_liberties == count)
+        planes.append(stone_liberties >= MAX_LIBERTIES)
+    return np.stack(planes, axis=1)
+
+
+def _atari(batch_states, groups):
+    own, opp = _stone_liberties(groups)
+    return np.stack([own == 1, opp == 1], axis=1)
+
+
+def _capture_size(batch_states, groups):
+    """
+    Opponent stones captured by playing on each valid point
+    """
+    sizes = np.bincount(groups.opp_labels.ravel(), minlength=len(groups.opp_liberties))
+    atari_sizes = np.where(groups.opp_liberties == 1, sizes, 0)
+    atari_sizes[0] = 0
+
+    # Count each distinct group in atari next to a point once
+    neighbor_labels = state_utils.shift_neighbors(groups.opp_labels)
+    captured = np.zeros(groups.opp_labels.shape, dtype=np.int64)
+    for d in range(4):
+        distinct = np.all(neighbor_labels[d] != neighbor_labels[:d], axis=0)
+        captured += np.where(distinct, atari_sizes[neighbor_labels[d]], 0)
+    return (captured * (1 - batch_states[:, govars.INVD_CHNL]))[:, np.newaxis]
+
+
+def _invalid(batch_states, groups):
+    return batch_states[:, govars.INVD_CHNL, np.newaxis]
+
+
+def _prev_pass(batch_states, groups):
+    return batch_states[:, govars.PASS_CHNL, np.newaxis]
+
+
+def _turn(batch_states, groups):
+    return batch_states[:, govars.TURN_CHNL, np.newaxis]
+
+
+def _ones(batch_states, groups):
+    return np.ones((len(batch_states), 1, *batch_states.shape[2:]))
+
+
+# name: (number of planes, function from (batch_states, groups) to (BATCH_SIZE, planes, SIZE, SIZE))
+FEATURES = {
+    'stones': (2, _stones),
+    'empty': (1, _empty),
+    'liberties': (2 * MAX_LIBERTIES, _liberties),
+    'atari': (2, _atari),
+    'capture_size': (1, _capture_size),
+    'invalid': (1, _invalid),
+    'prev_pass': (1, _prev_pass),
+    'turn': (1, _turn),
+    'ones': (1, _ones),
+}
+
+DEFAULT_SPEC = ['stones', 'empty', 'liberties', 'atari', 'capture_size', 'invalid', 'turn']
+
+
+def num_planes(spec=DEFAULT_SPEC):
+    return sum(FEATURES[name][0] for name in spec)
+
+
+def batch_features(batch_states, spec=DEFAULT_SPEC, groups=None, out=None, dtype=np.float32):
+    """
+    :param batch_states: (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE)
+    :param spec: Feature names, see FEATURES
+    :param groups: Optional precomputed batch_group_data(batch_states)
+    :param out: Optional (BATCH_SIZE, num_planes(spec), SIZE, SIZE) array to write into
+    :return: (BATCH_SIZE, num_planes(spec), SIZE, SIZE) feature planes
+    """
+    unknown = [name for name in spec if name not in FEATURES]
+    if unknown:
+        raise ValueError('Unknown features {}'.format(unknown))
+    if out is None:
+        out = np.empty((len(batch_states), num_planes(spec), *batch_states.shape[2:]), dtype=dtype)
+    if groups is None and any(name not in ('invalid', 'prev_pass', 'turn', 'ones') for name in spec):
+        groups = batch_group_data(batch_states)
+
+    offset = 0
+    for name in spec:
+        planes, fn = FEATURES[name]
+        out[:, offset:offset + planes] = fn(batch_states, groups)
+        offset += planes
+    return out
+
+
+def features(state, spec=DEFAULT_SPEC):
+    return batch_features(state[np.newaxis], spec)[0]
@@ -1,8 +1,8 @@
 import numpy as np
 from scipy import ndimage
-from sklearn import preprocessing
 
 from gym_go import state_utils, govars
+from gym_go.profiling import instrumented
 
 """
 The state of the game is a numpy array
@@ -19,6 +19,31 @@ The state of the game is a numpy array
 """
 
 
+def make_rng(seed=None):
+    """
+    :param seed: None, an int, a SeedSequence or an existing Generator (returned as is)
+    :return: A numpy Generator backed by PCG64
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.Generator(np.random.PCG64(seed))
+
+
+def spawn_rngs(seed, n):
+    """
+    Independent, reproducible generator streams for parallel environments or workers
+    :param seed: None, an int or a SeedSequence to spawn from
+    :param n: Number of streams
+    :return: List of n Generators
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [make_rng(child) for child in seed.spawn(n)]
+
+
+_default_rng = make_rng()
+
+
 def init_state(size):
     # return initial board (numpy board)
     state = np.zeros((govars.NUM_CHNLS, size, size))
@@ -31,7 +56,13 @@ def batch_init_state(batch_size, board_size):
     return batch_state
 
 
-def next_state(state, action1d, canonical=False):
+@instrumented('next_state', 'boards')
+def next_state(state, action1d, canonical=False, history=None, include_turn=False):
+    """
+    :param history: Optional set of the game's position hashes, to also mark the moves that break superko as invalid
+    (see hashing.batch_mark_superko). Without it only simple ko is checked
+    :param include_turn: Situational instead of positional superko for history
+    """
     # Deep copy the state to modify
     state = np.copy(state)
 
@@ -80,6 +111,11 @@ def next_state(state, action1d, canonical=False):
     # Switch turn
     state_utils.set_turn(state)
 
+    if history is not None:
+        from gym_go import hashing  # hashing depends on this module
+
+        hashing.batch_mark_superko(state[np.newaxis], [history], include_turn)
+
     if canonical:
         # Set canonical form
         state = canonical_form(state)
@@ -87,7 +123,13 @@ def next_state(state, action1d, canonical=False):
     return state
 
 
-def batch_next_states(batch_states, batch_action1d, canonical=False):
+@instrumented('batch_next_states', 'batch_boards')
+def batch_next_states(batch_states, batch_action1d, canonical=False, histories=None, include_turn=False):
+    """
+    :param histories: Optional per state set of the game's position hashes (or None), to also mark the moves that
+    break superko as invalid (see hashing.batch_mark_superko). Without them only simple ko is checked
+    :param include_turn: Situational instead of positional superko for histories
+    """
     # Deep copy the state to modify
     batch_states = np.copy(batch_states)
 
@@ -143,6 +185,11 @@ def batch_next_states(batch_states, batch_action1d, canonical=False):
     # Switch turn
     state_utils.batch_set_turn(batch_states)
 
+    if histories is not None:
+        from gym_go import hashing  # hashing depends on this module
+
+        hashing.batch_mark_superko(batch_states, histories, include_turn)
+
     if canonical:
         # Set canonical form
         batch_states = batch_canonical_form(batch_states)
@@ -172,6 +219,87 @@ def batch_valid_moves(batch_state):
     return 1 - batch_invalid_moves(batch_state)
 
 
+def batch_is_legal(batch_states, batch_actions, histories=None, include_turn=False):
+    """
+    Checks candidate moves without playing them. Legality comes from the invalid move planes, only the invalid
+    candidates on empty points are examined to tell suicide from ko (or superko, if the planes include it).
+    Ko shaped repetitions count as ko.
+    :param batch_actions: (BATCH_SIZE,) or (BATCH_SIZE, K) 1D actions per state
+    :param histories: Optional per state set of the game's position hashes (or None), to also check superko where
+    the invalid move planes don't include it (see hashing.batch_superko_invalid_moves)
+    :param include_turn: Situational instead of positional superko for histories
+    :return: bool legality and int8 reasons (govars.LEGAL, OCCUPIED, SUICIDE, KO, SUPERKO or GAME_OVER),
+    both shaped like batch_actions
+    """
+    n, size = len(batch_states), batch_states.shape[-1]
+    shape = np.shape(batch_actions)
+    actions = np.asarray(batch_actions, dtype=np.int64).reshape(n, -1)
+    assert ((actions >= 0) & (actions <= size ** 2)).all(), 'Actions are off the board'
+
+    passes = actions == size ** 2
+    points = np.minimum(actions, size ** 2 - 1)
+    idcs = np.arange(n)[:, np.newaxis]
+    rows, cols = points // size, points % size
+    occupied = (batch_states[idcs, govars.BLACK, rows, cols] + batch_states[idcs, govars.WHITE, rows, cols] > 0)
+    occupied &= ~passes
+    invalid = (batch_states[idcs, govars.INVD_CHNL, rows, cols] > 0) & ~passes
+
+    reasons = np.zeros(actions.shape, dtype=np.int8)
+    reasons[occupied] = govars.OCCUPIED
+    check = invalid & ~occupied
+    if check.any():
+        reasons[check] = _invalid_reasons(batch_states, np.nonzero(check)[0], rows[check], cols[check])
+
+    if histories is not None:
+        from gym_go import hashing  # hashing depends on this module
+
+        check = np.array([history is not None for history in histories])[:, np.newaxis] & (reasons == 0) & ~passes
+        boards = np.unique(np.nonzero(check)[0])
+        if len(boards) > 0:
+            next_hashes = hashing.batch_next_hashes(batch_states[boards], include_turn)
+            for board, hashes in zip(boards, next_hashes):
+                candidates = np.flatnonzero(check[board])
+                repeats = [h in histories[board] for h in hashes[points[board, candidates]].tolist()]
+                reasons[board, candidates[repeats]] = govars.SUPERKO
+
+    reasons[batch_game_ended(batch_states) > 0] = govars.GAME_OVER
+    reasons = reasons.reshape(shape)
+    return reasons == govars.LEGAL, reasons
+
+
+def _invalid_reasons(batch_states, boards, rows, cols):
+    """
+    Exact check of invalid moves on empty points
+    :return: SUICIDE, KO or SUPERKO per move
+    """
+    unique_boards, boards = np.unique(boards, return_inverse=True)
+    states = batch_states[unique_boards]
+    idcs = np.arange(len(states))
+    players = batch_turn(states)
+    own, opp = states[idcs, players], states[idcs, 1 - players]
+    empties = 1 - own - opp
+    own_labels, own_liberties = state_utils.batch_group_liberties(own, empties)
+    opp_labels, opp_liberties = state_utils.batch_group_liberties(opp, empties)
+    opp_sizes = np.bincount(opp_labels.ravel(), minlength=len(opp_liberties))
+
+    # (4, MOVES) neighbors of every move
+    own_neighbors = state_utils.shift_neighbors(own_labels)[:, boards, rows, cols]
+    opp_neighbors = state_utils.shift_neighbors(opp_labels)[:, boards, rows, cols]
+    empty_neighbors = (state_utils.shift_neighbors(empties)[:, boards, rows, cols] > 0).any(axis=0)
+
+    captures = (opp_neighbors > 0) & (opp_liberties[opp_neighbors] == 1)
+    # A captured group counts once, even if it touches the point from several sides
+    first = np.copy(captures)
+    for i in range(1, 4):
+        first[i] &= np.all(opp_neighbors[i] != opp_neighbors[:i], axis=0)
+    captured_stones = np.sum(first * opp_sizes[opp_neighbors], axis=0)
+    connects = ((own_neighbors > 0) & (own_liberties[own_neighbors] > 1)).any(axis=0)
+
+    suicide = ~(empty_neighbors | captures.any(axis=0) | connects)
+    ko = (captured_stones == 1) & ~empty_neighbors & ~(own_neighbors > 0).any(axis=0)
+    return np.where(suicide, govars.SUICIDE, np.where(ko, govars.KO, govars.SUPERKO))
+
+
 def children(state, canonical=False, padded=True):
     valid_moves_bool = valid_moves(state)
     n = len(valid_moves_bool)
@@ -280,7 +408,7 @@ def areas(state):
     all_pieces = np.sum(state[[govars.BLACK, govars.WHITE]], axis=0)
     empties = 1 - all_pieces
 
-    empty_labels, num_empty_areas = ndimage.measurements.label(empties)
+    empty_labels, num_empty_areas = state_utils.label_groups(empties)
 
     black_area, white_area = np.sum(state[govars.BLACK]), np.sum(state[govars.WHITE])
     for label in range(1, num_empty_areas + 1):
@@ -301,15 +429,95 @@ def areas(state):
 
 
 def batch_areas(batch_state):
-    black_areas, white_areas = [], []
+    """
+    Same as areas, with the empty regions of the whole batch labelled at once
+    """
+    blacks, whites = batch_state[:, govars.BLACK], batch_state[:, govars.WHITE]
+    empties = 1 - blacks - whites
+    empty_labels, num_empty_areas = state_utils.label_groups(empties, state_utils.group_struct)
+
+    # Which colours touch every empty region
+    regions = empty_labels.ravel()
+    black_claims = np.bincount(regions, (state_utils.shift_neighbors(blacks).max(axis=0) > 0).ravel(),
+                               minlength=num_empty_areas + 1) > 0
+    white_claims = np.bincount(regions, (state_utils.shift_neighbors(whites).max(axis=0) > 0).ravel(),
+                               minlength=num_empty_areas + 1) > 0
+    region_owners = np.where(black_claims & ~white_claims, govars.BLACK, -1)
+    region_owners[white_claims & ~black_claims] = govars.WHITE
+    region_owners[0] = -1
+    point_owners = region_owners[empty_labels]
+
+    black_areas = np.sum(blacks, axis=(1, 2)) + np.sum(point_owners == govars.BLACK, axis=(1, 2))
+    white_areas = np.sum(whites, axis=(1, 2)) + np.sum(point_owners == govars.WHITE, axis=(1, 2))
+    return black_areas, white_areas
+
+
+def ownership(state, dilations=5, erosions=21):
+    return batch_ownership(state[np.newaxis], dilations, erosions)[0]
+
+
+def batch_ownership(batch_state, dilations=5, erosions=21):
+    """
+    Estimated owner of every point from Bouzy's influence map (see state_utils.batch_influence).
+    Unlike areas, it already gives territory in the opening, where regions are still touched by both colours
+    :return: (BATCH_SIZE, SIZE, SIZE) float32, 1 for black, -1 for white and 0 for neither
+    """
+    influence = state_utils.batch_influence(batch_state[:, govars.BLACK], batch_state[:, govars.WHITE], dilations,
+                                            erosions)
+    return np.sign(influence).astype(np.float32)
+
+
+def influence_areas(state):
+    '''
+    Return black area, white area as estimated by ownership
+    '''
+    black_areas, white_areas = batch_influence_areas(state[np.newaxis])
+    return black_areas[0], white_areas[0]
 
-    for state in batch_state:
-        ba, wa = areas(state)
-        black_areas.append(ba)
-        white_areas.append(wa)
-    return np.array(black_areas), np.array(white_areas)
 
+def batch_influence_areas(batch_state):
+    owners = batch_ownership(batch_state)
+    return np.sum(owners > 0, axis=(1, 2)), np.sum(owners < 0, axis=(1, 2))
 
+
+def batch_only_eye_moves(batch_state):
+    """
+    :return: (BATCH_SIZE,) bool, whether every empty point is a single point eye and no group is in atari.
+    Moves into the opponent's eyes are then suicide, so both players can only fill their own eyes
+    """
+    blacks, whites = batch_state[:, govars.BLACK], batch_state[:, govars.WHITE]
+    empties = 1 - blacks - whites
+    eyes = state_utils.batch_single_point_eyes(blacks, empties) | state_utils.batch_single_point_eyes(whites, empties)
+    only_eyes = np.all(eyes == (empties > 0), axis=(1, 2))
+    for pieces in (blacks, whites):
+        labels, liberties = state_utils.batch_group_liberties(pieces, empties)
+        only_eyes &= ~np.any((labels > 0) & (liberties[labels] == 1), axis=(1, 2))
+    return only_eyes
+
+
+def batch_adjudicate(batch_state, streaks, margin, moves, komi=0):
+    """
+    Decides games whose result is already clear. Either the estimated score (see influence_areas) has favoured the
+    same player by more than margin for the last moves moves, or both players can only fill their own eyes
+    (see batch_only_eye_moves), in which case the real area decides
+    :param streaks: (BATCH_SIZE,) int, consecutive moves with a margin lead before this one, positive for black
+    and negative for white. Start from zeros
+    :return: adjudicated (BATCH_SIZE,) bool, winners in black's perspective (1, 0 or -1), updated streaks
+    """
+    black_areas, white_areas = batch_influence_areas(batch_state)
+    leads = black_areas - white_areas - komi
+    signs = np.where(np.abs(leads) > margin, np.sign(leads), 0).astype(np.int64)
+    streaks = np.where((signs != 0) & (np.sign(streaks) == signs), streaks + signs, signs)
+
+    by_margin = np.abs(streaks) >= moves
+    by_eyes = batch_only_eye_moves(batch_state)
+    winners = np.where(by_margin, np.sign(streaks), 0)
+    if by_eyes.any():
+        winners[by_eyes] = batch_winning(batch_state[by_eyes], komi)
+    return by_margin | by_eyes, winners, streaks
+
+
+@instrumented('canonical')
 def canonical_form(state):
     state = np.copy(state)
     if turn(state) == govars.WHITE:
@@ -321,6 +529,7 @@ def canonical_form(state):
     return state
 
 
+@instrumented('canonical')
 def batch_canonical_form(batch_state):
     batch_state = np.copy(batch_state)
     batch_player = batch_turn(batch_state)
@@ -337,13 +546,15 @@ def batch_canonical_form(batch_state):
     return batch_state
 
 
-def random_symmetry(image):
+def random_symmetry(image, rng=None):
     """
     Returns a random symmetry of the image
     :param image: A (C, BOARD_SIZE, BOARD_SIZE) numpy array, where C is any number
+    :param rng: numpy Generator, defaults to a module level generator
     :return:
     """
-    orientation = np.random.randint(0, 8)
+    rng = _default_rng if rng is None else rng
+    orientation = rng.integers(0, 8)
 
     if (orientation >> 0) % 2:
         # Horizontal flip
@@ -382,26 +593,116 @@ def all_symmetries(image):
     return symmetries
 
 
-def random_weighted_action(move_weights):
+def batch_symmetries(batch_images, orientations):
+    """
+    Vectorized symmetries of a batch, with the same orientation numbering as all_symmetries
+    :param batch_images: A (BATCH_SIZE, C, BOARD_SIZE, BOARD_SIZE) numpy array, where C is any number
+    :param orientations: (BATCH_SIZE,) orientations in [0, 8)
+    :return: The batch with each image in its orientation
+    """
+    orientations = np.asarray(orientations)
+    out = np.empty_like(batch_images)
+    for i in np.unique(orientations):
+        idcs = np.nonzero(orientations == i)[0]
+        x = batch_images[idcs]
+        if (i >> 0) % 2:
+            # Horizontal flip
+            x = np.flip(x, 3)
+        if (i >> 1) % 2:
+            # Vertical flip
+            x = np.flip(x, 2)
+        if (i >> 2) % 2:
+            # Rotation 90 degrees
+            x = np.rot90(x, axes=(2, 3))
+        out[idcs] = x
+    return out
+
+
+def batch_policy_symmetries(batch_policies, orientations):
+    """
+    Applies batch_symmetries to 1D move vectors, leaving the pass move in place
+    :param batch_policies: (BATCH_SIZE, NUM OF MOVES)
+    """
+    n = len(batch_policies)
+    board_size = int(np.sqrt(batch_policies.shape[1] - 1))
+    boards = batch_policies[:, :-1].reshape(n, 1, board_size, board_size)
+    out = np.empty_like(batch_policies)
+    out[:, :-1] = batch_symmetries(boards, orientations).reshape(n, -1)
+    out[:, -1] = batch_policies[:, -1]
+    return out
+
+
+def random_weighted_action(move_weights, rng=None):
     """
     Assumes all invalid moves have weight 0
     Action is 1D
     Expected shape is (NUM OF MOVES, )
     """
-    move_weights = preprocessing.normalize(move_weights[np.newaxis], norm='l1')
-    return np.random.choice(np.arange(len(move_weights[0])), p=move_weights[0])
+    cdf = np.cumsum(move_weights)
+    return _sample_cdf(cdf[np.newaxis], rng)[0]
 
 
-def random_action(state):
+def random_action(state, rng=None):
     """
     Assumed to be (NUM_CHNLS, BOARD_SIZE, BOARD_SIZE)
     Action is 1D
     """
-    invalid_moves = state[govars.INVD_CHNL].flatten()
-    invalid_moves = np.append(invalid_moves, 0)
-    move_weights = 1 - invalid_moves
+    return batch_random_action(state[np.newaxis], rng=rng)[0]
+
+
+def batch_random_action(batch_states, weights=None, temperature=1, dirichlet_alpha=None, dirichlet_frac=0.25,
+                        rng=None):
+    """
+    Samples a valid action for every state in the batch in one vectorized pass
+    :param batch_states: A (BATCH_SIZE, NUM_CHNLS, BOARD_SIZE, BOARD_SIZE) numpy array
+    :param weights: Optional (BATCH_SIZE, NUM OF MOVES) non-negative move weights. Invalid moves are masked out.
+    Rows with no weight on any valid move fall back to uniform over the valid moves. Defaults to uniform.
+    :param temperature: Weights are raised to the power of 1 / temperature. 0 picks the highest weighted move
+    :param dirichlet_alpha: If set, Dirichlet(alpha) noise over the valid moves is mixed into the distribution
+    :param dirichlet_frac: Fraction of the Dirichlet noise in the mixed distribution
+    :param rng: numpy Generator, or a sequence with one Generator per state for per-environment streams.
+    Defaults to a module level generator
+    :return: (BATCH_SIZE,) array of 1D actions
+    """
+    rng = _default_rng if rng is None else rng
+    valid = batch_valid_moves(batch_states)
+    if weights is None:
+        probs = valid
+    else:
+        probs = np.asarray(weights, dtype=np.float64) * valid
+        empty_rows = np.sum(probs, axis=1) <= 0
+        probs[empty_rows] = valid[empty_rows]
+
+    if temperature == 0:
+        return np.argmax(probs, axis=1)
+    if temperature != 1:
+        probs = probs ** (1 / temperature)
+    probs = probs / np.sum(probs, axis=1, keepdims=True)
+
+    if dirichlet_alpha is not None:
+        if isinstance(rng, (list, tuple)):
+            noise = np.stack([r.gamma(dirichlet_alpha, size=probs.shape[1]) for r in rng])
+        else:
+            noise = rng.gamma(dirichlet_alpha, size=probs.shape)
+        noise *= valid
+        noise /= np.sum(noise, axis=1, keepdims=True)
+        probs = (1 - dirichlet_frac) * probs + dirichlet_frac * noise
+
+    return _sample_cdf(np.cumsum(probs, axis=1), rng)
 
-    return random_weighted_action(move_weights)
+
+def _sample_cdf(batch_cdf, rng=None):
+    """
+    Inverse transform sampling over the last axis of un-normalized cumulative weights
+    """
+    rng = _default_rng if rng is None else rng
+    if isinstance(rng, (list, tuple)):
+        thresholds = np.array([r.random() for r in rng])
+    else:
+        thresholds = rng.random(len(batch_cdf))
+    thresholds *= batch_cdf[:, -1]
+    batch_actions = np.count_nonzero(batch_cdf <= thresholds[:, np.newaxis], axis=1)
+    return np.minimum(batch_actions, batch_cdf.shape[1] - 1)
 
 
 def str(state):
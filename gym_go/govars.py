@@ -9,3 +9,11 @@ PASS_CHNL = 4
 DONE_CHNL = 5
 
 NUM_CHNLS = 6
+
+# Reasons of gogame.batch_is_legal
+LEGAL = 0
+OCCUPIED = 1
+SUICIDE = 2
+KO = 3
+SUPERKO = 4
+GAME_OVER = 5
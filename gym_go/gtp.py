@@ -0,0 +1,320 @@
+"""
+GTP (Go Text Protocol) front end over GoEnv and search.MCTS, e.g. to play against GnuGo through a local pipe:
+
+    gogui-twogtp -size 9 -komi 7.5 -black 'python -m gym_go.gtp --size 9 --komi 7.5' -white 'gnugo --mode gtp'
+
+The search tree is kept between moves and the engine ponders on the opponent's time in a background thread.
+Every genmove's latency is written to the log (stderr by default) and kept in GtpEngine.latencies.
+"""
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.envs.go_env import GoEnv
+from gym_go.search import MCTS
+from gym_go.sgf import format_result
+
+COLUMNS = 'ABCDEFGHJKLMNOPQRSTUVWXYZ'
+
+COMMANDS = ['protocol_version', 'name', 'version', 'known_command', 'list_commands', 'quit', 'boardsize',
+            'clear_board', 'komi', 'play', 'genmove', 'undo', 'final_score', 'showboard']
+
+
+class GtpError(Exception):
+    pass
+
+
+def vertex_to_action(vertex, size):
+    """
+    :param vertex: GTP vertex e.g. 'D4' (column letter without I, row 1 at the bottom) or 'pass'
+    :return: 1D action
+    """
+    vertex = vertex.upper()
+    if vertex == 'PASS':
+        return size ** 2
+    if len(vertex) < 2 or vertex[0] not in COLUMNS[:size] or not vertex[1:].isdigit():
+        raise GtpError('invalid vertex')
+    row, col = size - int(vertex[1:]), COLUMNS.index(vertex[0])
+    if not 0 <= row < size:
+        raise GtpError('invalid vertex')
+    return row * size + col
+
+
+def action_to_vertex(action, size):
+    if action == size ** 2:
+        return 'pass'
+    return '{}{}'.format(COLUMNS[action % size], size - action // size)
+
+
+def parse_color(color):
+    color = color.lower()
+    if color in ('b', 'black'):
+        return govars.BLACK
+    if color in ('w', 'white'):
+        return govars.WHITE
+    raise GtpError('invalid color')
+
+
+class GtpEngine:
+    """
+    Plays one game at a time. Moves are applied to a GoEnv, which is replayed from its move list on undo.
+    A move by the player that is not to move is preceded by a pass, as in sgf.
+    """
+
+    def __init__(self, size=9, komi=7.5, simulations=256, time_ms=None, leaves_per_root=8, ponder=True,
+                 ponder_limit=100000, superko=None, seed=None, log=sys.stderr, name='gym_go'):
+        '''
+        @param simulations, time_ms, leaves_per_root: Budget of every genmove's search, see search.MCTS.
+        Visits of the root from pondering and earlier searches count towards the simulations
+        @param ponder: Whether to keep searching the current position while waiting for the next command
+        @param ponder_limit: Pondering stops once the root has this many visits
+        @param superko: None, 'positional' or 'situational' (see GoEnv), for the game and the search tree
+        @param log: File the genmove latencies are written to, None to only keep them in latencies
+        '''
+        self.mcts = MCTS(simulations, time_ms, leaves_per_root, komi=komi, superko=superko, seed=seed)
+        self.ponder = ponder
+        self.ponder_limit = ponder_limit
+        self.superko = superko
+        self.log = log
+        self.name = name
+        self.latencies = []
+        self.quit = False
+        self._ponder_thread = None
+        self._stop_ponder = threading.Event()
+        self._new_game(size, komi)
+
+    def _new_game(self, size, komi):
+        self.env = GoEnv(size, komi=komi, superko=self.superko)
+        self.mcts.komi = komi
+        self.moves = []
+        # Number of moves before every play and genmove, for undo
+        self.undo_points = []
+        self.root = None
+
+    @property
+    def size(self):
+        return self.env.size
+
+    def _play(self, action):
+        """
+        Applies a move and moves the root of the tree to its child, keeping that subtree
+        """
+        if self.env.game_ended():
+            raise GtpError('game is over')
+        if not self.env.valid_moves()[action]:
+            raise GtpError('illegal move')
+        self.env.step(action)
+        self.moves.append(action)
+        if self.root is not None and action in self.root.children:
+            self.root = self.root.children[action]
+        else:
+            self.root = None
+
+    def _play_color(self, player, action):
+        moves = len(self.moves)
+        try:
+            if self.env.turn() != player:
+                self._play(self.size ** 2)
+            self._play(action)
+        except GtpError:
+            # Take back the inserted pass
+            if len(self.moves) > moves:
+                self._replay(self.moves[:moves])
+            raise
+        self.undo_points.append(moves)
+
+    def _replay(self, moves):
+        """
+        Starts the game over from the moves. The tree is discarded
+        """
+        undo_points = self.undo_points
+        self._new_game(self.size, self.env.komi)
+        self.undo_points = undo_points
+        for action in moves:
+            self._play(action)
+
+    def _sync_root(self):
+        """
+        :return: The root for the current position. The env's invalid moves (e.g. superko) override the tree's
+        """
+        if self.root is None:
+            self.root = self.mcts.new_root(self.env.state(), self.env.position_hashes)
+            return self.root
+        root = self.root
+        valid = self.env.valid_moves()
+        root.state = self.env.state()
+        for action in np.flatnonzero(valid == 0):
+            root.children.pop(int(action), None)
+            root.visits[action] = 0
+            root.values[action] = 0
+        root.untried = [action for action in root.untried if valid[action]]
+        return root
+
+    def genmove(self, player):
+        """
+        Searches the current position (reusing the tree) and plays the best move for player
+        :return: 1D action
+        """
+        start = time.perf_counter()
+        moves = len(self.moves)
+        if self.env.turn() != player:
+            self._play(self.size ** 2)
+        if self.env.game_ended():
+            self._replay(self.moves[:moves])
+            raise GtpError('game is over')
+        root = self._sync_root()
+        reused = int(root.num_visits())
+        simulations = self.mcts.simulations
+        self.mcts.run([root], None if simulations is None else max(simulations - reused, 0))
+        action = root.best_action()
+        self._play(action)
+        self.undo_points.append(moves)
+
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        if self.log is not None:
+            print('genmove {}: {} in {:.1f} ms, {} visits ({} reused)'.format(
+                len(self.moves), action_to_vertex(action, self.size), latency * 1e3, int(root.num_visits()),
+                reused), file=self.log, flush=True)
+        return action
+
+    def final_score(self):
+        black_area, white_area = gogame.areas(self.env.state_)
+        margin = black_area - white_area - self.env.komi
+        return format_result(np.sign(margin), margin)
+
+    def start_pondering(self):
+        """
+        Searches the current position in a background thread until stop_pondering
+        """
+        if not self.ponder or self.env.game_ended() or self._ponder_thread is not None:
+            return
+        root = self._sync_root()
+        self._stop_ponder.clear()
+        self._ponder_thread = threading.Thread(target=self._ponder, args=(root,), daemon=True)
+        self._ponder_thread.start()
+
+    def _ponder(self, root):
+        while not self._stop_ponder.is_set() and root.num_visits() < self.ponder_limit:
+            before = root.num_visits()
+            self.mcts.run([root], simulations=self.mcts.leaves_per_root)
+            if root.num_visits() == before:
+                break
+
+    def stop_pondering(self):
+        if self._ponder_thread is not None:
+            self._stop_ponder.set()
+            self._ponder_thread.join()
+            self._ponder_thread = None
+
+    def handle(self, line):
+        """
+        :param line: One GTP command, optionally preceded by a numeric id
+        :return: The response, or None for an empty line
+        """
+        line = line.split('#')[0].strip()
+        if not line:
+            return None
+        words = line.split()
+        command_id = ''
+        if words[0].isdigit():
+            command_id = words.pop(0)
+        if not words:
+            return None
+        self.stop_pondering()
+        try:
+            result = self._execute(words[0].lower(), words[1:])
+            response = '={} {}'.format(command_id, result).rstrip()
+        except GtpError as e:
+            response = '?{} {}'.format(command_id, e)
+        except (IndexError, ValueError):
+            response = '?{} syntax error'.format(command_id)
+        return response + '\n\n'
+
+    def _execute(self, command, args):
+        if command == 'protocol_version':
+            return '2'
+        if command == 'name':
+            return self.name
+        if command == 'version':
+            return ''
+        if command == 'known_command':
+            return 'true' if args[0] in COMMANDS else 'false'
+        if command == 'list_commands':
+            return '\n'.join(COMMANDS)
+        if command == 'quit':
+            self.quit = True
+            return ''
+        if command == 'boardsize':
+            size = int(args[0])
+            if not 1 < size <= len(COLUMNS):
+                raise GtpError('unacceptable size')
+            self._new_game(size, self.env.komi)
+            return ''
+        if command == 'clear_board':
+            self._new_game(self.size, self.env.komi)
+            return ''
+        if command == 'komi':
+            komi = float(args[0])
+            self.env.komi = komi
+            self.mcts.komi = komi
+            # Values in the tree were scored with the old komi
+            self.root = None
+            return ''
+        if command == 'play':
+            self._play_color(parse_color(args[0]), vertex_to_action(args[1], self.size))
+            return ''
+        if command == 'genmove':
+            return action_to_vertex(self.genmove(parse_color(args[0])), self.size)
+        if command == 'undo':
+            if not self.undo_points:
+                raise GtpError('cannot undo')
+            self._replay(self.moves[:self.undo_points.pop()])
+            return ''
+        if command == 'final_score':
+            return self.final_score()
+        if command == 'showboard':
+            return '\n' + gogame.str(self.env.state_)
+        raise GtpError('unknown command')
+
+    def run(self, stdin=sys.stdin, stdout=sys.stdout):
+        """
+        Answers commands until quit or the end of the input, pondering between them
+        """
+        try:
+            for line in stdin:
+                response = self.handle(line)
+                if response is None:
+                    continue
+                stdout.write(response)
+                stdout.flush()
+                if self.quit:
+                    break
+                self.start_pondering()
+        finally:
+            self.stop_pondering()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='GTP engine with MCTS over gym_go')
+    parser.add_argument('--size', type=int, default=9)
+    parser.add_argument('--komi', type=float, default=7.5)
+    parser.add_argument('--simulations', type=int, default=256, help='Playouts per genmove')
+    parser.add_argument('--time-ms', type=float, default=None, help='Time budget per genmove in milliseconds')
+    parser.add_argument('--leaves-per-root', type=int, default=8)
+    parser.add_argument('--no-ponder', action='store_true', help="Don't search on the opponent's time")
+    parser.add_argument('--superko', default=None, choices=['positional', 'situational'])
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    engine = GtpEngine(args.size, args.komi, args.simulations, args.time_ms, args.leaves_per_root,
+                       ponder=not args.no_ponder, superko=args.superko, seed=args.seed)
+    engine.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Zobrist hashing of positions, in all 8 dihedral orientations at once.
+
+hashes(state)[k] is the hash of all_symmetries(state)[k], so the minimum over the 8 is the same for every
+rotation/reflection of a position, and its argmin picks a canonical orientation.
+The keys are fixed per board size, so hashes are stable across processes and runs.
+"""
+import functools
+
+import numpy as np
+
+from gym_go import gogame, govars, state_utils
+
+ZOBRIST_SEED = 0x60676F
+
+
+@functools.lru_cache(maxsize=None)
+def symmetry_permutations(board_size):
+    """
+    :return: (8, board_size ** 2) perms and inverse perms of 1D locations with
+    all_symmetries(s)[k].flatten()[q] == s.flatten()[perms[k, q]], i.e. location p moves to inverse_perms[k, p]
+    """
+    locations = np.arange(board_size ** 2).reshape(1, board_size, board_size)
+    perms = np.array([sym.flatten() for sym in gogame.all_symmetries(locations)])
+    inverse_perms = np.argsort(perms, axis=1)
+    return perms, inverse_perms
+
+
+def batch_transform_actions(batch_actions, orientations, board_size):
+    """
+    :return: The 1D actions after transforming their boards with all_symmetries' orientations. Passes are unchanged
+    """
+    _, inverse_perms = symmetry_permutations(board_size)
+    batch_actions = np.asarray(batch_actions)
+    orientations = np.broadcast_to(orientations, batch_actions.shape)
+    passes = batch_actions == board_size ** 2
+    transformed = inverse_perms[orientations, np.where(passes, 0, batch_actions)]
+    return np.where(passes, batch_actions, transformed)
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist_tables(board_size):
+    """
+    :return: (8, 2 * board_size ** 2) uint64 keys per orientation for black then white stones on every 1D location,
+    and the key for white to move
+    """
+    rng = np.random.Generator(np.random.PCG64([ZOBRIST_SEED, board_size]))
+    max_key = np.iinfo(np.uint64).max
+    keys = rng.integers(0, max_key, size=(2, board_size ** 2), dtype=np.uint64, endpoint=True)
+    turn_key = rng.integers(0, max_key, dtype=np.uint64, endpoint=True)
+
+    # The stone on p lands on the q with perms[k, q] = p
+    perms, _ = symmetry_permutations(board_size)
+    tables = np.empty((8, 2, board_size ** 2), dtype=np.uint64)
+    for k in range(8):
+        tables[k][:, perms[k]] = keys
+    tables.setflags(write=False)
+    return tables.reshape(8, -1), turn_key
+
+
+def batch_hashes(batch_states, include_turn=True):
+    """
+    :param include_turn: Whether the player to move is part of the hash
+    :return: (BATCH_SIZE, 8) uint64 hashes of each state in every orientation
+    """
+    n = len(batch_states)
+    board_size = batch_states.shape[-1]
+    tables, turn_key = zobrist_tables(board_size)
+    stones = batch_states[:, [govars.BLACK, govars.WHITE]].reshape(n, -1) > 0
+
+    hashes = np.empty((n, 8), dtype=np.uint64)
+    for k in range(8):
+        hashes[:, k] = np.bitwise_xor.reduce(np.where(stones, tables[k], np.uint64(0)), axis=1)
+    if include_turn:
+        white_to_move = gogame.batch_turn(batch_states) == govars.WHITE
+        hashes[white_to_move] ^= turn_key
+    return hashes
+
+
+def hashes(state, include_turn=True):
+    """
+    :return: (8,) uint64 hashes of the state in every orientation
+    """
+    tables, turn_key = zobrist_tables(state.shape[-1])
+    locations = np.flatnonzero(state[[govars.BLACK, govars.WHITE]] > 0)
+    state_hashes = np.bitwise_xor.reduce(tables[:, locations], axis=1)
+    if include_turn and gogame.turn(state) == govars.WHITE:
+        state_hashes ^= turn_key
+    return state_hashes
+
+
+def position_hash(state, include_turn=True):
+    """
+    :return: The hash of the state as is (orientation 0)
+    """
+    return hashes(state, include_turn)[0]
+
+
+def batch_position_hashes(batch_states, include_turn=True):
+    """
+    :return: (BATCH_SIZE,) uint64 hashes of the states as they are (orientation 0), cheaper than batch_hashes
+    """
+    n = len(batch_states)
+    tables, turn_key = zobrist_tables(batch_states.shape[-1])
+    stones = batch_states[:, [govars.BLACK, govars.WHITE]].reshape(n, tables.shape[1]) > 0
+    position_hashes = np.bitwise_xor.reduce(np.where(stones, tables[0], np.uint64(0)), axis=1)
+    if include_turn:
+        position_hashes[gogame.batch_turn(batch_states) == govars.WHITE] ^= turn_key
+    return position_hashes
+
+
+def batch_next_hashes(batch_states, include_turn=True, position_hashes=None):
+    """
+    Hashes (orientation 0) of the positions after the player to move plays on every point, captures included,
+    without playing any of the moves: the hash of the stone is added and every opponent group next to the point
+    that is left in atari is removed. Only meaningful for points that are otherwise valid moves.
+    :param position_hashes: Optional precomputed batch_position_hashes of the states
+    :return: (BATCH_SIZE, SIZE ** 2) uint64 hashes
+    """
+    n = len(batch_states)
+    tables, turn_key = zobrist_tables(batch_states.shape[-1])
+    keys = tables[0].reshape(2, -1)
+    if position_hashes is None:
+        position_hashes = batch_position_hashes(batch_states, include_turn)
+
+    idcs = np.arange(n)
+    players = gogame.batch_turn(batch_states)
+    empties = 1 - np.sum(batch_states[:, [govars.BLACK, govars.WHITE]], axis=1)
+    labels, liberties = state_utils.batch_group_liberties(batch_states[idcs, 1 - players], empties)
+
+    # Hash of every opponent group, kept only for the groups in atari
+    flat_labels = labels.reshape(n, -1)
+    stones = flat_labels > 0
+    group_hashes = np.zeros(len(liberties), dtype=np.uint64)
+    np.bitwise_xor.at(group_hashes, flat_labels[stones], keys[1 - players][stones])
+    group_hashes[liberties != 1] = 0
+
+    # Remove each distinct group in atari next to a point once
+    neighbor_labels = state_utils.shift_neighbors(labels).reshape(4, n, -1)
+    captured = np.zeros(flat_labels.shape, dtype=np.uint64)
+    for d in range(4):
+        distinct = np.all(neighbor_labels[d] != neighbor_labels[:d], axis=0)
+        captured ^= np.where(distinct, group_hashes[neighbor_labels[d]], np.uint64(0))
+
+    next_hashes = position_hashes[:, np.newaxis] ^ keys[players] ^ captured
+    if include_turn:
+        next_hashes ^= turn_key
+    return next_hashes
+
+
+def batch_superko_invalid_moves(batch_states, histories, include_turn=False, position_hashes=None):
+    """
+    Superko: moves that would repeat an earlier position of the game.
+    include_turn=False is positional superko, include_turn=True situational superko.
+    :param histories: Per state, a set of the game's position hashes as python ints (see batch_position_hashes)
+    :return: (BATCH_SIZE, SIZE, SIZE) bool, True on otherwise valid moves that repeat a position
+    """
+    n = len(batch_states)
+    next_hashes = batch_next_hashes(batch_states, include_turn, position_hashes)
+    candidates = batch_states[:, govars.INVD_CHNL].reshape(n, -1) == 0
+    superko = np.zeros(candidates.shape, dtype=bool)
+    for i, history in enumerate(histories):
+        points = np.flatnonzero(candidates[i])
+        superko[i, points] = [h in history for h in next_hashes[i, points].tolist()]
+    return superko.reshape(n, *batch_states.shape[2:])
+
+
+def superko_invalid_moves(state, history, include_turn=False):
+    return batch_superko_invalid_moves(state[np.newaxis], [history], include_turn)[0]
+
+
+def batch_mark_superko(batch_states, histories, include_turn=False):
+    """
+    Marks the moves that would repeat a position of the games' histories as invalid, in place. Ended states and
+    states without a history are left as they are. A move never recreates the position it is played from, so the
+    histories don't need to include the states themselves.
+    :param histories: Per state, a set of the game's position hashes as python ints (or None)
+    :return: (BATCH_SIZE,) batch_position_hashes of the states, e.g. to add them to the histories
+    """
+    position_hashes = batch_position_hashes(batch_states, include_turn)
+    has_history = np.array([history is not None for history in histories], dtype=bool)
+    marked = np.nonzero(has_history & (gogame.batch_game_ended(batch_states) == 0))[0]
+    if len(marked) > 0:
+        superko = batch_superko_invalid_moves(batch_states[marked], [histories[i] for i in marked], include_turn,
+                                              position_hashes[marked])
+        batch_states[marked, govars.INVD_CHNL] = np.maximum(batch_states[marked, govars.INVD_CHNL], superko)
+    return position_hashes
+
+
+def update_hashes(state_hashes, prev_state, next_state, include_turn=True):
+    """
+    Incrementally updates hashes by the stones that changed between two states (e.g. a move and its captures)
+    :param state_hashes: (8,) or (BATCH_SIZE, 8) hashes of prev_state (a single state or a batch)
+    :return: Hashes of next_state
+    """
+    batched = prev_state.ndim == 4
+    prev_states = prev_state if batched else prev_state[np.newaxis]
+    next_states = next_state if batched else next_state[np.newaxis]
+    state_hashes = np.array(state_hashes, dtype=np.uint64).reshape(-1, 8)
+
+    n = len(prev_states)
+    tables, turn_key = zobrist_tables(prev_states.shape[-1])
+    chnls = [govars.BLACK, govars.WHITE]
+    changed = (prev_states[:, chnls] != next_states[:, chnls]).reshape(n, -1)
+    for i, locations in enumerate(changed):
+        locations = np.nonzero(locations)[0]
+        if len(locations) > 0:
+            state_hashes[i] ^= np.bitwise_xor.reduce(tables[:, locations], axis=1)
+    if include_turn:
+        turn_changed = gogame.batch_turn(prev_states) != gogame.batch_turn(next_states)
+        state_hashes[turn_changed] ^= turn_key
+    return state_hashes if batched else state_hashes[0]
+
+
+def symmetric_hash(state, include_turn=True, state_hashes=None):
+    """
+    :param state_hashes: Optional precomputed (8,) hashes of the state, e.g. from update_hashes
+    :return: Hash shared by all 8 rotations/reflections of the position
+    """
+    state_hashes = hashes(state, include_turn) if state_hashes is None else state_hashes
+    return np.min(state_hashes)
+
+
+def batch_symmetric_hash(batch_states, include_turn=True):
+    return np.min(batch_hashes(batch_states, include_turn), axis=1)
+
+
+def canonical_orientation(state, include_turn=True):
+    """
+    :return: The index k in [0, 8) such that all_symmetries(state)[k] is the canonical orientation of the position
+    """
+    return int(np.argmin(hashes(state, include_turn)))
+
+
+def batch_canonical_orientation(batch_states, include_turn=True):
+    return np.argmin(batch_hashes(batch_states, include_turn), axis=1)
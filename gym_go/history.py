@@ -0,0 +1,90 @@
+"""
+Stacked history observations: the black and white stones of the last k positions plus extra feature planes,
+(2k + extra, SIZE, SIZE) per env, newest position first.
+
+The stones live in a ring buffer of 2k slots per env. Every position is written to slot head and head + k, so the
+last k positions are always the contiguous slots [head, head + k) and can be returned as a view without copying.
+"""
+import numpy as np
+
+from gym_go import features, govars
+
+
+class HistoryBuffer:
+
+    def __init__(self, num_envs, board_size, history=8, extra=('turn',), dtype=np.float32):
+        '''
+        @param history: Number of positions k
+        @param extra: Feature planes (see features.FEATURES) of the current position after the history planes
+        '''
+        self.num_envs = num_envs
+        self.board_size = board_size
+        self.history = history
+        self.extra = list(extra)
+        self.num_planes = 2 * history + features.num_planes(self.extra)
+        self.buffer = np.zeros((num_envs, 2 * history, 2, board_size, board_size), dtype=dtype)
+        self.head = 0
+
+    def reset(self, batch_states, idcs=None):
+        """
+        Clears the history of the envs (all by default) and starts it from their states.
+        Earlier positions are empty boards.
+        """
+        idcs = np.arange(self.num_envs) if idcs is None else idcs
+        self.buffer[idcs] = 0
+        self.buffer[idcs, self.head] = batch_states[:, [govars.BLACK, govars.WHITE]]
+        self.buffer[idcs, self.head + self.history] = self.buffer[idcs, self.head]
+
+    def push(self, batch_states):
+        """
+        Adds the next position of every env
+        """
+        self.head = (self.head - 1) % self.history
+        stones = batch_states[:, [govars.BLACK, govars.WHITE]]
+        self.buffer[:, self.head] = stones
+        self.buffer[:, self.head + self.history] = stones
+
+    def view(self):
+        """
+        :return: Read-only (NUM_ENVS, 2k, SIZE, SIZE) view of the last k positions' black and white stones,
+        newest first. It changes with the next push
+        """
+        view = self.buffer[:, self.head:self.head + self.history].reshape(self.num_envs, 2 * self.history,
+                                                                            self.board_size, self.board_size)
+        view.flags.writeable = False
+        return view
+
+    def observation(self, batch_states, out=None):
+        """
+        :param batch_states: Current states of the envs, for the extra planes
+        :param out: Optional (NUM_ENVS, num_planes, SIZE, SIZE) array to write into
+        :return: (NUM_ENVS, num_planes, SIZE, SIZE) stacked observations
+        """
+        if out is None:
+            out = np.empty((self.num_envs, self.num_planes, self.board_size, self.board_size),
+                           dtype=self.buffer.dtype)
+        out[:, :2 * self.history] = self.view()
+        if self.extra:
+            features.batch_features(batch_states, self.extra, out=out[:, 2 * self.history:])
+        return out
+
+    def snapshot(self):
+        """
+        :return: Copy of the positions, for restore
+        """
+        return np.copy(self.buffer), self.head
+
+    def restore(self, snapshot):
+        buffer, self.head = snapshot
+        self.buffer = np.copy(buffer)
+
+    def __getstate__(self):
+        # The stones are 0/1, so they are pickled as bits
+        state = dict(self.__dict__)
+        state['buffer'] = np.packbits(self.buffer > 0), self.buffer.shape, self.buffer.dtype.str
+        return state
+
+    def __setstate__(self, state):
+        bits, shape, dtype = state['buffer']
+        state['buffer'] = np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape).astype(dtype)
+        self.__dict__.update(state)
@@ -0,0 +1,276 @@
+"""
+Persistent index from positions to aggregated game statistics, e.g. for opening books and curricula.
+
+The index is an open addressing hash table in a memory-mapped file, keyed by the symmetry-invariant hash of a
+position (hashing.symmetric_hash), so all 8 rotations/reflections share an entry. Each entry keeps the position in
+its canonical orientation, visit/win/draw counts and per-move counts in that orientation; lookup maps the move counts
+back to the orientation of the queried state.
+
+    index = PositionIndex.build('openings/', archive, max_depth=20)
+    stats = index.lookup(state)
+    env.reset(options={'opening_book': index})
+"""
+import json
+import os
+
+import numpy as np
+
+from gym_go import gogame, hashing
+from gym_go.dataset import pack_states, unpack_states, packed_size
+
+META_FILE = 'meta.json'
+TABLE_FILE = 'table.bin'
+MAX_LOAD = 0.5
+
+
+def entry_dtype(board_size):
+    return np.dtype([
+        ('key', np.uint64),
+        ('visits', np.uint32),
+        ('black_wins', np.uint32),
+        ('draws', np.uint32),
+        ('planes', np.uint8, (packed_size(board_size),)),
+        ('flags', np.uint8),
+        ('move_counts', np.uint32, (gogame.action_size(board_size=board_size),)),
+    ])
+
+
+def _nonzero_keys(keys):
+    # Key 0 marks empty slots
+    keys = np.asarray(keys, dtype=np.uint64)
+    return np.where(keys == 0, np.uint64(1), keys)
+
+
+def batch_position_keys(batch_states):
+    """
+    :return: (BATCH_SIZE,) index keys (the symmetric hashes, never 0) and the canonical orientation of each state
+    """
+    batch_hashes = hashing.batch_hashes(batch_states)
+    orientations = np.argmin(batch_hashes, axis=1)
+    keys = _nonzero_keys(batch_hashes[np.arange(len(batch_hashes)), orientations])
+    return keys, orientations
+
+
+class PositionIndex:
+
+    def __init__(self, path, board_size=None, capacity=1 << 16):
+        '''
+        Opens the index at path, creating it if needed
+        @param board_size: Required for new indices
+        @param capacity: Initial number of slots for new indices (rounded up to a power of two). Grows as needed
+        '''
+        self.path = path
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.board_size = meta['board_size']
+            self.capacity = meta['capacity']
+            self.count = meta['count']
+        else:
+            if board_size is None:
+                raise ValueError('board_size is required for a new index')
+            os.makedirs(path, exist_ok=True)
+            self.board_size = board_size
+            self.capacity = 1 << int(np.ceil(np.log2(max(capacity, 2))))
+            self.count = 0
+            self._create_table(os.path.join(path, TABLE_FILE), self.capacity)
+        self.dtype = entry_dtype(self.board_size)
+        self._open_table()
+        self.flush()
+
+    def _open_table(self):
+        self.table = np.memmap(os.path.join(self.path, TABLE_FILE), dtype=self.dtype, mode='r+',
+                               shape=(self.capacity,))
+        # Plain view of the keys, probing through the memmap subclass is several times slower
+        self._keys = self.table['key'].view(np.ndarray)
+        # Slots and cumulative visits of the positions sample draws from, per min_visits
+        self._sample_cache = {}
+
+    def _create_table(self, table_path, capacity):
+        with open(table_path, 'wb') as f:
+            f.truncate(capacity * entry_dtype(self.board_size).itemsize)
+
+    def _slot(self, key, insert=False):
+        """
+        Linear probing
+        :return: Slot of the key, or of the empty slot it would go in if insert, otherwise -1 if missing
+        """
+        mask = self.capacity - 1
+        slot = int(key) & mask
+        keys = self._keys
+        while True:
+            slot_key = keys[slot]
+            if slot_key == key:
+                return slot
+            if slot_key == 0:
+                return slot if insert else -1
+            slot = (slot + 1) & mask
+
+    def _grow(self, min_count):
+        capacity = self.capacity
+        while min_count > capacity * MAX_LOAD:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        entries = np.array(self.table[self._keys != 0])
+        del self.table, self._keys
+
+        tmp_path = os.path.join(self.path, TABLE_FILE + '.tmp')
+        self._create_table(tmp_path, capacity)
+        os.replace(tmp_path, os.path.join(self.path, TABLE_FILE))
+        self.capacity = capacity
+        self._open_table()
+        for entry in entries:
+            self.table[self._slot(entry['key'], insert=True)] = entry
+        self.flush()
+
+    def add(self, batch_states, batch_actions, batch_results):
+        """
+        Aggregates positions into the index
+        :param batch_states: (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE) positions
+        :param batch_actions: (BATCH_SIZE,) moves played from them
+        :param batch_results: (BATCH_SIZE,) results of their games in black's perspective (1, 0, -1)
+        """
+        keys, orientations = batch_position_keys(batch_states)
+        moves = hashing.batch_transform_actions(batch_actions, orientations, self.board_size)
+        batch_results = np.asarray(batch_results)
+        self._sample_cache.clear()
+
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        visits = np.bincount(inverse, minlength=len(unique_keys))
+        black_wins = np.bincount(inverse, weights=batch_results > 0, minlength=len(unique_keys))
+        draws = np.bincount(inverse, weights=batch_results == 0, minlength=len(unique_keys))
+        move_counts = np.zeros((len(unique_keys), gogame.action_size(board_size=self.board_size)), dtype=np.uint32)
+        np.add.at(move_counts, (inverse, moves), 1)
+
+        canonical_states = gogame.batch_symmetries(batch_states[first], orientations[first])
+        planes, flags = pack_states(canonical_states)
+
+        self._grow(self.count + len(unique_keys))
+        for i, key in enumerate(unique_keys):
+            slot = self._slot(key, insert=True)
+            entry = self.table[slot]
+            if entry['key'] == 0:
+                entry['key'] = key
+                entry['planes'] = planes[i]
+                entry['flags'] = flags[i]
+                self.count += 1
+            entry['visits'] += visits[i]
+            entry['black_wins'] += int(black_wins[i])
+            entry['draws'] += int(draws[i])
+            entry['move_counts'] += move_counts[i]
+            self.table[slot] = entry
+
+    def add_games(self, games, max_depth=None):
+        """
+        :param games: Iterable of (states, actions, result) per game: the states before each action,
+        and the result in black's perspective. A records.GameArchive or a list of records.GameRecord also works.
+        :param max_depth: Only index the first max_depth positions of each game
+        """
+        for states, actions, result in _iter_games(games, max_depth):
+            n = len(actions) if max_depth is None else min(len(actions), max_depth)
+            self.add(states[:n], actions[:n], np.full(n, result))
+        self.flush()
+
+    @classmethod
+    def build(cls, path, games, board_size=None, max_depth=None, capacity=1 << 16):
+        """
+        Builds (or extends) the index at path from games, see add_games
+        """
+        if board_size is None and hasattr(games, 'board_size'):
+            board_size = games.board_size
+        index = cls(path, board_size, capacity)
+        index.add_games(games, max_depth)
+        return index
+
+    def lookup_key(self, key):
+        """
+        :param key: See batch_position_keys
+        :return: The raw entry (in canonical orientation), or None
+        """
+        slot = self._slot(np.uint64(key))
+        return None if slot < 0 else self.table[slot]
+
+    def lookup(self, state):
+        """
+        :return: dict with visits, black_wins, draws, black_win_rate and move_counts (oriented like state),
+        or None if the position was never seen
+        """
+        state_hashes = hashing.hashes(state)
+        orientation = np.argmin(state_hashes)
+        entry = self.lookup_key(_nonzero_keys(state_hashes[orientation]))
+        if entry is None:
+            return None
+        # The move on p in the canonical orientation is on perms[orientation, p] in the state's
+        canonical_moves = entry['move_counts']
+        perms, _ = hashing.symmetry_permutations(self.board_size)
+        move_counts = np.empty_like(canonical_moves)
+        move_counts[perms[orientation]] = canonical_moves[:-1]
+        move_counts[-1] = canonical_moves[-1]
+        visits = int(entry['visits'])
+        return {
+            'visits': visits,
+            'black_wins': int(entry['black_wins']),
+            'draws': int(entry['draws']),
+            'black_win_rate': entry['black_wins'] / visits if visits > 0 else 0,
+            'move_counts': move_counts,
+        }
+
+    def sample(self, n=1, rng=None, min_visits=1, random_symmetry=True):
+        """
+        Samples indexed positions proportionally to their visits. The eligible slots are scanned once per
+        min_visits, until the next add
+        :param random_symmetry: Whether to return each position in a random orientation
+        :return: (n, NUM_CHNLS, SIZE, SIZE) states
+        """
+        rng = gogame.make_rng(rng)
+        if min_visits not in self._sample_cache:
+            slots = np.nonzero((self._keys != 0) & (self.table['visits'] >= min_visits))[0]
+            if len(slots) == 0:
+                raise ValueError('No positions with at least {} visits'.format(min_visits))
+            self._sample_cache[min_visits] = slots, np.cumsum(self.table['visits'][slots], dtype=np.float64)
+        slots, cdf = self._sample_cache[min_visits]
+        chosen = slots[np.searchsorted(cdf, rng.random(n) * cdf[-1], side='right')]
+        entries = self.table[chosen]
+        states = unpack_states(entries['planes'], entries['flags'], self.board_size)
+        if random_symmetry:
+            states = gogame.batch_symmetries(states, rng.integers(0, 8, size=n))
+        return states
+
+    def flush(self):
+        self.table.flush()
+        meta = {'board_size': self.board_size, 'capacity': self.capacity, 'count': self.count}
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, state):
+        return self.lookup(state) is not None
+
+
+def _iter_games(games, max_depth):
+    from gym_go.records import GameArchive, GameRecord
+
+    if isinstance(games, GameArchive):
+        for game in range(len(games)):
+            actions = games.game_actions(game).astype(np.int64)
+            n = len(actions) if max_depth is None else min(len(actions), max_depth)
+            states = games.batch_positions(np.full(n, game), np.arange(n))
+            yield states, actions[:n], int(games.results[game])
+        return
+
+    for game in games:
+        if isinstance(game, GameRecord):
+            actions = game.actions.astype(np.int64)
+            if max_depth is not None:
+                actions = actions[:max_depth]
+            states = GameRecord(actions, game.board_size).states()[:-1]
+            yield states, actions, game.result
+        else:
+            yield game
+
@@ -0,0 +1,139 @@
+"""
+Opt-in counters and per-phase timings for the rules engine.
+
+The functions of gogame and state_utils that make up the engine are decorated with instrumented() where they are
+defined, so every caller is counted, including ones that imported the function before profiling was enabled.
+While profiling is off the decorator only checks a module-level flag. Counters are updated under a lock, so
+threads (e.g. a pondering search) can be profiled together.
+Timings are cumulative and inclusive, e.g. the time spent labelling groups is also part of invalid_moves and capture.
+
+    with profiling.profile():
+        ...
+    gym_go.stats()
+"""
+import contextlib
+import functools
+import threading
+import time
+from collections import defaultdict
+
+_enabled = False
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(float)
+
+
+def _count_boards(args, result):
+    _counters['boards'] += 1
+
+
+def _count_batch_boards(args, result):
+    _counters['boards'] += len(args[0])
+
+
+def _count_groups(args, result):
+    _counters['groups_labelled'] += result[1]
+
+
+def _count_captures(args, result):
+    _counters['captures'] += len(result)
+    _counters['captured_stones'] += sum(len(group) for group in result)
+
+
+def _count_batch_captures(args, result):
+    for killed_groups in result:
+        _count_captures(args, killed_groups)
+
+
+COUNTERS = {
+    'boards': _count_boards,
+    'batch_boards': _count_batch_boards,
+    'groups': _count_groups,
+    'captures': _count_captures,
+    'batch_captures': _count_batch_captures,
+}
+
+
+def instrumented(phase, counter=None):
+    """
+    Decorator that times the function under phase and counts its calls while profiling is enabled
+    :param counter: Optional name of a COUNTERS function, called with the arguments and the result
+    """
+    count = None if counter is None else COUNTERS[counter]
+
+    def decorator(fn):
+        calls = fn.__name__ + '_calls'
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            with _lock:
+                _timings[phase] += elapsed
+                _counters[calls] += 1
+                if count is not None:
+                    count(args, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def snapshot():
+    """
+    :return: Copy of the counters and the cumulative per-phase timings in seconds
+    """
+    with _lock:
+        return {
+            'enabled': enabled(),
+            'counters': dict(_counters),
+            'timings': dict(_timings),
+        }
+
+
+def stats(reset_after=False):
+    """
+    :param reset_after: Whether to clear the counters after taking the snapshot
+    """
+    result = snapshot()
+    if reset_after:
+        reset()
+    return result
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Profiles the enclosed block, restoring the previous state afterwards
+    """
+    was_enabled = enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
@@ -0,0 +1,217 @@
+"""
+Compact game records. A game is fully determined by its 1D actions, which fit in uint16 (or a varint stream),
+so positions are rebuilt on demand by replaying from the nearest stored checkpoint.
+Games are assumed to start from the empty board and to only contain legal moves.
+"""
+import json
+import os
+
+import numpy as np
+
+from gym_go import gogame
+from gym_go.dataset import pack_states, unpack_states, packed_size
+
+ARCHIVE_ARRAYS = ['actions', 'offsets', 'results', 'komis', 'checkpoint_planes', 'checkpoint_flags',
+                  'checkpoint_offsets']
+
+
+def encode_varint(values):
+    """
+    LEB128 encoding of non-negative integers. Actions below 128 take one byte, the rest of a 19x19 board two
+    """
+    out = bytearray()
+    for value in values:
+        value = int(value)
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data):
+    values = []
+    value, shift = 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value, shift = 0, 0
+    return np.array(values, dtype=np.uint16)
+
+
+class GameRecord:
+    """
+    A single game as its actions, result (black's perspective: 1, 0 or -1) and komi
+    """
+
+    def __init__(self, actions, board_size, result=0, komi=0):
+        self.actions = np.asarray(actions, dtype=np.uint16)
+        self.board_size = board_size
+        self.result = result
+        self.komi = komi
+
+    def to_bytes(self):
+        """
+        float32 komi followed by the varints board size, result + 1 and the actions
+        """
+        return np.float32(self.komi).tobytes() + encode_varint([self.board_size, self.result + 1, *self.actions])
+
+    @classmethod
+    def from_bytes(cls, data):
+        komi = float(np.frombuffer(data[:4], dtype=np.float32)[0])
+        values = decode_varint(data[4:])
+        return cls(values[2:], int(values[0]), int(values[1]) - 1, komi)
+
+    def states(self):
+        """
+        :return: All len(actions) + 1 states of the game, from the empty board to the final position
+        """
+        states = [gogame.init_state(self.board_size)]
+        for action in self.actions:
+            states.append(gogame.next_state(states[-1], action))
+        return np.array(states)
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class GameArchive:
+    """
+    Many games in flat arrays: all actions concatenated as uint16 with an offset index, plus a bit-packed
+    checkpoint every checkpoint_interval moves. Rebuilding any position replays fewer than checkpoint_interval moves.
+    """
+
+    def __init__(self, board_size, checkpoint_interval=32, arrays=None):
+        self.board_size = board_size
+        self.checkpoint_interval = checkpoint_interval
+        if arrays is None:
+            arrays = {
+                'actions': np.zeros(0, dtype=np.uint16),
+                'offsets': np.zeros(1, dtype=np.int64),
+                'results': np.zeros(0, dtype=np.int8),
+                'komis': np.zeros(0, dtype=np.float32),
+                'checkpoint_planes': np.zeros((0, packed_size(board_size)), dtype=np.uint8),
+                'checkpoint_flags': np.zeros(0, dtype=np.uint8),
+                'checkpoint_offsets': np.zeros(1, dtype=np.int64),
+            }
+        for name in ARCHIVE_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def extend(self, records, lanes=256):
+        """
+        Adds games, computing their checkpoints by replaying them in lockstep with batch_next_states
+        :param records: Iterable of GameRecord
+        """
+        records = list(records)
+        for start in range(0, len(records), lanes):
+            self._extend_block(records[start:start + lanes])
+
+    def _extend_block(self, records):
+        lengths = np.array([len(record) for record in records], dtype=np.int64)
+        interval = self.checkpoint_interval
+
+        # Checkpoint j of a game (j >= 1) is the position before move j * interval
+        num_checkpoints = lengths // interval
+        checkpoint_starts = np.concatenate([[0], np.cumsum(num_checkpoints)])
+        planes = np.zeros((checkpoint_starts[-1], self.checkpoint_planes.shape[1]), dtype=np.uint8)
+        flags = np.zeros(checkpoint_starts[-1], dtype=np.uint8)
+
+        max_length = lengths.max(initial=0)
+        padded_actions = np.zeros((len(records), max_length), dtype=np.int64)
+        for i, record in enumerate(records):
+            padded_actions[i, :len(record)] = record.actions
+
+        states = gogame.batch_init_state(len(records), self.board_size)
+        for t in range(max_length + 1):
+            if t > 0 and t % interval == 0:
+                reached = np.nonzero(lengths >= t)[0]
+                rows = checkpoint_starts[reached] + t // interval - 1
+                planes[rows], flags[rows] = pack_states(states[reached])
+            active = np.nonzero(lengths > t)[0]
+            if len(active) > 0:
+                states[active] = gogame.batch_next_states(states[active], padded_actions[active, t])
+
+        self.actions = np.concatenate([self.actions, padded_actions[lengths[:, None] > np.arange(max_length)]]) \
+            .astype(np.uint16)
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)])
+        self.results = np.concatenate([self.results, [record.result for record in records]]).astype(np.int8)
+        self.komis = np.concatenate([self.komis, [record.komi for record in records]]).astype(np.float32)
+        self.checkpoint_planes = np.concatenate([self.checkpoint_planes, planes])
+        self.checkpoint_flags = np.concatenate([self.checkpoint_flags, flags])
+        self.checkpoint_offsets = np.concatenate([self.checkpoint_offsets,
+                                                  self.checkpoint_offsets[-1] + checkpoint_starts[1:]])
+
+    def game_actions(self, game):
+        return self.actions[self.offsets[game]:self.offsets[game + 1]]
+
+    def record(self, game):
+        return GameRecord(self.game_actions(game), self.board_size, int(self.results[game]),
+                          float(self.komis[game]))
+
+    def game_length(self, game):
+        return int(self.offsets[game + 1] - self.offsets[game])
+
+    def position(self, game, move):
+        """
+        :return: The state before move number `move` (0 is the empty board, game_length(game) the final position)
+        """
+        states = self.batch_positions([game], [move])
+        return states[0]
+
+    def batch_positions(self, games, moves):
+        """
+        Rebuilds many positions at once: decodes each one's checkpoint, then replays the remaining moves
+        in lockstep with batch_next_states
+        :return: (len(games), NUM_CHNLS, SIZE, SIZE) states
+        """
+        games = np.asarray(games, dtype=np.int64)
+        moves = np.asarray(moves, dtype=np.int64)
+        lengths = self.offsets[games + 1] - self.offsets[games]
+        if ((moves < 0) | (moves > lengths)).any():
+            raise IndexError('Move index out of range')
+
+        checkpoints = moves // self.checkpoint_interval
+        states = gogame.batch_init_state(len(games), self.board_size)
+        from_checkpoint = np.nonzero(checkpoints > 0)[0]
+        if len(from_checkpoint) > 0:
+            rows = self.checkpoint_offsets[games[from_checkpoint]] + checkpoints[from_checkpoint] - 1
+            states[from_checkpoint] = unpack_states(self.checkpoint_planes[rows], self.checkpoint_flags[rows],
+                                                    self.board_size)
+
+        starts = self.offsets[games] + checkpoints * self.checkpoint_interval
+        remaining = moves - checkpoints * self.checkpoint_interval
+        for t in range(remaining.max(initial=0)):
+            active = np.nonzero(remaining > t)[0]
+            states[active] = gogame.batch_next_states(states[active], self.actions[starts[active] + t].astype(np.int64))
+        return states
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ARCHIVE_ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'board_size': self.board_size, 'checkpoint_interval': self.checkpoint_interval}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        :param mmap_mode: Memory-maps the arrays by default, so opening millions of games is instant
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in ARCHIVE_ARRAYS}
+        return cls(meta['board_size'], meta['checkpoint_interval'], arrays)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def result_from_state(state, komi=0):
+    """
+    :return: Black's result (1, 0 or -1) of a final position, for building GameRecords from GoEnv episodes
+    """
+    return int(gogame.winning(state, komi))
+
@@ -0,0 +1,118 @@
+import queue
+import threading
+
+import numpy as np
+
+from gym_go import gogame
+from gym_go.dataset import pack_states, unpack_states, packed_size
+
+
+class ReplayBuffer:
+    """
+    Fixed capacity ring buffer of (state, policy, value) training examples.
+    States are stored bit-packed. Sampled batches get a random dihedral symmetry per example, applied
+    consistently to the state planes and the policy (the pass move is left alone).
+    """
+
+    def __init__(self, capacity, board_size, augment=True, seed=None):
+        '''
+        @param augment: Whether sampled batches are randomly rotated/reflected
+        @param seed: None, an int, a SeedSequence or a Generator for sampling
+        '''
+        self.capacity = capacity
+        self.board_size = board_size
+        self.augment = augment
+        self.rng = gogame.make_rng(seed)
+
+        num_actions = gogame.action_size(board_size=board_size)
+        self.planes = np.zeros((capacity, packed_size(board_size)), dtype=np.uint8)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        self.policies = np.zeros((capacity, num_actions), dtype=np.float32)
+        self.values = np.zeros(capacity, dtype=np.float32)
+
+        self.size = 0
+        self.next_idx = 0
+        self.num_added = 0
+        self._lock = threading.Lock()
+
+    def add(self, batch_states, policies, values):
+        """
+        Adds examples, overwriting the oldest ones once full
+        :param batch_states: (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE)
+        :param policies: (BATCH_SIZE, NUM OF MOVES)
+        :param values: (BATCH_SIZE,)
+        """
+        n = len(batch_states)
+        if n > self.capacity:
+            batch_states, policies, values = batch_states[-self.capacity:], policies[-self.capacity:], \
+                                             values[-self.capacity:]
+            self.num_added += n - self.capacity
+            n = self.capacity
+        planes, flags = pack_states(batch_states)
+        with self._lock:
+            idcs = (self.next_idx + np.arange(n)) % self.capacity
+            self.planes[idcs] = planes
+            self.flags[idcs] = flags
+            self.policies[idcs] = policies
+            self.values[idcs] = values
+            self.next_idx = (self.next_idx + n) % self.capacity
+            self.size = min(self.capacity, self.size + n)
+            self.num_added += n
+
+    def sample(self, batch_size):
+        """
+        :return: states (BATCH_SIZE, NUM_CHNLS, SIZE, SIZE), policies, values
+        """
+        with self._lock:
+            if self.size == 0:
+                raise ValueError('Cannot sample from an empty replay buffer')
+            idcs = self.rng.integers(0, self.size, size=batch_size)
+            planes, flags = self.planes[idcs], self.flags[idcs]
+            policies, values = self.policies[idcs], self.values[idcs]
+
+        states = unpack_states(planes, flags, self.board_size)
+        if self.augment:
+            orientations = self.rng.integers(0, 8, size=batch_size)
+            states = gogame.batch_symmetries(states, orientations)
+            policies = gogame.batch_policy_symmetries(policies, orientations)
+        return states, policies, values
+
+    def batches(self, batch_size, prefetch=2):
+        """
+        Endless generator of sampled batches. The next batches are prepared on a background thread while the
+        caller trains on the current one. Close the generator (or break out of the loop) to stop the thread.
+        Don't call sample concurrently, since it shares the buffer's generator.
+        :param prefetch: Number of batches prepared ahead
+        """
+        batch_queue = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    batch = self.sample(batch_size)
+                except Exception as e:
+                    batch = e
+                while not stop.is_set():
+                    try:
+                        batch_queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if isinstance(batch, Exception):
+                    return
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batch_queue.get()
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+    def __len__(self):
+        return self.size
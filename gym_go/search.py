@@ -0,0 +1,240 @@
+"""
+Monte Carlo tree search over gogame, batched across many roots.
+
+Every iteration selects up to leaves_per_root leaves in each tree (spread out with virtual loss), expands them with
+one batch_next_states call and evaluates them with random playouts that are all played in lockstep.
+So searching for many envs at once, or with more leaves per root, mostly grows the batches instead of the number of
+calls.
+
+With superko, every node keeps the position hashes of its game (the root's history plus the path to the node), and
+the tree only expands moves that don't repeat one of them. Playouts only check simple ko.
+
+    mcts = MCTS(simulations=256, seed=0)
+    actions = mcts.search(batch_states)
+"""
+import math
+import time
+
+import numpy as np
+
+from gym_go import gogame, govars, hashing, state_utils
+
+
+def playout_weights(batch_states):
+    """
+    Uniform over valid moves, except filling the player's own single point eyes. Passing only when nothing else is left
+    """
+    n = len(batch_states)
+    idcs = np.arange(n)
+    players = gogame.batch_turn(batch_states)
+    own = batch_states[idcs, players]
+    empties = 1 - own - batch_states[idcs, 1 - players]
+    weights = gogame.batch_valid_moves(batch_states)
+    weights[:, :-1] *= 1 - state_utils.batch_single_point_eyes(own, empties).reshape(n, -1)
+    weights[:, -1] = np.sum(weights[:, :-1], axis=1) == 0
+    return weights
+
+
+def batch_playouts(batch_states, komi=0, max_moves=None, rng=None):
+    """
+    Plays every state out with playout_weights in lockstep, then scores the final boards
+    :param max_moves: Playouts are scored after this many moves, defaults to SIZE ** 2
+    :return: (BATCH_SIZE,) results in black's perspective (1, 0 or -1)
+    """
+    states = np.copy(batch_states)
+    max_moves = states.shape[-1] ** 2 if max_moves is None else max_moves
+    for _ in range(max_moves):
+        active = np.nonzero(gogame.batch_game_ended(states) == 0)[0]
+        if len(active) == 0:
+            break
+        actions = gogame.batch_random_action(states[active], playout_weights(states[active]), rng=rng)
+        states[active] = gogame.batch_next_states(states[active], actions)
+    return gogame.batch_winning(states, komi)
+
+
+class Node:
+    """
+    Position in the search tree. Statistics are per action, with values in the perspective of the player to move.
+    history is the frozenset of the game's position hashes up to the node with superko, None otherwise
+    """
+    __slots__ = ['state', 'history', 'player', 'terminal', 'children', 'visits', 'values', 'untried']
+
+    def __init__(self, state, rng, history=None):
+        self.state = state
+        self.history = history
+        self.player = gogame.turn(state)
+        self.terminal = gogame.game_ended(state)
+        self.children = {}
+        num_actions = gogame.action_size(state)
+        self.visits = np.zeros(num_actions)
+        self.values = np.zeros(num_actions)
+        self.untried = [] if self.terminal else list(rng.permutation(np.flatnonzero(gogame.valid_moves(state))))
+
+    def num_visits(self):
+        return self.visits.sum()
+
+    def select(self, c_uct):
+        """
+        :return: The expanded action with the highest UCT score
+        """
+        actions = np.fromiter(self.children, dtype=np.int64, count=len(self.children))
+        visits = self.visits[actions]
+        scores = self.values[actions] / visits + c_uct * np.sqrt(math.log(visits.sum()) / visits)
+        return int(actions[np.argmax(scores)])
+
+    def best_action(self):
+        """
+        :return: The most visited action, passing if nothing was searched
+        """
+        if self.visits.sum() == 0:
+            return len(self.visits) - 1
+        return int(np.argmax(self.visits))
+
+
+class MCTS:
+
+    def __init__(self, simulations=64, time_ms=None, leaves_per_root=8, c_uct=1.4, komi=0, max_playout_moves=None,
+                 superko=None, seed=None):
+        '''
+        @param simulations: Playouts per root and search. None to only use the time budget
+        @param time_ms: Optional wall clock budget per search in milliseconds. The search stops at whichever budget
+        runs out first (always finishing the current iteration)
+        @param leaves_per_root: Leaves selected per root and iteration, kept apart with virtual loss
+        @param max_playout_moves: Playouts are scored after this many moves, defaults to SIZE ** 2
+        @param superko: None (simple ko only), 'positional' or 'situational' (see GoEnv). Applies to the tree, not to
+        the playouts
+        '''
+        assert simulations is not None or time_ms is not None, 'Search needs a simulation or time budget'
+        assert superko in (None, 'positional', 'situational'), superko
+        self.simulations = simulations
+        self.time_ms = time_ms
+        self.leaves_per_root = leaves_per_root
+        self.c_uct = c_uct
+        self.komi = komi
+        self.max_playout_moves = max_playout_moves
+        self.superko = superko
+        self.rng = gogame.make_rng(seed)
+        self.counters = {'searches': 0, 'iterations': 0, 'playouts': 0, 'time': 0.0}
+
+    def new_root(self, state, history=None):
+        """
+        :param history: With superko, the set of the game's earlier position hashes (e.g. GoEnv.position_hashes).
+        Defaults to the state only
+        """
+        state = np.copy(state)
+        if self.superko is None:
+            return Node(state, self.rng)
+        history = set() if history is None else history
+        position_hashes = hashing.batch_mark_superko(state[np.newaxis], [history], self.superko == 'situational')
+        return Node(state, self.rng, frozenset(history) | {int(position_hashes[0])})
+
+    def search(self, batch_states, histories=None):
+        """
+        :param histories: With superko, optional per state set of the game's earlier position hashes (see new_root)
+        :return: (BATCH_SIZE,) best actions for fresh searches from every state
+        """
+        histories = [None] * len(batch_states) if histories is None else histories
+        roots = [self.new_root(state, history) for state, history in zip(batch_states, histories)]
+        self.run(roots)
+        return np.array([root.best_action() for root in roots], dtype=np.int64)
+
+    def run(self, roots, simulations=None, time_ms=None):
+        """
+        Searches the roots (which may already have statistics) within the budget
+        :param simulations: Overrides the simulations per root for this run
+        :param time_ms: Overrides the time budget for this run
+        """
+        simulations = self.simulations if simulations is None else simulations
+        time_ms = self.time_ms if time_ms is None else time_ms
+        start = time.perf_counter()
+        deadline = None if time_ms is None else start + time_ms / 1000
+        done = [0] * len(roots)
+
+        while True:
+            pending = []
+            for i, root in enumerate(roots):
+                # A root with a single move has nothing to search
+                if root.terminal or (len(root.untried) + len(root.children) <= 1):
+                    continue
+                budget = self.leaves_per_root
+                if simulations is not None:
+                    budget = min(budget, simulations - done[i])
+                for _ in range(budget):
+                    path = self._select(root)
+                    if path is None:
+                        break
+                    pending.append(path)
+                    done[i] += 1
+            if not pending:
+                break
+            self._expand_and_backup(pending)
+            self.counters['iterations'] += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        self.counters['searches'] += len(roots)
+        self.counters['time'] += time.perf_counter() - start
+
+    def _select(self, root):
+        """
+        Walks down to an untried action (or a terminal node), applying virtual loss on the way
+        :return: [(node, action), ...] from the root, or None if the tree is exhausted
+        """
+        node = root
+        path = []
+        while True:
+            if node.terminal:
+                break
+            if node.untried:
+                action = int(node.untried.pop())
+                path.append((node, action))
+                break
+            if not node.children:
+                break
+            action = node.select(self.c_uct)
+            path.append((node, action))
+            node = node.children[action]
+        if not path:
+            return None
+        for parent, action in path:
+            parent.visits[action] += 1
+            parent.values[action] -= 1
+        return path
+
+    def _expand_and_backup(self, paths):
+        # New leaves are created in one batch
+        new = [i for i, path in enumerate(paths) if path[-1][1] not in path[-1][0].children]
+        if new:
+            parents = [paths[i][-1][0] for i in new]
+            parent_states = np.array([parent.state for parent in parents])
+            actions = np.array([paths[i][-1][1] for i in new])
+            if self.superko is None:
+                child_states = gogame.batch_next_states(parent_states, actions)
+                child_histories = [None] * len(new)
+            else:
+                include_turn = self.superko == 'situational'
+                child_states = gogame.batch_next_states(parent_states, actions,
+                                                        histories=[parent.history for parent in parents],
+                                                        include_turn=include_turn)
+                position_hashes = hashing.batch_position_hashes(child_states, include_turn).tolist()
+                child_histories = [parent.history | {position_hash}
+                                   for parent, position_hash in zip(parents, position_hashes)]
+            for parent, action, child_state, child_history in zip(parents, actions.tolist(), child_states,
+                                                                   child_histories):
+                parent.children[action] = Node(child_state, self.rng, child_history)
+
+        leaves = [path[-1][0].children[path[-1][1]] for path in paths]
+        leaf_states = np.array([leaf.state for leaf in leaves])
+        results = np.empty(len(leaves))
+        terminal = np.array([leaf.terminal for leaf in leaves], dtype=bool)
+        if terminal.any():
+            results[terminal] = gogame.batch_winning(leaf_states[terminal], self.komi)
+        if (~terminal).any():
+            results[~terminal] = batch_playouts(leaf_states[~terminal], self.komi, self.max_playout_moves, self.rng)
+            self.counters['playouts'] += int(np.sum(~terminal))
+
+        for path, result in zip(paths, results):
+            for parent, action in path:
+                value = result if parent.player == govars.BLACK else -result
+                # Replace the virtual loss with the result
+                parent.values[action] += 1 + value
@@ -0,0 +1,332 @@
+"""
+Self-play data generation. Actor processes each play many games in lockstep and send the positions to move from
+to a central, batched evaluator over shared memory. Finished games are streamed to a writer (e.g. a
+dataset.DatasetWriter) as canonical states, policy targets and outcomes in the perspective of the player to move.
+
+    with DatasetWriter('selfplay/', board_size=9) as writer:
+        selfplay = SelfPlay(9, evaluator=heuristic_evaluator, num_actors=4)
+        selfplay.run(num_games=1000, writer=writer)
+        print(selfplay.stats())
+
+Everything runs locally; an evaluator is any function from a batch of canonical states to
+(policies (BATCH_SIZE, NUM OF MOVES), values (BATCH_SIZE,)).
+"""
+import multiprocessing
+import queue
+import time
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from gym_go import gogame, govars, hashing, state_utils
+
+
+def random_evaluator(batch_states):
+    """
+    Uniform over valid moves, value 0
+    """
+    policies = gogame.batch_valid_moves(batch_states)
+    return policies / np.sum(policies, axis=1, keepdims=True), np.zeros(len(batch_states))
+
+
+def heuristic_evaluator(batch_states):
+    """
+    Uniform over valid moves that don't fill the player's own single point eyes, passing only when nothing else is
+    left. The value is the squashed stone difference.
+    """
+    n = len(batch_states)
+    own, opp = batch_states[:, govars.BLACK], batch_states[:, govars.WHITE]
+    own_eyes = state_utils.batch_single_point_eyes(own, 1 - own - opp)
+
+    policies = gogame.batch_valid_moves(batch_states)
+    policies[:, :-1] *= 1 - own_eyes.reshape(n, -1)
+    policies[:, -1] = np.sum(policies[:, :-1], axis=1) == 0
+    values = np.tanh((own.sum(axis=(1, 2)) - opp.sum(axis=(1, 2))) / batch_states.shape[-1])
+    return policies / np.sum(policies, axis=1, keepdims=True), values
+
+
+EVALUATORS = {
+    'random': random_evaluator,
+    'heuristic': heuristic_evaluator,
+}
+
+
+class _SharedBlock:
+    """
+    Per actor shared memory for the states to evaluate and the evaluator's outputs
+    """
+
+    def __init__(self, games, board_size, name=None):
+        num_actions = gogame.action_size(board_size=board_size)
+        shapes = [('states', (games, govars.NUM_CHNLS, board_size, board_size)),
+                  ('policies', (games, num_actions)),
+                  ('values', (games,))]
+        nbytes = sum(int(np.prod(shape)) for _, shape in shapes) * 4
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        offset = 0
+        for field, shape in shapes:
+            array = np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf, offset=offset)
+            setattr(self, field, array)
+            offset += array.nbytes
+
+    def close(self, unlink=False):
+        # Drop the views before closing the buffer
+        del self.states, self.policies, self.values
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _actor(conn, shm_name, results, config, num_games, seed):
+    block = _SharedBlock(config['games_in_parallel'], config['board_size'], shm_name)
+    try:
+        _play(conn, block, results, config, num_games, seed)
+    finally:
+        block.close()
+        conn.send(None)
+        conn.close()
+
+
+def _play(conn, block, results, config, num_games, seed):
+    rng = gogame.make_rng(seed)
+    size = config['board_size']
+    max_moves = config['max_moves'] or 2 * size ** 2
+    lanes = min(config['games_in_parallel'], num_games)
+
+    states = gogame.batch_init_state(lanes, size)
+    moves = np.zeros(lanes, dtype=np.int64)
+    histories = [[] for _ in range(lanes)]
+    # Position hashes of every lane's game, for superko
+    superko = config['superko']
+    include_turn = superko == 'situational'
+    if superko is not None:
+        start_hash = hashing.batch_position_hashes(states[:1], include_turn).tolist()
+        position_hashes = [set(start_hash) for _ in range(lanes)]
+    started = lanes
+    finished = 0
+
+    while finished < num_games:
+        active = np.nonzero(moves >= 0)[0]
+        canonical = gogame.batch_canonical_form(states[active])
+
+        block.states[:len(active)] = canonical
+        conn.send(len(active))
+        conn.recv()
+        policies = np.array(block.policies[:len(active)], dtype=np.float64)
+
+        actions = gogame.batch_random_action(canonical, policies, config['temperature'], config['dirichlet_alpha'],
+                                             config['dirichlet_frac'], rng)
+        greedy = np.nonzero(moves[active] >= config['temperature_moves'])[0]
+        if len(greedy) > 0:
+            actions[greedy] = gogame.batch_random_action(canonical[greedy], policies[greedy], temperature=0)
+        for i, lane in enumerate(active):
+            histories[lane].append((canonical[i], policies[i], gogame.turn(states[lane])))
+
+        if superko is None:
+            states[active] = gogame.batch_next_states(states[active], actions)
+        else:
+            states[active] = gogame.batch_next_states(states[active], actions,
+                                                      histories=[position_hashes[lane] for lane in active],
+                                                      include_turn=include_turn)
+            new_hashes = hashing.batch_position_hashes(states[active], include_turn).tolist()
+            for lane, position_hash in zip(active, new_hashes):
+                position_hashes[lane].add(position_hash)
+        moves[active] += 1
+
+        ended = active[(gogame.batch_game_ended(states[active]) > 0) | (moves[active] >= max_moves)]
+        if len(ended) > 0:
+            winners = gogame.batch_winning(states[ended], config['komi'])
+            for lane, winner in zip(ended, winners):
+                game_states, game_policies, players = zip(*histories[lane])
+                players = np.array(players)
+                outcomes = np.where(players == govars.BLACK, winner, -winner).astype(np.float32)
+                results.put((np.array(game_states, dtype=np.float32), np.array(game_policies, dtype=np.float32),
+                             outcomes))
+                finished += 1
+
+                histories[lane] = []
+                if started < num_games:
+                    states[lane] = gogame.init_state(size)
+                    moves[lane] = 0
+                    if superko is not None:
+                        position_hashes[lane] = set(start_hash)
+                    started += 1
+                else:
+                    moves[lane] = -1
+
+
+class SelfPlay:
+    """
+    Self-play driver. The calling process runs the evaluator and the writer, actors run the games.
+    """
+
+    def __init__(self, board_size, evaluator='heuristic', num_actors=2, games_in_parallel=64, max_batch=None,
+                 komi=0, max_moves=None, temperature=1, temperature_moves=None, dirichlet_alpha=None,
+                 dirichlet_frac=0.25, superko=None, max_pending_games=256, max_wait=0.005, seed=None,
+                 start_method=None):
+        '''
+        @param evaluator: 'random', 'heuristic' or a function from canonical states to (policies, values)
+        @param games_in_parallel: Games each actor plays in lockstep
+        @param max_batch: Most states per evaluator call, defaults to all actors' games
+        @param max_moves: Games are cut off after this many moves, defaults to 2 * board_size ** 2
+        @param temperature_moves: After this many moves actions are picked greedily, defaults to never
+        @param superko: None (simple ko only), 'positional' or 'situational' (see GoEnv)
+        @param max_pending_games: Finished games that can wait for the writer before actors block
+        @param max_wait: Seconds the evaluator waits for more actors to fill its batch
+        @param seed: Seeds the actors' streams (spawned from one SeedSequence)
+        @param start_method: multiprocessing start method, defaults to the platform's
+        '''
+        self.board_size = board_size
+        self.evaluator = EVALUATORS[evaluator] if isinstance(evaluator, str) else evaluator
+        self.num_actors = num_actors
+        self.games_in_parallel = games_in_parallel
+        self.max_batch = max_batch or num_actors * games_in_parallel
+        self.config = {
+            'board_size': board_size,
+            'games_in_parallel': games_in_parallel,
+            'komi': komi,
+            'max_moves': max_moves,
+            'temperature': temperature,
+            'temperature_moves': np.inf if temperature_moves is None else temperature_moves,
+            'dirichlet_alpha': dirichlet_alpha,
+            'dirichlet_frac': dirichlet_frac,
+            'superko': superko,
+        }
+        self.max_pending_games = max_pending_games
+        self.max_wait = max_wait
+        self.seed = seed
+        self.ctx = multiprocessing.get_context(start_method)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.counters = {
+            'games': 0,
+            'positions': 0,
+            'evaluator_calls': 0,
+            'evaluated_states': 0,
+            'evaluator_time': 0.0,
+            'writer_time': 0.0,
+            'elapsed': 0.0,
+        }
+
+    def stats(self):
+        """
+        :return: Counters plus throughput: games/sec, positions/sec and the mean evaluator batch fill
+        (states per call / max_batch)
+        """
+        stats = dict(self.counters)
+        elapsed = max(stats['elapsed'], 1e-9)
+        stats['games_per_sec'] = stats['games'] / elapsed
+        stats['positions_per_sec'] = stats['positions'] / elapsed
+        calls = max(stats['evaluator_calls'], 1)
+        stats['mean_batch_size'] = stats['evaluated_states'] / calls
+        stats['mean_batch_fill'] = stats['mean_batch_size'] / self.max_batch
+        return stats
+
+    def run(self, num_games, writer=None, callback=None):
+        """
+        Plays num_games games across the actors
+        :param writer: Object with append(states, policies, outcomes), e.g. a dataset.DatasetWriter
+        :param callback: Optional function called with each finished game's (states, policies, outcomes)
+        """
+        games_per_actor = [len(split) for split in np.array_split(np.arange(num_games), self.num_actors)]
+        seeds = np.random.SeedSequence(self.seed).spawn(self.num_actors)
+        results = self.ctx.Queue(maxsize=self.max_pending_games)
+
+        blocks, conns, actors = [], [], []
+        start = time.perf_counter()
+        try:
+            for actor_games, seed in zip(games_per_actor, seeds):
+                if actor_games == 0:
+                    continue
+                block = _SharedBlock(self.games_in_parallel, self.board_size)
+                parent_conn, child_conn = self.ctx.Pipe()
+                actor = self.ctx.Process(target=_actor, daemon=True,
+                                         args=(child_conn, block.shm.name, results, self.config, actor_games, seed))
+                actor.start()
+                child_conn.close()
+                blocks.append(block)
+                conns.append(parent_conn)
+                actors.append(actor)
+
+            running = dict(zip(conns, blocks))
+            target = self.counters['games'] + num_games
+            while running:
+                self._serve(running)
+                self._drain(results, writer, callback)
+            # Collect the games still in flight
+            while self.counters['games'] < target:
+                if not any(actor.is_alive() for actor in actors) and results.empty():
+                    raise RuntimeError('Actors exited after {} of {} games'.format(
+                        num_games - target + self.counters['games'], num_games))
+                self._drain(results, writer, callback, block_until_one=True)
+        finally:
+            for actor in actors:
+                actor.join(timeout=5)
+                if actor.is_alive():
+                    actor.terminate()
+            for block in blocks:
+                block.close(unlink=True)
+            self.counters['elapsed'] += time.perf_counter() - start
+
+    def _serve(self, running):
+        """
+        Waits up to max_wait for every running actor to send its states, then evaluates them in batches of at most
+        max_batch states
+        """
+        if not running:
+            return
+        requests = []
+        num_states = 0
+        waiting = list(running)
+        deadline = time.perf_counter() + self.max_wait
+        while waiting:
+            ready = connection.wait(waiting, timeout=max(deadline - time.perf_counter(), 0))
+            if not ready:
+                break
+            for conn in ready:
+                waiting.remove(conn)
+                n = conn.recv()
+                if n is None:
+                    del running[conn]
+                    continue
+                if requests and num_states + n > self.max_batch:
+                    self._evaluate(requests)
+                    requests, num_states = [], 0
+                requests.append((conn, running[conn], n))
+                num_states += n
+        if requests:
+            self._evaluate(requests)
+
+    def _evaluate(self, requests):
+        start = time.perf_counter()
+        batch_states = np.concatenate([block.states[:n] for _, block, n in requests])
+        policies, values = self.evaluator(batch_states)
+        offset = 0
+        for conn, block, n in requests:
+            block.policies[:n] = policies[offset:offset + n]
+            block.values[:n] = values[offset:offset + n]
+            offset += n
+            conn.send(True)
+        self.counters['evaluator_calls'] += 1
+        self.counters['evaluated_states'] += len(batch_states)
+        self.counters['evaluator_time'] += time.perf_counter() - start
+
+    def _drain(self, results, writer, callback, block_until_one=False):
+        while True:
+            try:
+                game = results.get(timeout=0.1) if block_until_one else results.get_nowait()
+            except queue.Empty:
+                return
+            block_until_one = False
+            start = time.perf_counter()
+            if writer is not None:
+                writer.append(*game)
+            if callback is not None:
+                callback(*game)
+            self.counters['writer_time'] += time.perf_counter() - start
+            self.counters['games'] += 1
+            self.counters['positions'] += len(game[0])
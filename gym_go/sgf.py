@@ -0,0 +1,384 @@
+"""
+Streaming SGF reading and writing, and bulk conversion of game records to state tensors.
+
+Only the main line of each game is read. Coordinates follow SGF: the first letter is the column and the second
+the row, counting from the top left, so 'ba' is the 1D action 1. An empty value (or 'tt' on boards up to 19x19)
+is a pass.
+"""
+import io
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from gym_go import gogame, govars, state_utils
+
+SgfGame = namedtuple('SgfGame', ['size', 'komi', 'result', 'colors', 'actions', 'black_stones', 'white_stones',
+                                 'first_player', 'properties'])
+SgfGame.__doc__ = """
+Main line of an SGF game
+* colors, actions: Colors (govars.BLACK/govars.WHITE) and 1D actions of the moves in order
+* black_stones, white_stones: 1D locations of setup stones (e.g. handicap)
+* first_player: Player to move after setup
+* properties: Root node properties, as lists of raw values
+"""
+
+_TOKEN_RE = re.compile(r'\s*(?:(\[(?:[^\]\\]|\\.)*\])|([();])|([A-Za-z]+)|(\[)|(\S))', re.DOTALL)
+
+
+def _tokens(text, pos=0):
+    """
+    Yields (kind, value, end) with kind one of 'value', 'punct', 'ident', 'partial'
+    A 'partial' token is an unterminated value
+    """
+    while True:
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            return
+        pos = match.end()
+        value, punct, ident, partial, junk = match.groups()
+        if value is not None:
+            yield 'value', value[1:-1], pos
+        elif punct is not None:
+            yield 'punct', punct, pos
+        elif ident is not None:
+            yield 'ident', ident, pos
+        elif partial is not None:
+            yield 'partial', partial, pos
+            return
+
+
+def _split_games(f, chunk_size):
+    """
+    Yields the raw text of every top level game tree without reading the whole input
+    """
+    buffer = ''
+    while True:
+        chunk = f.read(chunk_size)
+        buffer += chunk
+        depth = 0
+        start = None
+        consumed = 0
+        for kind, value, end in _tokens(buffer):
+            if kind == 'partial':
+                break
+            if kind == 'punct' and value == '(':
+                if depth == 0:
+                    start = end - 1
+                depth += 1
+            elif kind == 'punct' and value == ')' and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    yield buffer[start:end]
+                    consumed = end
+        buffer = buffer[consumed:]
+        if not chunk:
+            return
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', r'\1', value, flags=re.DOTALL)
+
+
+def parse_nodes(text):
+    """
+    :param text: A single game tree
+    :return: The main line as a list of nodes, each a dict of property identifier to list of values
+    """
+    nodes = []
+    node = None
+    ident = None
+    for kind, value, _ in _tokens(text):
+        if kind == 'punct':
+            if value == ';':
+                node = {}
+                nodes.append(node)
+                ident = None
+            elif value == ')':
+                # The first closing parenthesis ends the first variation of the deepest branch
+                break
+        elif kind == 'ident' and node is not None:
+            ident = value
+            node.setdefault(ident, [])
+        elif kind == 'value' and ident is not None:
+            node[ident].append(_unescape(value))
+    return nodes
+
+
+def point_to_action(point, size):
+    """
+    :param point: SGF point e.g. 'dc'. '' and 'tt' (for size <= 19) are passes
+    :return: 1D action
+    """
+    if point == '' or (point == 'tt' and size <= 19):
+        return size ** 2
+    col, row = ord(point[0]) - ord('a'), ord(point[1]) - ord('a')
+    if not (0 <= row < size and 0 <= col < size):
+        raise ValueError('SGF point {} is off a {}x{} board'.format(point, size, size))
+    return row * size + col
+
+
+def action_to_point(action, size):
+    if action == size ** 2:
+        return ''
+    row, col = action // size, action % size
+    return chr(ord('a') + col) + chr(ord('a') + row)
+
+
+def _expand_points(values, size):
+    """
+    Expands compressed point lists e.g. 'aa:cc'
+    """
+    actions = []
+    for value in values:
+        if ':' in value:
+            top_left, bottom_right = value.split(':')
+            r0, c0 = divmod(point_to_action(top_left, size), size)
+            r1, c1 = divmod(point_to_action(bottom_right, size), size)
+            actions.extend(r * size + c for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+        else:
+            actions.append(point_to_action(value, size))
+    return actions
+
+
+def game_from_nodes(nodes):
+    root = nodes[0] if nodes else {}
+    size = int(root.get('SZ', ['19'])[0].split(':')[0])
+    komi = float(root.get('KM', ['0'])[0] or 0)
+    result = root.get('RE', [None])[0]
+    black_stones = _expand_points(root.get('AB', []), size)
+    white_stones = _expand_points(root.get('AW', []), size)
+
+    if 'PL' in root:
+        first_player = govars.WHITE if root['PL'][0].upper().startswith('W') else govars.BLACK
+    else:
+        first_player = govars.WHITE if black_stones and not white_stones else govars.BLACK
+
+    colors, actions = [], []
+    for node in nodes:
+        for color, ident in [(govars.BLACK, 'B'), (govars.WHITE, 'W')]:
+            if ident in node:
+                colors.append(color)
+                actions.append(point_to_action(node[ident][0], size))
+
+    return SgfGame(size, komi, result, colors, actions, black_stones, white_stones, first_player, root)
+
+
+def iter_games(source, chunk_size=1 << 16):
+    """
+    Streams the games of an SGF file or collection one at a time
+    :param source: A path or a text file object
+    :param chunk_size: Number of characters read at a time
+    :return: Generator of SgfGame
+    """
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as f:
+            yield from iter_games(f, chunk_size)
+        return
+
+    for text in _split_games(source, chunk_size):
+        yield game_from_nodes(parse_nodes(text))
+
+
+def loads(text):
+    """
+    :return: List of the games in an SGF string
+    """
+    return list(iter_games(io.StringIO(text)))
+
+
+def result_winner(result):
+    """
+    :param result: SGF result e.g. 'B+3.5', 'W+R', '0' or 'Draw'
+    :return: 1 if black won, -1 if white won, 0 for a draw, None if unknown
+    """
+    if not result:
+        return None
+    result = result.strip().upper()
+    if result.startswith('B+'):
+        return 1
+    if result.startswith('W+'):
+        return -1
+    if result in ('0', 'DRAW', 'JIGO'):
+        return 0
+    return None
+
+
+def format_result(winner, margin=None):
+    """
+    :param winner: Black's perspective, like GoEnv.winner
+    :param margin: Optional score margin
+    """
+    if winner == 0:
+        return '0'
+    result = 'B+' if winner > 0 else 'W+'
+    if margin is None:
+        return result + 'R'
+    return result + '{:g}'.format(abs(margin))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace(']', '\\]')
+
+
+def dumps(actions, size, komi=0, result=None, first_player=govars.BLACK, **properties):
+    """
+    SGF text for a sequence of 1D actions, e.g. the actions passed to GoEnv.step in an episode
+    :param properties: Extra root properties, e.g. PB='agent', PW='random'
+    """
+    root = {'GM': 1, 'FF': 4, 'CA': 'UTF-8', 'SZ': size, 'KM': '{:g}'.format(komi)}
+    if result is not None:
+        root['RE'] = result
+    root.update(properties)
+
+    sgf = '(;' + ''.join('{}[{}]'.format(ident, _escape(value)) for ident, value in root.items())
+    player = first_player
+    for i, action in enumerate(actions):
+        sgf += ';{}[{}]'.format('B' if player == govars.BLACK else 'W', action_to_point(int(action), size))
+        if i % 16 == 15:
+            sgf += '\n'
+        player = 1 - player
+    return sgf + ')\n'
+
+
+def write_game(f, actions, size, komi=0, result=None, **properties):
+    """
+    Appends a game to an open text file, so many games can be streamed into one collection
+    """
+    f.write(dumps(actions, size, komi, result, **properties))
+
+
+def setup_state(size, black_stones=(), white_stones=(), player=govars.BLACK):
+    """
+    :return: A state with the setup stones placed and player to move
+    """
+    state = gogame.init_state(size)
+    for color, stones in [(govars.BLACK, black_stones), (govars.WHITE, white_stones)]:
+        for action in stones:
+            state[color, action // size, action % size] = 1
+    if player == govars.WHITE:
+        state_utils.set_turn(state)
+    state[govars.INVD_CHNL] = state_utils.compute_invalid_moves(state, 1 - player)
+    return state
+
+
+def _game_plan(game):
+    """
+    Converts the moves to the engine's strict alternation by inserting passes where a player moved twice
+    :return: actions, whether each action is a real move
+    """
+    actions, real = [], []
+    player = game.first_player
+    for color, action in zip(game.colors, game.actions):
+        if color != player:
+            actions.append(game.size ** 2)
+            real.append(False)
+            player = 1 - player
+        actions.append(action)
+        real.append(True)
+        player = 1 - player
+    return np.array(actions, dtype=np.int64), np.array(real, dtype=bool)
+
+
+def batch_convert(games, board_size, chunk_size=4096, lanes=256, canonical=False, dtype=np.float32,
+                  skip_unknown_results=True):
+    """
+    Replays many games in lockstep with batch_next_states and emits the positions in chunks
+    :param games: Iterable of SgfGame, e.g. iter_games(path). Games of other board sizes are skipped
+    :param chunk_size: Positions per emitted chunk (the last chunk may be smaller)
+    :param lanes: Number of games replayed together
+    :param canonical: If True, states are in canonical form and outcomes are in the perspective of the player to move.
+    Otherwise outcomes are in black's perspective
+    :param skip_unknown_results: Skip games without a decisive or drawn result, otherwise their outcome is 0
+    :return: Generator of (states, actions, outcomes) with shapes (M, NUM_CHNLS, SIZE, SIZE), (M,), (M,).
+    A game that contains a move that's illegal under these rules is truncated before that move, and games without
+    moves are skipped.
+    """
+    games = iter(games)
+    pass_idx = board_size ** 2
+
+    lane_states = gogame.batch_init_state(lanes, board_size)
+    lane_plans = [None] * lanes
+    lane_steps = np.zeros(lanes, dtype=np.int64)
+    lane_outcomes = np.zeros(lanes)
+
+    def load(lane):
+        for game in games:
+            winner = result_winner(game.result)
+            if game.size != board_size or (winner is None and skip_unknown_results):
+                continue
+            plan = _game_plan(game)
+            # Games without moves have no (position, action) pairs
+            if len(plan[0]) == 0:
+                continue
+            lane_states[lane] = setup_state(board_size, game.black_stones, game.white_stones, game.first_player)
+            lane_plans[lane] = plan
+            lane_steps[lane] = 0
+            lane_outcomes[lane] = winner or 0
+            return
+        lane_plans[lane] = None
+
+    for lane in range(lanes):
+        load(lane)
+
+    out_states, out_actions, out_outcomes = [], [], []
+    num_out = 0
+    while True:
+        active = np.array([i for i in range(lanes) if lane_plans[i] is not None], dtype=np.int64)
+        if len(active) == 0:
+            break
+        actions = np.array([lane_plans[i][0][lane_steps[i]] for i in active])
+        real = np.array([lane_plans[i][1][lane_steps[i]] for i in active])
+
+        # Truncate games at moves that are illegal under these rules
+        states = lane_states[active]
+        non_pass = actions != pass_idx
+        illegal = np.zeros(len(active), dtype=bool)
+        illegal[non_pass] = states[non_pass, govars.INVD_CHNL,
+                                   actions[non_pass] // board_size, actions[non_pass] % board_size] > 0
+        if illegal.any():
+            for lane in active[illegal]:
+                load(lane)
+            keep = ~illegal
+            active, actions, real, states = active[keep], actions[keep], real[keep], states[keep]
+
+        if len(active) > 0:
+            # Emit the positions before real moves
+            emit = np.nonzero(real)[0]
+            outcomes = lane_outcomes[active[emit]]
+            emit_states = states[emit]
+            if canonical:
+                outcomes = np.where(gogame.batch_turn(emit_states) == govars.WHITE, -outcomes, outcomes)
+                emit_states = gogame.batch_canonical_form(emit_states)
+            out_states.append(emit_states.astype(dtype))
+            out_actions.append(actions[emit])
+            out_outcomes.append(outcomes)
+            num_out += len(emit)
+
+            lane_states[active] = gogame.batch_next_states(states, actions)
+            lane_steps[active] += 1
+            for lane in active:
+                if lane_steps[lane] >= len(lane_plans[lane][0]):
+                    load(lane)
+
+        while num_out >= chunk_size:
+            chunk, out_states, out_actions, out_outcomes = _take(chunk_size, out_states, out_actions, out_outcomes)
+            num_out -= chunk_size
+            yield chunk
+
+    if num_out > 0:
+        chunk, _, _, _ = _take(num_out, out_states, out_actions, out_outcomes)
+        yield chunk
+
+
+def _take(n, *arrays_lists):
+    """
+    Splits the first n rows off of lists of arrays
+    :return: (tuple of the first n rows of each), then the remainders as single element lists
+    """
+    taken, remainders = [], []
+    for arrays in arrays_lists:
+        joined = np.concatenate(arrays)
+        taken.append(joined[:n])
+        remainders.append([joined[n:]])
+    return (tuple(taken), *remainders)
@@ -0,0 +1,623 @@
+"""
+Exact solver for small boards (3x3 from scratch, 4x4/5x5 endgames), e.g. for ground truth values to evaluate agents.
+
+Fail-soft alpha-beta over area scores, played on a flat padded board with in-place make/unmake instead of gogame's
+state copies. Positions are keyed by their Zobrist hash (hashing.zobrist_tables) in the canonical orientation, so all
+rotations/reflections share one transposition table entry, and moves that lead to symmetric positions are searched
+once. Positional superko is always on (otherwise games need not end), simple ko is a special case of it.
+
+The table keeps lower and upper bounds of the area difference, which does not depend on komi, and can be saved to an
+npz cache so solved positions are answered instantly later:
+
+    solver = Solver(4, komi=0.5, cache='solved_4x4.npz')
+    value, action = solver.solve(state)
+    solver.save()
+
+Superko makes results depend on how a position was reached (graph history interaction), so reusing them is kept exact:
+results that depend on a repetition of an earlier position are only reused on a path of the same positions, and other
+results only where their search could not have repeated any position before them. Each of those keeps its footprint,
+every position its search generated, up to MAX_FOOTPRINT, and is reused if the footprint misses the current path.
+Lower bounds only depend on the move that proved them, which keeps most footprints small in null window searches.
+"""
+import collections
+import math
+import os
+import sys
+
+import numpy as np
+
+from gym_go import gogame, govars, hashing
+
+CACHE_VERSION = 1
+EMPTY = 2
+EDGE = 3
+# Larger searches are only reused on a path of the same positions
+MAX_FOOTPRINT = 4096
+MAX_SAFE_CACHE = 1 << 20
+EMPTY_SET = frozenset()
+
+UINT64_MASK = (1 << 64) - 1
+
+Solution = collections.namedtuple('Solution', ['value', 'action'])
+
+
+def _mix(position_hash):
+    """
+    Splitmix64 finalizer. Zobrist hashes are linear, so the XOR of a few positions' hashes can equal another's, which
+    the path keys (sums of mixed hashes) avoid
+    """
+    z = ((position_hash ^ (position_hash >> 30)) * 0xbf58476d1ce4e5b9) & UINT64_MASK
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & UINT64_MASK
+    return z ^ (z >> 31)
+
+
+class SolverBudgetExceeded(RuntimeError):
+    pass
+
+
+class Solver:
+
+    def __init__(self, board_size, komi=0, cache=None, max_nodes=None, max_depth=10000):
+        '''
+        @param cache: Optional npz path of the transposition table, loaded if it exists and written by save
+        @param max_nodes: Optional budget of searched nodes per call
+        @param max_depth: Longest line searched (superko alone allows very long games)
+        Exceeding a budget raises SolverBudgetExceeded, the bounds found so far are kept
+        '''
+        self.board_size = board_size
+        self.komi = komi
+        self.cache = cache
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.table = {}
+        self._path_table = {}
+        # Benson's safe points of both players per position
+        self._safe_cache = {}
+        self.counters = {'nodes': 0, 'cache_hits': 0}
+        # Cutoffs per player and point, for move ordering
+        self._move_scores = [[0] * board_size ** 2 for _ in range(2)]
+
+        n = board_size
+        self._num_points = n ** 2
+        width = n + 2
+        # 1D location -> index on the padded board
+        self._points = [(r + 1) * width + c + 1 for r in range(n) for c in range(n)]
+        self._neighbors = [[p - width, p + width, p - 1, p + 1] for p in range(width ** 2)]
+        self._empty_board = [EDGE] * width ** 2
+        for p in self._points:
+            self._empty_board[p] = EMPTY
+
+        tables, turn_key = hashing.zobrist_tables(n)
+        self._keys = [[None] * width ** 2 for _ in range(2)]
+        for color in [govars.BLACK, govars.WHITE]:
+            for location, p in enumerate(self._points):
+                self._keys[color][p] = [int(key) for key in tables[:, color * n ** 2 + location]]
+        pass_rng = np.random.Generator(np.random.PCG64([hashing.ZOBRIST_SEED, n, 1]))
+        self._turn_keys = [0, int(turn_key)]
+        self._pass_key = int(pass_rng.integers(0, np.iinfo(np.uint64).max, dtype=np.uint64, endpoint=True))
+        perms, inverse_perms = hashing.symmetry_permutations(n)
+        self._perms = perms.tolist()
+        self._inverse_perms = inverse_perms.tolist()
+
+        if cache is not None and os.path.exists(cache):
+            self.load(cache)
+
+    def solve(self, state, history=None):
+        """
+        Bisects the score with null window searches, which share their bounds through the table
+        :param history: Optional positional hashes of the game's earlier positions (see GoEnv.position_hashes)
+        :return: Solution with the score (black area - white area - komi) under perfect play and a best action for
+        the player to move (None if the game ended)
+        """
+        lower, upper = -self._num_points, self._num_points
+        action = None
+        self._nodes = 0
+        while lower < upper:
+            middle = (lower + upper) // 2
+            difference, middle_action = self._solve_root(state, history, middle, middle + 1)
+            if difference > middle:
+                lower, action = difference, middle_action
+            else:
+                upper = difference
+                action = middle_action if action is None else action
+        return Solution(lower - self.komi, action)
+
+    def outcome(self, state, history=None):
+        """
+        Cheaper than solve, only finds who wins
+        :return: Solution with the result in black's perspective (1, 0 or -1) and an action that achieves it
+        """
+        self._nodes = 0
+        difference, action = self._solve_root(state, history, math.ceil(self.komi) - 1, math.floor(self.komi) + 1)
+        return Solution(int(np.sign(difference - self.komi)), action)
+
+    def lookup(self, state, history=None):
+        """
+        :return: The Solution from the table only, or None if the position is not solved
+        """
+        orientation = self._start(state, history)
+        color, passed = gogame.turn(state), gogame.prev_player_passed(state)
+        if gogame.game_ended(state):
+            return Solution(self._black_difference(self._score(color), color) - self.komi, None)
+        key, key_orientation = self._key(color, passed)
+        entry = self.table.get(key)
+        if self._banned or entry is None or entry[0] != entry[1] or not self._reusable(entry, passed):
+            return None
+        return Solution(self._black_difference(entry[0], color) - self.komi,
+                        self._action(self._action(entry[2], key_orientation), orientation))
+
+    def save(self, path=None):
+        """
+        Writes the table to path (defaults to the cache). Results that only hold on their path are not saved
+        """
+        path = self.cache if path is None else path
+        entries = list(self.table.values())
+        bounds = np.array([entry[:3] for entry in entries], dtype=np.int16).reshape(-1, 3)
+        # Footprints are concatenated, -1 for the ones that were too large
+        footprint_sizes = np.array([-1 if entry[3] is None else len(entry[3]) for entry in entries], dtype=np.int32)
+        footprints = np.fromiter((h for entry in entries if entry[3] is not None for h in entry[3]), dtype=np.uint64,
+                                 count=int(np.sum(np.maximum(footprint_sizes, 0))))
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, version=CACHE_VERSION, board_size=self.board_size,
+                 keys=np.fromiter(self.table, dtype=np.uint64, count=len(self.table)),
+                 lower=bounds[:, 0], upper=bounds[:, 1], moves=bounds[:, 2],
+                 path_keys=np.fromiter((entry[5] for entry in entries), dtype=np.uint64, count=len(entries)),
+                 footprint_sizes=footprint_sizes, footprints=footprints)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        with np.load(path) as cache:
+            if int(cache['version']) != CACHE_VERSION:
+                raise ValueError('Unsupported solver cache version {}'.format(int(cache['version'])))
+            if int(cache['board_size']) != self.board_size:
+                raise ValueError('Solver cache has board size {}'.format(int(cache['board_size'])))
+            sizes, hashes = cache['footprint_sizes'].tolist(), cache['footprints'].tolist()
+            footprints, start = [], 0
+            for size in sizes:
+                footprints.append(None if size < 0 else frozenset(hashes[start:start + size]))
+                start += max(size, 0)
+            entries = zip(cache['lower'].tolist(), cache['upper'].tolist(), cache['moves'].tolist(), footprints,
+                          [EMPTY_SET] * len(sizes), cache['path_keys'].tolist())
+            self.table.update(zip(cache['keys'].tolist(), entries))
+
+    def _solve_root(self, state, history, lower, upper):
+        """
+        :param lower, upper: Search window on black's area difference
+        :return: Fail-soft black area difference and the best action found
+        """
+        orientation = self._start(state, history)
+        color, passed = gogame.turn(state), gogame.prev_player_passed(state)
+        if gogame.game_ended(state):
+            return self._black_difference(self._score(color), color), None
+        self._root_action = None
+
+        alpha, beta = (lower, upper) if color == govars.BLACK else (-upper, -lower)
+        start_nodes = self._nodes
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, self.max_depth + 1000))
+        try:
+            value, _, _ = self._search(color, passed, 0, alpha, beta)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+            self.counters['nodes'] += self._nodes - start_nodes
+        return self._black_difference(value, color), self._action(self._root_action, orientation)
+
+    def _start(self, state, history):
+        """
+        Loads the state, turned to its canonical orientation unless there is a history (whose positions are only known
+        in their own orientation), so results at the root are found from every orientation
+        :return: The orientation of the loaded position
+        """
+        self._history = set() if history is None else set(history)
+        self._load_state(state)
+        orientation = 0
+        if not self._history:
+            orientation = self._hashes.index(min(self._hashes))
+            state = gogame.all_symmetries(state)[orientation]
+            self._load_state(state)
+        # Moves only ruled out by the state (ko), which the table cannot tell apart
+        valid = gogame.valid_moves(state)[:-1]
+        self._banned = {location for location, p in enumerate(self._points)
+                        if not valid[location] and self._board[p] == EMPTY}
+
+        # Latest depth of each position on the path, and the symmetries shared by all of them
+        self._seen = {self._hashes[0]: 0}
+        self._path_symmetries = [] if self._history else self._symmetries(range(1, 8))
+        # Order independent key of the positions on the path
+        self._path_key = sum(map(_mix, self._history | {self._hashes[0]})) & UINT64_MASK
+        return orientation
+
+    def _search(self, color, passed, depth, alpha, beta):
+        """
+        :return: Fail-soft area difference in color's perspective, the earlier positions on the path (or of the
+        history) that the search below repeated, which the result depends on, and its footprint: the positional
+        hashes of every position it generated in all orientations, or None if there were more than MAX_FOOTPRINT
+        """
+        self._nodes += 1
+        if self.max_nodes is not None and self._nodes > self.max_nodes:
+            raise SolverBudgetExceeded('Exceeded {} nodes'.format(self.max_nodes))
+        if depth > self.max_depth:
+            raise SolverBudgetExceeded('Exceeded a depth of {}'.format(self.max_depth))
+
+        hashes = self._hashes
+        key, orientation = self._key(color, passed)
+        root = depth == 0
+        path_key = self._path_key
+        entry, repeated = self.table.get(key), EMPTY_SET
+        # A result stored elsewhere still gives a good first move
+        table_move = None if entry is None else self._action(entry[2], orientation)
+        if entry is None or not self._reusable(entry, passed):
+            entry = self._path_table.get((key, path_key))
+        if entry is not None:
+            table_move = self._action(entry[2], orientation)
+            # Ko at the root is not part of the position
+            if root and self._banned:
+                entry = None
+            else:
+                lower, upper, _, footprint, repeated, _ = entry
+                self.counters['cache_hits'] += 1
+                if lower >= beta or upper <= alpha or lower == upper:
+                    if root:
+                        self._root_action = table_move
+                    return (lower if lower >= beta or lower == upper else upper), repeated, footprint
+                alpha, beta = max(alpha, lower), min(beta, upper)
+
+        num_points = self._num_points
+        safe = self._safe_cache.get(hashes[0])
+        if safe is None:
+            if len(self._safe_cache) >= MAX_SAFE_CACHE:
+                self._safe_cache.clear()
+            safe = self._safe_cache[hashes[0]] = (self._safe_points(govars.BLACK), self._safe_points(govars.WHITE))
+        own_safe, opponent_safe = safe[color], safe[1 - color]
+        if not root:
+            # Static bounds from the unconditionally safe points of both players
+            lower = 2 * len(own_safe) - num_points
+            upper = num_points - 2 * len(opponent_safe)
+            if lower >= beta or upper <= alpha or lower == upper:
+                return (lower if lower >= beta or lower == upper else upper), EMPTY_SET, EMPTY_SET
+        settled = own_safe | opponent_safe
+
+        # Moves to points that are equivalent by a symmetry of the whole path lead to equivalent subtrees
+        path_symmetries = self._path_symmetries
+        searched_alpha = alpha
+        best, best_move = -num_points - 1, num_points
+        # Bounds from the table only hold for the positions their search repeated and generated
+        known_repeated, known_footprint = repeated, EMPTY_SET if entry is None else entry[3]
+        repeated, footprint = set(repeated), None if known_footprint is None else set(known_footprint)
+        for move in self._ordered_moves(color, passed, table_move):
+            generated = EMPTY_SET
+            if move == num_points:
+                if passed:
+                    value, child_repeated, child_footprint = self._score(color), EMPTY_SET, EMPTY_SET
+                else:
+                    position_hash = hashes[0]
+                    self._seen[position_hash] = depth + 1
+                    value, child_repeated, child_footprint = self._search(1 - color, True, depth + 1, -beta, -alpha)
+                    value = -value
+                    self._seen[position_hash] = depth
+            else:
+                if self._points[move] in settled:
+                    continue
+                if root and move in self._banned:
+                    continue
+                if path_symmetries and any(self._inverse_perms[k][move] < move for k in path_symmetries):
+                    continue
+                p = self._points[move]
+                captured = self._play(p, color)
+                if captured is None:
+                    continue
+                position_hash = self._hashes[0]
+                generated = self._hashes
+                if position_hash in self._seen or position_hash in self._history:
+                    # Positional superko
+                    repeated.add(position_hash)
+                    if footprint is not None:
+                        footprint.update(generated)
+                    self._undo(p, color, captured)
+                    continue
+                self._seen[position_hash] = depth + 1
+                self._path_key = (path_key + _mix(position_hash)) & UINT64_MASK
+                self._path_symmetries = self._symmetries(path_symmetries) if path_symmetries else path_symmetries
+                value, child_repeated, child_footprint = self._search(1 - color, False, depth + 1, -beta, -alpha)
+                value = -value
+                self._path_symmetries = path_symmetries
+                self._path_key = path_key
+                del self._seen[position_hash]
+                self._undo(p, color, captured)
+
+            if value >= beta:
+                # A lower bound only depends on the move that proves it
+                repeated = set(known_repeated) | child_repeated
+                footprint = None if known_footprint is None or child_footprint is None else \
+                    set(known_footprint) | child_footprint
+            else:
+                repeated.update(child_repeated)
+                if child_footprint is None:
+                    footprint = None
+                elif footprint is not None:
+                    footprint.update(child_footprint)
+            if footprint is not None:
+                footprint.update(generated)
+                if len(footprint) > MAX_FOOTPRINT:
+                    footprint = None
+            if value > best:
+                best, best_move = value, move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        if move < num_points:
+                            self._move_scores[color][move] += 1
+                        break
+
+        if root:
+            self._root_action = best_move
+        # Repetitions of this position or later ones are the same wherever it is reached (a pass repeats the position
+        # of the parent, which is updated to the later depth)
+        seen = self._seen
+        repeated = frozenset(h for h in repeated if seen.get(h, -1) < depth)
+        footprint = None if footprint is None else frozenset(footprint)
+        if not (root and self._banned):
+            lower, upper = (entry[0], entry[1]) if entry is not None else (-num_points, num_points)
+            if best <= searched_alpha:
+                upper = min(upper, best)
+            elif best >= beta:
+                lower = max(lower, best)
+            else:
+                lower = upper = best
+            canonical_move = best_move if best_move == num_points else self._inverse_perms[orientation][best_move]
+            if repeated:
+                # Only holds on a path of the same positions
+                self._path_table[key, path_key] = (lower, upper, canonical_move, None, repeated, path_key)
+            else:
+                self.table[key] = (lower, upper, canonical_move, footprint, repeated, path_key)
+        return best, repeated, footprint
+
+    def _reusable(self, entry, passed):
+        """
+        Whether a stored result holds on the current path: if it was stored on a path of the same positions, or if its
+        search never generated any position from before this node (which it could repeat here, but not there)
+        """
+        if entry[5] == self._path_key:
+            return True
+        footprint = entry[3]
+        if footprint is None:
+            return False
+        if footprint.isdisjoint(self._seen) and footprint.isdisjoint(self._history):
+            return True
+        # After a pass, the position itself was already on the path
+        current = self._hashes[0]
+        return not passed and all(position_hash == current or position_hash not in footprint
+                                  for path in [self._seen, self._history] for position_hash in path)
+
+    def _symmetries(self, candidates):
+        """
+        :return: The symmetries among candidates that leave the loaded position unchanged
+        """
+        hashes = self._hashes
+        return [k for k in candidates if hashes[k] == hashes[0]]
+
+    def _ordered_moves(self, color, passed, table_move):
+        """
+        The table's move first, then empty points by how often they caused cutoffs and passing, which ends the game
+        after the opponent passed so it is tried first then. Self-atari and filling own single point eyes come after
+        passing, which keeps the first lines short
+        """
+        board = self._board
+        neighbors = self._neighbors
+        scores = self._move_scores[color]
+        moves, last = [], []
+        for location, p in enumerate(self._points):
+            if board[p] != EMPTY:
+                continue
+            empty_neighbors = 0
+            own_eye = True
+            for q in neighbors[p]:
+                if board[q] == EMPTY:
+                    empty_neighbors += 1
+                if board[q] != color and board[q] != EDGE:
+                    own_eye = False
+            if own_eye:
+                last.append(location)
+            elif empty_neighbors < 2 and self._self_atari(p, color):
+                last.insert(0, location)
+            else:
+                moves.append(location)
+        moves.sort(key=scores.__getitem__, reverse=True)
+        moves = [self._num_points] + moves + last if passed else moves + [self._num_points] + last
+        if table_move is not None:
+            moves.remove(table_move)
+            moves.insert(0, table_move)
+        return moves
+
+    def _self_atari(self, p, color):
+        """
+        :return: Whether the stone would be left in atari without capturing (True for suicide)
+        """
+        captured = self._play(p, color)
+        if captured is None:
+            return True
+        atari = not captured and self._liberties(p, 2) < 2
+        self._undo(p, color, captured)
+        return atari
+
+    def _play(self, p, color):
+        """
+        Places a stone and removes the opponent groups it captures
+        :return: The captured points, or None (and nothing changed) if the move is suicide
+        """
+        board = self._board
+        board[p] = color
+        self._toggle(color, p)
+        opponent = 1 - color
+        captured = []
+        for q in self._neighbors[p]:
+            if board[q] == opponent and not self._has_liberty(q):
+                group = self._group(q)
+                for s in group:
+                    board[s] = EMPTY
+                    self._toggle(opponent, s)
+                captured.extend(group)
+        if not captured and not self._has_liberty(p):
+            board[p] = EMPTY
+            self._toggle(color, p)
+            return None
+        return captured
+
+    def _undo(self, p, color, captured):
+        board = self._board
+        board[p] = EMPTY
+        self._toggle(color, p)
+        opponent = 1 - color
+        for s in captured:
+            board[s] = opponent
+            self._toggle(opponent, s)
+
+    def _toggle(self, color, p):
+        self._hashes = [h ^ key for h, key in zip(self._hashes, self._keys[color][p])]
+
+    def _group(self, p):
+        board = self._board
+        color = board[p]
+        group, frontier = {p}, [p]
+        while frontier:
+            for q in self._neighbors[frontier.pop()]:
+                if board[q] == color and q not in group:
+                    group.add(q)
+                    frontier.append(q)
+        return list(group)
+
+    def _has_liberty(self, p):
+        return self._liberties(p, 1) > 0
+
+    def _liberties(self, p, limit):
+        """
+        :return: Liberties of the group on p, counting up to limit
+        """
+        board = self._board
+        color = board[p]
+        group, frontier, liberties = {p}, [p], set()
+        while frontier:
+            for q in self._neighbors[frontier.pop()]:
+                if board[q] == EMPTY:
+                    liberties.add(q)
+                    if len(liberties) >= limit:
+                        return limit
+                elif board[q] == color and q not in group:
+                    group.add(q)
+                    frontier.append(q)
+        return len(liberties)
+
+    def _safe_points(self, color):
+        """
+        Benson's algorithm: chains that cannot be captured even if the opponent plays every move, and the regions
+        enclosed by them that are empty and small enough that the opponent cannot live inside
+        :return: Set of the points in both
+        """
+        board = self._board
+        neighbors = self._neighbors
+        chain_of, chains = {}, []
+        for p in self._points:
+            if board[p] == color and p not in chain_of:
+                chain = self._group(p)
+                for s in chain:
+                    chain_of[s] = len(chains)
+                chains.append(chain)
+        if not chains:
+            return set()
+
+        region_of, regions, bordering, vital, empty = {}, [], [], [], []
+        for p in self._points:
+            if board[p] == color or p in region_of:
+                continue
+            region, frontier = [p], [p]
+            region_of[p] = len(regions)
+            border, region_vital, region_empty = set(), None, True
+            while frontier:
+                q = frontier.pop()
+                adjacent = {chain_of[r] for r in neighbors[q] if board[r] == color}
+                border |= adjacent
+                if board[q] != EMPTY:
+                    region_empty = False
+                else:
+                    # The region is vital to the chains next to each of its empty points
+                    region_vital = adjacent if region_vital is None else region_vital & adjacent
+                for r in neighbors[q]:
+                    if board[r] != color and board[r] != EDGE and r not in region_of:
+                        region_of[r] = len(regions)
+                        region.append(r)
+                        frontier.append(r)
+            regions.append(region)
+            bordering.append(border)
+            vital.append(border if region_vital is None else region_vital)
+            empty.append(region_empty)
+
+        alive, healthy = set(range(len(chains))), set(range(len(regions)))
+        changed = True
+        while changed:
+            changed = False
+            for x in list(alive):
+                if sum(1 for r in healthy if x in vital[r]) < 2:
+                    alive.remove(x)
+                    changed = True
+            for r in list(healthy):
+                if not bordering[r] <= alive:
+                    healthy.remove(r)
+                    changed = True
+        safe = set()
+        for x in alive:
+            safe.update(chains[x])
+        for r in healthy:
+            if empty[r] and vital[r] & alive:
+                safe.update(regions[r])
+        return safe
+
+    def _score(self, color):
+        """
+        :return: Area difference in color's perspective, scored like gogame.areas
+        """
+        board = self._board
+        areas = [0, 0]
+        visited = set()
+        for p in self._points:
+            if board[p] < EMPTY:
+                areas[board[p]] += 1
+            elif p not in visited:
+                region, frontier, borders = 1, [p], set()
+                visited.add(p)
+                while frontier:
+                    for q in self._neighbors[frontier.pop()]:
+                        if board[q] == EMPTY and q not in visited:
+                            visited.add(q)
+                            frontier.append(q)
+                            region += 1
+                        elif board[q] < EMPTY:
+                            borders.add(board[q])
+                if len(borders) == 1:
+                    areas[borders.pop()] += region
+        return areas[color] - areas[1 - color]
+
+    def _load_state(self, state):
+        self._board = list(self._empty_board)
+        self._hashes = [0] * 8
+        for color in [govars.BLACK, govars.WHITE]:
+            for location in np.flatnonzero(state[color]):
+                p = self._points[location]
+                self._board[p] = color
+                self._toggle(color, p)
+
+    def _key(self, color, passed):
+        """
+        :return: Table key of the loaded position and its canonical orientation
+        """
+        board_hash = min(self._hashes)
+        key = board_hash ^ self._turn_keys[color] ^ (self._pass_key if passed else 0)
+        return key, self._hashes.index(board_hash)
+
+    def _action(self, canonical_move, orientation):
+        if canonical_move == self._num_points:
+            return canonical_move
+        return self._perms[orientation][canonical_move]
+
+    @staticmethod
+    def _black_difference(difference, color):
+        return difference if color == govars.BLACK else -difference
@@ -0,0 +1,104 @@
+"""
+Pools of start positions for curricula, e.g. to train on endgames without replaying the openings that lead to them.
+
+    pool = StartStatePool(PositionDataset('selfplay/'), min_stones=40, seed=0)
+    envs.reset_to(np.arange(envs.num_envs), pool.sample(envs.num_envs))
+    while training:
+        observations, rewards, dones, info = envs.step(actions)
+        pool.refill(envs)
+
+Positions are used as stored. Self-play datasets hold canonical states, where the player to move has the black
+stones, so with komi the player to move of a restarted game is the one that has to overcome it.
+"""
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.dataset import PositionDataset
+from gym_go.position_index import PositionIndex
+
+
+class StartStatePool:
+    """
+    Samples start states from an array of states, a dataset.PositionDataset or a position_index.PositionIndex.
+    Every sampled state gets a random dihedral symmetry.
+    """
+
+    def __init__(self, source, min_stones=0, max_stones=None, min_visits=1, random_symmetry=True, max_tries=100,
+                 seed=None):
+        '''
+        @param source: (N, NUM_CHNLS, SIZE, SIZE) states, a PositionDataset or a PositionIndex
+        (sampled proportionally to visits)
+        @param min_stones, max_stones: Only positions with this many stones on the board are sampled,
+        e.g. a min_stones near the board's area for an endgame curriculum. Ended games are never sampled
+        @param min_visits: Filters rare positions of a PositionIndex
+        @param max_tries: Draws from a dataset or index before sample gives up on the filters
+        @param seed: None, an int, a SeedSequence or a Generator for sampling
+        '''
+        self.min_stones = min_stones
+        self.max_stones = max_stones
+        self.min_visits = min_visits
+        self.random_symmetry = random_symmetry
+        self.max_tries = max_tries
+        self.rng = gogame.make_rng(seed)
+
+        if isinstance(source, (PositionDataset, PositionIndex)):
+            self.source = source
+            self.board_size = source.board_size
+        else:
+            states = np.asarray(source)
+            assert states.ndim == 4 and states.shape[1] == govars.NUM_CHNLS, states.shape
+            # Arrays are filtered once up front
+            self.source = states[self._accept(states)]
+            self.board_size = states.shape[-1]
+            if len(self.source) == 0:
+                raise ValueError('No start states pass the filters')
+
+    def _accept(self, states):
+        stones = np.sum(states[:, [govars.BLACK, govars.WHITE]], axis=(1, 2, 3))
+        accept = (gogame.batch_game_ended(states) == 0) & (stones >= self.min_stones)
+        if self.max_stones is not None:
+            accept &= stones <= self.max_stones
+        return accept
+
+    def _draw(self, n):
+        if isinstance(self.source, PositionDataset):
+            return self.source.sample(n, self.rng)[0]
+        if isinstance(self.source, PositionIndex):
+            return self.source.sample(n, self.rng, self.min_visits, random_symmetry=False)
+        return self.source[self.rng.integers(0, len(self.source), size=n)]
+
+    def sample(self, n):
+        """
+        :return: (n, NUM_CHNLS, SIZE, SIZE) float64 start states
+        """
+        if isinstance(self.source, np.ndarray):
+            states = self._draw(n)
+        else:
+            # Rejection sampling, drawing twice what is still missing per try
+            chunks, count = [], 0
+            for _ in range(self.max_tries):
+                if count >= n:
+                    break
+                states = self._draw(2 * (n - count))
+                states = states[self._accept(states)]
+                chunks.append(states)
+                count += len(states)
+            if count < n:
+                raise ValueError('Too few start states pass the filters, {} of {}'.format(count, n))
+            states = np.concatenate(chunks)[:n]
+
+        states = states.astype(np.float64)
+        if self.random_symmetry:
+            states = gogame.batch_symmetries(states, self.rng.integers(0, 8, size=n))
+        return states
+
+    def refill(self, envs):
+        """
+        Restarts every finished game of a GoVecEnv from a sampled start state, in one reset_to
+        :return: Indices of the restarted games
+        """
+        assert envs.size == self.board_size
+        indices = np.nonzero(envs.dones)[0]
+        if len(indices) > 0:
+            envs.reset_to(indices, self.sample(len(indices)))
+        return indices
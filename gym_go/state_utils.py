@@ -1,8 +1,8 @@
 import numpy as np
 from scipy import ndimage
-from scipy.ndimage import measurements
 
 from gym_go import govars
+from gym_go.profiling import instrumented
 
 group_struct = np.array([[[0, 0, 0],
                           [0, 0, 0],
@@ -21,6 +21,84 @@ surround_struct = np.array([[0, 1, 0],
 neighbor_deltas = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]])
 
 
+@instrumented('labelling', 'groups')
+def label_groups(pieces, structure=None):
+    """
+    Connected components of the pieces. All group labelling goes through here.
+    :return: labels, number of groups
+    """
+    return ndimage.label(pieces, structure)
+
+
+def shift_neighbors(batch_images, fill=0):
+    """
+    :param batch_images: (BATCH_SIZE, SIZE, SIZE)
+    :return: (4, BATCH_SIZE, SIZE, SIZE) values of the up, down, left and right neighbor of every point,
+    fill off the board
+    """
+    neighbors = np.full((4, *batch_images.shape), fill, dtype=batch_images.dtype)
+    neighbors[0, :, 1:] = batch_images[:, :-1]
+    neighbors[1, :, :-1] = batch_images[:, 1:]
+    neighbors[2, :, :, 1:] = batch_images[:, :, :-1]
+    neighbors[3, :, :, :-1] = batch_images[:, :, 1:]
+    return neighbors
+
+
+def batch_influence(batch_blacks, batch_whites, dilations=5, erosions=21):
+    """
+    Bouzy's dilation/erosion influence map. Stones start at +128 (black) and -128 (white). A dilation grows every
+    point that no opposing point touches by its number of same-sign neighbors, an erosion shrinks every point
+    towards 0 by its number of neighbors that are 0 or of the other sign. Each step is a fixed number of shifted
+    array operations over the whole batch
+    :param batch_blacks, batch_whites: (BATCH_SIZE, SIZE, SIZE)
+    :return: (BATCH_SIZE, SIZE, SIZE) int32 influence, positive for black
+    """
+    influence = 128 * (batch_blacks.astype(np.int32) - batch_whites.astype(np.int32))
+    on_board = shift_neighbors(np.ones_like(influence))
+    for _ in range(dilations):
+        neighbors = shift_neighbors(influence)
+        positive, negative = neighbors > 0, neighbors < 0
+        influence = influence + np.where((influence >= 0) & ~negative.any(axis=0), positive.sum(axis=0), 0) \
+                    - np.where((influence <= 0) & ~positive.any(axis=0), negative.sum(axis=0), 0)
+    for _ in range(erosions):
+        neighbors = shift_neighbors(influence)
+        eroded = np.where(influence > 0, np.maximum(influence - np.sum((neighbors <= 0) & on_board, axis=0), 0),
+                          influence)
+        influence = np.where(influence < 0, np.minimum(influence + np.sum((neighbors >= 0) & on_board, axis=0), 0),
+                             eroded)
+    return influence
+
+
+def batch_group_liberties(batch_pieces, batch_empties):
+    """
+    Liberty counts of every group in the batch at once, without expanding groups into their own channels
+    :param batch_pieces: (BATCH_SIZE, SIZE, SIZE) stones of one player per board
+    :param batch_empties: (BATCH_SIZE, SIZE, SIZE)
+    :return: labels (BATCH_SIZE, SIZE, SIZE), unique across the batch with 0 for no group,
+    and liberty counts indexed by label
+    """
+    batch_labels, num_groups = label_groups(batch_pieces, group_struct)
+    neighbor_labels = shift_neighbors(batch_labels)
+
+    # Each liberty counts once per group, even if the group touches it from several sides
+    num_points = batch_labels.size
+    points = np.arange(num_points).reshape(batch_labels.shape)
+    adjacent = (neighbor_labels > 0) & (batch_empties > 0)
+    points = np.broadcast_to(points, adjacent.shape)
+    pairs = np.unique(neighbor_labels[adjacent].astype(np.int64) * num_points + points[adjacent])
+    liberties = np.bincount(pairs // num_points, minlength=num_groups + 1)
+    return batch_labels, liberties
+
+
+def batch_single_point_eyes(batch_pieces, batch_empties):
+    """
+    :return: (BATCH_SIZE, SIZE, SIZE) bool, empty points whose on-board neighbors are all the given pieces
+    """
+    neighbors = ndimage.convolve(batch_pieces, surround_struct[np.newaxis], mode='constant', cval=1)
+    return (batch_empties > 0) & (neighbors == 4)
+
+
+@instrumented('invalid_moves')
 def compute_invalid_moves(state, player, ko_protect=None):
     """
     Updates invalid moves in the OPPONENT's perspective
@@ -45,8 +123,8 @@ def compute_invalid_moves(state, player, ko_protect=None):
     definite_valids_array = np.zeros(state.shape[1:])
 
     # Get all groups
-    all_own_groups, num_own_groups = measurements.label(state[player])
-    all_opp_groups, num_opp_groups = measurements.label(state[1 - player])
+    all_own_groups, num_own_groups = label_groups(state[player])
+    all_opp_groups, num_opp_groups = label_groups(state[1 - player])
     expanded_own_groups = np.zeros((num_own_groups, *state.shape[1:]))
     expanded_opp_groups = np.zeros((num_opp_groups, *state.shape[1:]))
 
@@ -83,6 +161,7 @@ def compute_invalid_moves(state, player, ko_protect=None):
     return invalid_moves > 0
 
 
+@instrumented('invalid_moves')
 def batch_compute_invalid_moves(batch_state, batch_player, batch_ko_protect):
     """
     Updates invalid moves in the OPPONENT's perspective
@@ -96,6 +175,7 @@ def batch_compute_invalid_moves(batch_state, batch_player, batch_ko_protect):
             not adjacent to other groups with more than one liberty and is completely surrounded
         ii.) If it's surrounded by our pieces and all of those corresponding groups
             move more than one liberty
+    Same rules as compute_invalid_moves, but with the liberties of every group in the batch counted at once
     """
     batch_idcs = np.arange(len(batch_state))
 
@@ -103,59 +183,33 @@ def batch_compute_invalid_moves(batch_state, batch_player, batch_ko_protect):
     batch_all_pieces = np.sum(batch_state[:, [govars.BLACK, govars.WHITE]], axis=1)
     batch_empties = 1 - batch_all_pieces
 
-    # Setup invalid and valid arrays
-    batch_possible_invalid_array = np.zeros(batch_state.shape[:1] + batch_state.shape[2:])
-    batch_definite_valids_array = np.zeros(batch_state.shape[:1] + batch_state.shape[2:])
+    # Get all groups and the liberties of the groups next to every point
+    own_groups, own_liberties = batch_group_liberties(batch_state[batch_idcs, batch_player], batch_empties)
+    opp_groups, opp_liberties = batch_group_liberties(batch_state[batch_idcs, 1 - batch_player], batch_empties)
+    own_neighbors, opp_neighbors = shift_neighbors(own_groups), shift_neighbors(opp_groups)
+    own_neighbor_liberties = own_liberties[own_neighbors]
+    opp_neighbor_liberties = opp_liberties[opp_neighbors]
 
-    # Get all groups
-    batch_all_own_groups, _ = measurements.label(batch_state[batch_idcs, batch_player], group_struct)
-    batch_all_opp_groups, _ = measurements.label(batch_state[batch_idcs, 1 - batch_player], group_struct)
-
-    batch_data = enumerate(zip(batch_all_own_groups, batch_all_opp_groups, batch_empties))
-    for i, (all_own_groups, all_opp_groups, empties) in batch_data:
-        own_labels = np.unique(all_own_groups)
-        opp_labels = np.unique(all_opp_groups)
-        own_labels = own_labels[np.nonzero(own_labels)]
-        opp_labels = opp_labels[np.nonzero(opp_labels)]
-        expanded_own_groups = np.zeros((len(own_labels), *all_own_groups.shape))
-        expanded_opp_groups = np.zeros((len(opp_labels), *all_opp_groups.shape))
-
-        # Expand the groups such that each group is in its own channel
-        for j, label in enumerate(own_labels):
-            expanded_own_groups[j] = all_own_groups == label
-
-        for j, label in enumerate(opp_labels):
-            expanded_opp_groups[j] = all_opp_groups == label
-
-        # Get all liberties in the expanded form
-        all_own_liberties = empties[np.newaxis] * ndimage.binary_dilation(expanded_own_groups,
-                                                                          surround_struct[np.newaxis])
-        all_opp_liberties = empties[np.newaxis] * ndimage.binary_dilation(expanded_opp_groups,
-                                                                          surround_struct[np.newaxis])
-
-        own_liberty_counts = np.sum(all_own_liberties, axis=(1, 2))
-        opp_liberty_counts = np.sum(all_opp_liberties, axis=(1, 2))
-
-        # Possible invalids are on single liberties of opponent groups and on multi-liberties of own groups
-        # Definite valids are on single liberties of own groups, multi-liberties of opponent groups
-        # or you are not surrounded
-        batch_possible_invalid_array[i] += np.sum(all_own_liberties[own_liberty_counts > 1], axis=0)
-        batch_possible_invalid_array[i] += np.sum(all_opp_liberties[opp_liberty_counts == 1], axis=0)
-
-        batch_definite_valids_array[i] += np.sum(all_own_liberties[own_liberty_counts == 1], axis=0)
-        batch_definite_valids_array[i] += np.sum(all_opp_liberties[opp_liberty_counts > 1], axis=0)
+    # Possible invalids are on single liberties of opponent groups and on multi-liberties of own groups
+    # Definite valids are on single liberties of own groups, multi-liberties of opponent groups
+    # or you are not surrounded
+    possible_invalid = np.any((own_neighbors > 0) & (own_neighbor_liberties > 1), axis=0) \
+                       | np.any((opp_neighbors > 0) & (opp_neighbor_liberties == 1), axis=0)
+    definite_valid = np.any((own_neighbors > 0) & (own_neighbor_liberties == 1), axis=0) \
+                     | np.any((opp_neighbors > 0) & (opp_neighbor_liberties > 1), axis=0)
 
     # All invalid moves are occupied spaces + (possible invalids minus the definite valids and it's surrounded)
     surrounded = ndimage.convolve(batch_all_pieces, surround_struct[np.newaxis], mode='constant', cval=1) == 4
-    invalid_moves = batch_all_pieces + batch_possible_invalid_array * (batch_definite_valids_array == 0) * surrounded
+    invalid_moves = (batch_all_pieces > 0) | ((batch_empties > 0) & possible_invalid & ~definite_valid & surrounded)
 
     # Ko-protection
     for i, ko_protect in enumerate(batch_ko_protect):
         if ko_protect is not None:
-            invalid_moves[i, ko_protect[0], ko_protect[1]] = 1
-    return invalid_moves > 0
+            invalid_moves[i, ko_protect[0], ko_protect[1]] = True
+    return invalid_moves
 
 
+@instrumented('capture', 'captures')
 def update_pieces(state, adj_locs, player):
     opponent = 1 - player
     killed_groups = []
@@ -163,7 +217,7 @@ def update_pieces(state, adj_locs, player):
     all_pieces = np.sum(state[[govars.BLACK, govars.WHITE]], axis=0)
     empties = 1 - all_pieces
 
-    all_opp_groups, _ = ndimage.measurements.label(state[opponent])
+    all_opp_groups, _ = label_groups(state[opponent])
 
     # Go through opponent groups
     all_adj_labels = all_opp_groups[adj_locs[:, 0], adj_locs[:, 1]]
@@ -180,37 +234,39 @@ def update_pieces(state, adj_locs, player):
     return killed_groups
 
 
+@instrumented('capture', 'batch_captures')
 def batch_update_pieces(batch_non_pass, batch_state, batch_adj_locs, batch_player):
+    """
+    Removes the opponent groups next to the new stones that have no liberties left
+    :param batch_adj_locs: (len(batch_non_pass), 4, 2) neighbors of the new stones, see batch_adj_data
+    :return: Per non-pass state, the list of locations of every killed group
+    """
+    n = len(batch_non_pass)
     batch_opponent = 1 - batch_player
-    batch_killed_groups = []
 
-    batch_all_pieces = np.sum(batch_state[:, [govars.BLACK, govars.WHITE]], axis=1)
+    batch_all_pieces = np.sum(batch_state[batch_non_pass][:, [govars.BLACK, govars.WHITE]], axis=1)
     batch_empties = 1 - batch_all_pieces
 
-    batch_all_opp_groups, _ = ndimage.measurements.label(batch_state[batch_non_pass, batch_opponent],
-                                                         group_struct)
-
-    batch_data = enumerate(zip(batch_all_opp_groups, batch_all_pieces, batch_empties, batch_adj_locs, batch_opponent))
-    for i, (all_opp_groups, all_pieces, empties, adj_locs, opponent) in batch_data:
-        killed_groups = []
-
-        # Go through opponent groups
-        all_adj_labels = all_opp_groups[adj_locs[:, 0], adj_locs[:, 1]]
-        all_adj_labels = np.unique(all_adj_labels)
-        for opp_group_idx in all_adj_labels[np.nonzero(all_adj_labels)]:
-            opp_group = all_opp_groups == opp_group_idx
-            liberties = empties * ndimage.binary_dilation(opp_group)
-            if np.sum(liberties) <= 0:
-                # Killed group
-                opp_group_locs = np.argwhere(opp_group)
-                batch_state[batch_non_pass[i], opponent, opp_group_locs[:, 0], opp_group_locs[:, 1]] = 0
-                killed_groups.append(opp_group_locs)
-
-        batch_killed_groups.append(killed_groups)
+    # Liberties of all opponent groups at once
+    batch_opp_pieces = batch_state[batch_non_pass, batch_opponent]
+    batch_all_opp_groups, opp_liberties = batch_group_liberties(batch_opp_pieces, batch_empties)
+    adj_labels = batch_all_opp_groups[np.arange(n)[:, np.newaxis], batch_adj_locs[:, :, 0], batch_adj_locs[:, :, 1]]
+    killed = (adj_labels > 0) & (opp_liberties[adj_labels] <= 0)
+
+    # Only the killed groups are handled one by one
+    batch_killed_groups = [[] for _ in range(n)]
+    if killed.any():
+        killed_labels = np.unique(adj_labels[killed])
+        batch_opp_pieces[np.isin(batch_all_opp_groups, killed_labels)] = 0
+        batch_state[batch_non_pass, batch_opponent] = batch_opp_pieces
+        for label in killed_labels:
+            i = np.argmax(np.any(adj_labels == label, axis=1))
+            batch_killed_groups[i].append(np.argwhere(batch_all_opp_groups[i] == label))
 
     return batch_killed_groups
 
 
+@instrumented('adjacency')
 def adj_data(state, action2d, player):
     neighbors = neighbor_deltas + action2d
     valid = (neighbors >= 0) & (neighbors < state.shape[1])
@@ -223,13 +279,22 @@ def adj_data(state, action2d, player):
     return neighbors, surrounded
 
 
+@instrumented('adjacency')
 def batch_adj_data(batch_state, batch_action2d, batch_player):
-    batch_neighbors, batch_surrounded = [], []
-    for state, action2d, player in zip(batch_state, batch_action2d, batch_player):
-        neighbors, surrounded = adj_data(state, action2d, player)
-        batch_neighbors.append(neighbors)
-        batch_surrounded.append(surrounded)
-    return batch_neighbors, batch_surrounded
+    """
+    :return: (BATCH_SIZE, 4, 2) neighbors of every action, where neighbors off the board are replaced by the action
+    itself (which never holds an opponent stone), and whether each action is surrounded by opponent stones
+    """
+    n = len(batch_state)
+    batch_action2d = np.asarray(batch_action2d, dtype=np.int64).reshape(n, 2)
+    neighbors = batch_action2d[:, np.newaxis] + neighbor_deltas[np.newaxis]
+    on_board = np.all((neighbors >= 0) & (neighbors < batch_state.shape[-1]), axis=2)
+    neighbors = np.where(on_board[:, :, np.newaxis], neighbors, batch_action2d[:, np.newaxis])
+
+    opp_pieces = batch_state[np.arange(n), 1 - batch_player]
+    opp_neighbors = opp_pieces[np.arange(n)[:, np.newaxis], neighbors[:, :, 0], neighbors[:, :, 1]] > 0
+    batch_surrounded = np.all(opp_neighbors | ~on_board, axis=1)
+    return neighbors, batch_surrounded
 
 
 def set_turn(state):
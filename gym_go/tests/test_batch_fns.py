@@ -1,6 +1,8 @@
 import unittest
 
-from gym_go import gogame, govars
+import numpy as np
+
+from gym_go import gogame, govars, hashing
 
 
 class TestBatchFns(unittest.TestCase):
@@ -33,6 +35,131 @@ class TestBatchFns(unittest.TestCase):
 
         self.assertTrue((canon_again == states).all())
 
+    def test_batch_next_states_mixed_passes(self):
+        state = gogame.init_state(5)
+        for action in [1, 0]:
+            state = gogame.next_state(state, action)
+        states = np.stack([gogame.init_state(5), state])
+        # Black captures white's corner stone on the second board while the first board passes
+        next_states = gogame.batch_next_states(states, np.array([25, 5]))
+        self.assertTrue((next_states[1] == gogame.next_state(state, 5)).all())
+        self.assertEqual(next_states[1, govars.WHITE].sum(), 0)
+
+    def test_batch_engine_matches_scalar(self):
+        # The batched rules engine labels the groups of the whole batch at once, the scalar one is the reference
+        rng = np.random.default_rng(0)
+        for size in [3, 4, 5, 7]:
+            states = gogame.batch_init_state(16, size)
+            captures = 0
+            for _ in range(3 * size ** 2):
+                active = np.nonzero(gogame.batch_game_ended(states) == 0)[0]
+                if len(active) == 0:
+                    break
+                actions = gogame.batch_random_action(states[active], rng=rng)
+                next_states = gogame.batch_next_states(states[active], actions)
+                for i, state, action in zip(active, states[active], actions):
+                    expected = gogame.next_state(state, action)
+                    self.assertTrue((next_states[active == i][0] == expected).all(), (size, action))
+                    captures += int(expected[[govars.BLACK, govars.WHITE]].sum()
+                                    < state[[govars.BLACK, govars.WHITE]].sum())
+                states[active] = next_states
+
+                black_areas, white_areas = gogame.batch_areas(states)
+                for state, black_area, white_area in zip(states, black_areas, white_areas):
+                    self.assertEqual((black_area, white_area), gogame.areas(state))
+            # The random games exercise captures, and thereby ko and suicide checks
+            self.assertGreater(captures, 0, size)
+
+    def test_batch_random_action(self):
+        states = gogame.batch_init_state(64, 5)
+        states[:, govars.INVD_CHNL, 0] = 1
+        actions = gogame.batch_random_action(states)
+        self.assertEqual(actions.shape, (64,))
+        for state, action in zip(states, actions):
+            self.assertTrue(gogame.valid_moves(state)[action])
+
+        # Weights on invalid moves are ignored
+        weights = np.zeros((64, gogame.action_size(board_size=5)))
+        weights[:, 0] = 1
+        weights[:, 7] = 1
+        actions = gogame.batch_random_action(states, weights, dirichlet_alpha=0.03, dirichlet_frac=0)
+        self.assertTrue((actions == 7).all())
+
+        weights[:, 7] = 0
+        actions = gogame.batch_random_action(states, weights)
+        self.assertTrue((actions >= 5).all())
+
+        weights[:, 12] = 2
+        weights[:, 13] = 1
+        actions = gogame.batch_random_action(states, weights, temperature=0)
+        self.assertTrue((actions == 12).all())
+
+    def test_batch_ownership(self):
+        states = gogame.batch_init_state(3, 9)
+        states[1] = gogame.next_state(states[1], 20)
+        for action in [20, 60, 24, 56]:
+            states[2] = gogame.next_state(states[2], action)
+        owners = gogame.batch_ownership(states)
+        self.assertEqual(owners.shape, (3, 9, 9))
+        self.assertTrue((owners[0] == 0).all())
+        for state, owner in zip(states, owners):
+            self.assertTrue((gogame.ownership(state) == owner).all())
+
+        # A lone stone owns its surroundings, but not the whole board
+        self.assertEqual(owners[1, 2, 2], 1)
+        self.assertEqual(owners[1, 8, 8], 0)
+        self.assertTrue((owners[1] >= 0).all())
+
+        # Each side owns its half of the opening, where the area score is only the stones
+        self.assertTrue((owners[2, 0] == 1).all())
+        self.assertTrue((owners[2, -1] == -1).all())
+        self.assertTrue((owners[2, 4] == 0).all())
+        self.assertEqual(gogame.areas(states[2]), (2, 2))
+        black_area, white_area = gogame.influence_areas(states[2])
+        self.assertEqual(black_area, white_area)
+        self.assertGreater(black_area, 2)
+
+    def test_batch_adjudicate(self):
+        states = gogame.batch_init_state(3, 5)
+        states[1:, govars.BLACK] = 1
+        states[1:, govars.BLACK, 0, 0] = 0
+        # Two eyes are left on the second board, but only one (in atari) on the third
+        states[1, govars.BLACK, 4, 4] = 0
+        self.assertEqual(gogame.batch_only_eye_moves(states).tolist(), [False, True, False])
+
+        adjudicated, winners, streaks = gogame.batch_adjudicate(states, np.zeros(3, dtype=int), margin=30, moves=1)
+        self.assertEqual(adjudicated.tolist(), [False, True, False])
+        self.assertEqual(winners[1], 1)
+
+        # The third board needs a margin lead for two moves in a row
+        adjudicated, winners, streaks = gogame.batch_adjudicate(states, np.zeros(3, dtype=int), margin=20, moves=2)
+        self.assertEqual(streaks.tolist(), [0, 1, 1])
+        self.assertFalse(adjudicated[2])
+        adjudicated, winners, streaks = gogame.batch_adjudicate(states, streaks, margin=20, moves=2)
+        self.assertTrue(adjudicated[2])
+        self.assertEqual(winners[2], 1)
+
+    def test_batch_is_legal(self):
+        state = gogame.init_state(4)
+        # Black captures at 6 and white can't retake the ko at 5
+        for action in [1, 2, 4, 10, 9, 7, 15, 5, 6]:
+            state = gogame.next_state(state, action)
+        ended = gogame.next_state(gogame.next_state(state, 16), 16)
+        states = np.array([state, ended])
+
+        legal, reasons = gogame.batch_is_legal(states, [[5, 0, 1, 12, 16], [5, 0, 1, 12, 16]])
+        self.assertEqual(reasons[0].tolist(), [govars.KO, govars.SUICIDE, govars.OCCUPIED, govars.LEGAL,
+                                               govars.LEGAL])
+        self.assertEqual(legal[0].tolist(), [False, False, False, True, True])
+        self.assertTrue((reasons[1] == govars.GAME_OVER).all())
+        self.assertTrue((legal[0] == (gogame.valid_moves(state)[[5, 0, 1, 12, 16]] > 0)).all())
+
+        # One action per state, and superko from the game's history
+        history = {int(hashing.batch_position_hashes(gogame.next_state(state, 12)[np.newaxis], False)[0])}
+        legal, reasons = gogame.batch_is_legal(states[:1], [12], histories=[history])
+        self.assertEqual(legal.shape, (1,))
+        self.assertEqual(reasons[0], govars.SUPERKO)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,27 @@
+import copy
+import unittest
+
+from gym_go import benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        results = benchmarks.run(board_sizes=[5], batch_sizes=[1, 4], min_time=0, startup=False, verbose=False)
+        self.assertIn('batch_next_states/size=5/batch=4', results['results'])
+        self.assertIn('next_state/size=5/batch=1', results['results'])
+        self.assertNotIn('next_state/size=5/batch=4', results['results'])
+
+        rows = benchmarks.compare(results, results)
+        self.assertEqual(len(rows), len(results['results']))
+        self.assertFalse(any(row[-1] for row in rows))
+
+        slower = copy.deepcopy(results)
+        slower['results']['areas/size=5/batch=1']['median'] *= 2
+        rows = benchmarks.compare(slower, results, threshold=1.5)
+        regressed = [row[0] for row in rows if row[-1]]
+        self.assertEqual(regressed, ['areas/size=5/batch=1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
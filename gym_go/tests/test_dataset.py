@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_go import dataset, gogame
+
+
+def random_positions(n, size, rng):
+    states = gogame.batch_init_state(n, size)
+    for _ in range(size):
+        states = gogame.batch_next_states(states, gogame.batch_random_action(states, rng=rng))
+    return states
+
+
+class TestDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'positions')
+        self.rng = gogame.make_rng(0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pack_round_trip(self):
+        states = random_positions(32, 7, self.rng)
+        planes, flags = dataset.pack_states(states)
+        self.assertEqual(planes.shape, (32, dataset.packed_size(7)))
+        self.assertTrue((dataset.unpack_states(planes, flags, 7) == states).all())
+
+    def test_write_and_read_across_shards(self):
+        states = random_positions(50, 5, self.rng)
+        policies = self.rng.random((50, 26))
+        policies /= policies.sum(axis=1, keepdims=True)
+        outcomes = self.rng.choice([-1, 1], size=50)
+
+        with dataset.DatasetWriter(self.path, board_size=5, shard_size=16) as writer:
+            writer.append(states[:20], policies[:20], outcomes[:20])
+        # Reopening continues the dataset, actions are stored as one-hot policies
+        with dataset.DatasetWriter(self.path) as writer:
+            writer.append(states[20:], np.arange(30) % 26, outcomes[20:])
+        self.assertEqual(len(os.listdir(self.path)), 5)
+
+        data = dataset.PositionDataset(self.path)
+        self.assertEqual(len(data), 50)
+        idcs = self.rng.permutation(50)
+        batch_states, batch_policies, batch_outcomes = data.batch(idcs)
+        self.assertTrue((batch_states == states[idcs]).all())
+        self.assertTrue((batch_outcomes == outcomes[idcs]).all())
+
+        state, policy, outcome = data[3]
+        self.assertTrue(np.allclose(policy, policies[3], atol=1e-3))
+        state, policy, outcome = data[25]
+        self.assertEqual(np.argmax(policy), 5)
+        self.assertEqual(policy.sum(), 1)
+
+        with self.assertRaises(IndexError):
+            data[50]
+
+    def test_unflushed_records_are_dropped(self):
+        states = random_positions(8, 5, self.rng)
+        writer = dataset.DatasetWriter(self.path, board_size=5)
+        writer.append(states[:4])
+        writer.flush()
+        writer.append(states[4:])
+        writer._file.flush()
+
+        writer = dataset.DatasetWriter(self.path)
+        self.assertEqual(len(writer), 4)
+        writer.append(states[4:6])
+        writer.close()
+        batch_states, _, _ = dataset.PositionDataset(self.path).batch(np.arange(6))
+        self.assertTrue((batch_states == states[:6]).all())
+
+    def test_unflushed_records_across_shards_are_dropped(self):
+        states = random_positions(9, 5, self.rng)
+        writer = dataset.DatasetWriter(self.path, board_size=5, shard_size=4)
+        writer.append(states[:3])
+        writer.flush()
+        # Fills the first shard and starts the second one without a flush
+        writer.append(states[3:6])
+        writer._file.flush()
+        writer._file.close()
+
+        writer = dataset.DatasetWriter(self.path)
+        self.assertEqual(len(writer), 3)
+        writer.append(states[6:9])
+        writer.close()
+        data = dataset.PositionDataset(self.path)
+        self.assertEqual(len(data), 6)
+        batch_states, _, _ = data.batch(np.arange(6))
+        self.assertTrue((batch_states[:3] == states[:3]).all())
+        self.assertTrue((batch_states[3:] == states[6:9]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
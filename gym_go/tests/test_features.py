@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+from scipy import ndimage
+
+from gym_go import features, gogame, govars, state_utils
+
+
+class TestFeatures(unittest.TestCase):
+
+    def setUp(self):
+        rng = gogame.make_rng(0)
+        self.states = gogame.batch_init_state(8, 7)
+        for _ in range(40):
+            self.states = gogame.batch_next_states(self.states, gogame.batch_random_action(self.states, rng=rng))
+
+    def test_shapes(self):
+        planes = features.batch_features(self.states)
+        self.assertEqual(planes.shape, (8, features.num_planes(), 7, 7))
+        self.assertEqual(planes.dtype, np.float32)
+
+        out = np.zeros((8, 3, 7, 7))
+        result = features.batch_features(self.states, ['stones', 'ones'], out=out)
+        self.assertIs(result, out)
+        self.assertTrue((out[:, 2] == 1).all())
+        with self.assertRaises(ValueError):
+            features.batch_features(self.states, ['nothing'])
+
+    def test_liberties(self):
+        planes = features.batch_features(self.states, ['stones', 'liberties', 'atari'])
+        for state, state_planes in zip(self.states, planes):
+            player = gogame.turn(state)
+            empties = 1 - state[govars.BLACK] - state[govars.WHITE]
+            for i, pieces in enumerate([state[player], state[1 - player]]):
+                self.assertTrue((state_planes[i] == pieces).all())
+                labels, num_groups = ndimage.label(pieces)
+                expected = np.zeros(pieces.shape)
+                for label in range(1, num_groups + 1):
+                    group = labels == label
+                    expected[group] = np.sum(ndimage.binary_dilation(group, state_utils.surround_struct) * empties)
+                liberty_planes = state_planes[2 + 4 * i:6 + 4 * i]
+                for k in range(3):
+                    self.assertTrue((liberty_planes[k] == (expected == k + 1) * pieces).all())
+                self.assertTrue((liberty_planes[3] == (expected >= 4) * pieces).all())
+                self.assertTrue((state_planes[10 + i] == liberty_planes[0]).all())
+
+    def test_capture_size(self):
+        planes = features.batch_features(self.states, ['capture_size'])
+        for state, state_planes in zip(self.states, planes):
+            player = gogame.turn(state)
+            for move in np.flatnonzero(state[govars.INVD_CHNL] == 0):
+                child = gogame.next_state(state, move)
+                captured = np.sum(state[1 - player]) - np.sum(child[1 - player])
+                self.assertEqual(state_planes[0].flatten()[move], captured)
+        self.assertGreater(planes.sum(), 0)
+
+    def test_precomputed_groups(self):
+        groups = features.batch_group_data(self.states)
+        self.assertTrue((features.batch_features(self.states, groups=groups) ==
+                         features.batch_features(self.states)).all())
+        self.assertTrue((features.features(self.states[0]) == features.batch_features(self.states)[0]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import io
+import unittest
+
+from gym_go import gogame, govars
+from gym_go.gtp import GtpEngine, action_to_vertex, vertex_to_action
+
+
+class TestGtp(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = GtpEngine(size=5, komi=0.5, simulations=16, ponder=False, seed=0, log=None)
+
+    def test_vertices(self):
+        self.assertEqual(vertex_to_action('A5', 5), 0)
+        self.assertEqual(vertex_to_action('e1', 5), 24)
+        self.assertEqual(vertex_to_action('J1', 9), 80)
+        self.assertEqual(vertex_to_action('pass', 5), 25)
+        for action in range(26):
+            self.assertEqual(vertex_to_action(action_to_vertex(action, 5), 5), action)
+
+    def test_commands(self):
+        engine = self.engine
+        self.assertEqual(engine.handle('1 protocol_version'), '=1 2\n\n')
+        self.assertEqual(engine.handle('boardsize 7'), '=\n\n')
+        self.assertEqual(engine.size, 7)
+        self.assertEqual(engine.handle('komi 6.5'), '=\n\n')
+        self.assertEqual(engine.handle('play b D4'), '=\n\n')
+        self.assertEqual(engine.env.state_[govars.BLACK, 3, 3], 1)
+        self.assertEqual(engine.handle('play w D4'), '? illegal move\n\n')
+        self.assertEqual(engine.handle('play w Z9'), '? invalid vertex\n\n')
+        self.assertEqual(engine.handle('3 foo'), '?3 unknown command\n\n')
+        self.assertEqual(engine.handle('final_score'), '= B+42.5\n\n')
+
+        # Black moving twice gets a pass in between, which undo takes back too
+        engine.handle('play b C3')
+        self.assertEqual(len(engine.moves), 3)
+        self.assertEqual(engine.handle('undo'), '=\n\n')
+        self.assertEqual(engine.moves, [24])
+        engine.handle('undo')
+        self.assertEqual(engine.handle('undo'), '? cannot undo\n\n')
+
+    def test_genmove_reuses_tree(self):
+        engine = self.engine
+        engine.handle('play b C3')
+        vertex = engine.handle('genmove w')[2:].strip()
+        self.assertEqual(engine.moves[-1], vertex_to_action(vertex, 5))
+        self.assertEqual(gogame.turn(engine.env.state_), govars.BLACK)
+
+        # Searching past the budget (as when pondering) leaves the next genmove nothing to do
+        root = engine._sync_root()
+        engine.mcts.run([root], simulations=64)
+        visits = root.num_visits()
+        engine.genmove(govars.BLACK)
+        self.assertEqual(root.num_visits(), visits)
+        self.assertEqual(len(engine.latencies), 2)
+
+    def test_pondering(self):
+        engine = GtpEngine(size=5, simulations=16, ponder_limit=32, seed=0, log=io.StringIO())
+        out = io.StringIO()
+        engine.run(io.StringIO('play b C3\ngenmove w\nquit\nplay b A1\n'), out)
+        self.assertEqual(out.getvalue().count('='), 3)
+        self.assertEqual(len(engine.moves), 2)
+        self.assertIn('genmove 2', engine.log.getvalue())
+        self.assertIsNone(engine._ponder_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, hashing
+
+
+class TestHashing(unittest.TestCase):
+
+    def setUp(self):
+        rng = gogame.make_rng(0)
+        self.states = gogame.batch_init_state(16, 7)
+        for _ in range(15):
+            self.states = gogame.batch_next_states(self.states, gogame.batch_random_action(self.states, rng=rng))
+
+    def test_orientations(self):
+        for state in self.states[:4]:
+            state_hashes = hashing.hashes(state)
+            symmetries = gogame.all_symmetries(state)
+            for k, symmetry in enumerate(symmetries):
+                self.assertEqual(hashing.position_hash(symmetry), state_hashes[k])
+                self.assertEqual(hashing.symmetric_hash(symmetry), hashing.symmetric_hash(state))
+
+            k = hashing.canonical_orientation(state)
+            canonical = symmetries[k]
+            self.assertEqual(hashing.position_hash(canonical), hashing.symmetric_hash(state))
+
+    def test_distinct_positions(self):
+        symmetric = hashing.batch_symmetric_hash(self.states)
+        self.assertEqual(len(np.unique(symmetric)), len(self.states))
+        self.assertTrue((hashing.batch_canonical_orientation(self.states) < 8).all())
+
+        # The player to move is part of the hash unless excluded
+        state = self.states[0]
+        flipped = np.copy(state)
+        flipped[2] = 1 - flipped[2]
+        self.assertNotEqual(hashing.position_hash(state), hashing.position_hash(flipped))
+        self.assertEqual(hashing.position_hash(state, False), hashing.position_hash(flipped, False))
+
+    def test_incremental(self):
+        rng = gogame.make_rng(1)
+        state = gogame.init_state(5)
+        state_hashes = hashing.hashes(state)
+        for _ in range(40):
+            next_state = gogame.next_state(state, gogame.random_action(state, rng))
+            state_hashes = hashing.update_hashes(state_hashes, state, next_state)
+            self.assertTrue((state_hashes == hashing.hashes(next_state)).all())
+            state = next_state
+
+        actions = gogame.batch_random_action(self.states, rng=rng)
+        next_states = gogame.batch_next_states(self.states, actions)
+        batch_hashes = hashing.update_hashes(hashing.batch_hashes(self.states), self.states, next_states)
+        self.assertTrue((batch_hashes == hashing.batch_hashes(next_states)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import gym
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.envs import GoVecEnv
+from gym_go.history import HistoryBuffer
+
+
+class TestHistory(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        rng = gogame.make_rng(0)
+        buffer = HistoryBuffer(4, 5, history=3, extra=())
+        states = gogame.batch_init_state(4, 5)
+        buffer.reset(states)
+        trajectory = [states]
+        for _ in range(7):
+            states = gogame.batch_next_states(states, gogame.batch_random_action(states, rng=rng))
+            trajectory.append(states)
+            buffer.push(states)
+
+            view = buffer.view()
+            self.assertTrue(np.shares_memory(view, buffer.buffer))
+            for i in range(3):
+                expected = trajectory[-1 - i][:, [govars.BLACK, govars.WHITE]] if i < len(trajectory) else 0
+                self.assertTrue((view[:, 2 * i:2 * i + 2] == expected).all())
+        with self.assertRaises(ValueError):
+            view[0, 0, 0, 0] = 1
+
+    def test_reset_some(self):
+        buffer = HistoryBuffer(2, 5, history=2)
+        states = gogame.batch_init_state(2, 5)
+        buffer.reset(states)
+        buffer.push(gogame.batch_next_states(states, np.array([0, 1])))
+        buffer.reset(states[:1], idcs=[1])
+        observation = buffer.observation(states)
+        self.assertEqual(observation.shape, (2, 5, 5, 5))
+        self.assertEqual(observation[0, :4].sum(), 1)
+        self.assertEqual(observation[1, :4].sum(), 0)
+
+    def test_env(self):
+        env = gym.make('gym_go:go-v0', size=5, history=4, history_extra=['turn', 'invalid'])
+        observation = env.reset(seed=0)
+        self.assertEqual(observation.shape, (10, 5, 5))
+        self.assertEqual(env.observation_space.shape, (10, 5, 5))
+        states = [env.state()]
+        for _ in range(6):
+            observation, _, _, _ = env.step(env.uniform_random_action())
+            states.append(env.state())
+        for i in range(4):
+            self.assertTrue((observation[2 * i:2 * i + 2] == states[-1 - i][[govars.BLACK, govars.WHITE]]).all())
+        self.assertTrue((observation[8] == states[-1][govars.TURN_CHNL]).all())
+        self.assertTrue((observation[9] == states[-1][govars.INVD_CHNL]).all())
+
+        out = np.zeros((10, 5, 5), dtype=np.float32)
+        env.observation(out=out)
+        self.assertTrue((out == observation).all())
+
+    def test_vec_env(self):
+        envs = GoVecEnv(3, 5, seed=0, history=2)
+        observations = envs.reset()
+        self.assertEqual(observations.shape, (3, 5, 5, 5))
+        previous = envs.states_.copy()
+        observations, _, _, _ = envs.step(envs.uniform_random_actions())
+        self.assertTrue((observations[:, :2] == envs.states_[:, [govars.BLACK, govars.WHITE]]).all())
+        self.assertTrue((observations[:, 2:4] == previous[:, [govars.BLACK, govars.WHITE]]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
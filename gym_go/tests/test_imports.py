@@ -0,0 +1,46 @@
+import subprocess
+import sys
+import unittest
+
+
+def run(code):
+    """
+    :return: stdout of the code, run in a fresh interpreter
+    """
+    return subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout
+
+
+def loaded_modules(statement):
+    return set(run("import sys; {}; print(' '.join(sys.modules))".format(statement)).split())
+
+
+class TestImports(unittest.TestCase):
+    heavy_modules = ['gym', 'sklearn', 'pyglet']
+
+    def test_core_is_slim(self):
+        modules = loaded_modules('import gym_go.core')
+        for name in self.heavy_modules:
+            self.assertNotIn(name, modules)
+
+    def test_env_does_not_load_rendering(self):
+        modules = loaded_modules('from gym_go.envs import GoEnv; GoEnv(size=5)')
+        self.assertIn('gym', modules)
+        self.assertNotIn('pyglet', modules)
+        self.assertNotIn('gym_go.rendering', modules)
+
+    def test_gym_make_registers(self):
+        for statement in ["import gym; env = gym.make('gym_go:go-v0', size=5)",
+                          "import gym_go.core, gym_go.envs, gym; env = gym.make('go-v0', size=5)",
+                          "import gym, gym_go; env = gym.make('go-v0', size=5)"]:
+            self.assertEqual(run(statement + '; print(type(env.unwrapped).__name__)').strip(), 'GoEnv', statement)
+        self.assertEqual(run("import gym, gym_go; print(type(gym.make('go-extrahard-v0', size=5).unwrapped).__name__)")
+                         .strip(), 'GoExtraHardEnv')
+        # Importing gym_go doesn't load gym to register
+        modules = loaded_modules('import gym_go, gym_go.core')
+        for name in self.heavy_modules:
+            self.assertNotIn(name, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.envs import GoMultiAgentVecEnv
+
+
+class TestGoMultiAgentVecEnv(unittest.TestCase):
+
+    def test_turns(self):
+        env = GoMultiAgentVecEnv(4, size=5)
+        turns = env.reset(seed=0)
+        self.assertEqual(turns['black'].indices.tolist(), [0, 1, 2, 3])
+        self.assertEqual(len(turns['white'].indices), 0)
+
+        # Games with different players to move are split between the agents
+        env.states_[[1, 3]] = gogame.next_state(env.states_[0], 12)
+        turns = env.observe()
+        self.assertEqual(turns['black'].indices.tolist(), [0, 2])
+        self.assertEqual(turns['white'].indices.tolist(), [1, 3])
+        for turn in turns.values():
+            states = env.states_[turn.indices]
+            self.assertTrue((turn.observations == gogame.batch_canonical_form(states)).all())
+            self.assertTrue((turn.action_masks == (gogame.batch_valid_moves(states) > 0)).all())
+
+        turns, rewards, dones, _ = env.step({'black': [12, 12], 'white': [0, 0]})
+        self.assertEqual(turns['black'].indices.tolist(), [1, 3])
+        self.assertEqual(turns['white'].indices.tolist(), [0, 2])
+        self.assertEqual(env.states_[1, govars.WHITE, 0, 0], 1)
+        self.assertTrue((rewards['white'] == -rewards['black']).all())
+
+    def test_two_policies(self):
+        env = GoMultiAgentVecEnv(8, size=5, history=2)
+        turns = env.reset(seed=1)
+        rng = np.random.default_rng(0)
+        dones = np.zeros(8, dtype=bool)
+        for _ in range(200):
+            if dones.all():
+                break
+            for turn in turns.values():
+                self.assertEqual(turn.observations.shape, (len(turn.indices), 5, 5, 5))
+            # Black plays randomly, white plays its first valid move
+            black, white = turns['black'], turns['white']
+            actions = {'black': [rng.choice(np.flatnonzero(mask)) for mask in black.action_masks],
+                       'white': np.argmax(white.action_masks, axis=1)}
+            turns, rewards, dones, _ = env.step(actions)
+        self.assertTrue(dones.all())
+        self.assertTrue(np.isin(rewards['black'], [-1, 0, 1]).all())
+        self.assertEqual(sum(len(turn.indices) for turn in turns.values()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
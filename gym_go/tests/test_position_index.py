@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+
+import gym
+import numpy as np
+
+from gym_go import gogame
+from gym_go.position_index import PositionIndex, batch_position_keys
+from gym_go.records import GameRecord, GameArchive
+
+
+class TestPositionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+        # Black opens on a corner of every orientation, then white plays the adjacent point
+        self.size = 5
+        corner_games = []
+        for k, (first, reply) in enumerate([(0, 1), (4, 3), (20, 21), (24, 23)]):
+            corner_games.append(GameRecord([first, reply, 25, 25], self.size, result=1 if k < 3 else -1))
+        self.center_game = GameRecord([12, 25, 25], self.size, result=0)
+        self.games = corner_games + [self.center_game]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_symmetric_aggregation(self):
+        index = PositionIndex.build(self.path, self.games, board_size=self.size)
+
+        empty = index.lookup(gogame.init_state(self.size))
+        self.assertEqual(empty['visits'], 5)
+        self.assertEqual(empty['black_wins'], 3)
+        self.assertEqual(empty['draws'], 1)
+        # Moves are counted in the queried orientation; all corners are the same opening
+        self.assertEqual(empty['move_counts'].sum(), 5)
+        self.assertEqual(empty['move_counts'][12], 1)
+
+        # Every corner opening is one entry, whichever corner is queried
+        corner = gogame.next_state(gogame.init_state(self.size), 24)
+        stats = index.lookup(corner)
+        self.assertEqual(stats['visits'], 4)
+        self.assertEqual(stats['black_wins'], 3)
+        self.assertEqual(stats['move_counts'][23] + stats['move_counts'][19], 4)
+        self.assertEqual(stats['move_counts'].sum(), 4)
+
+        self.assertIsNone(index.lookup(gogame.next_state(gogame.init_state(self.size), 6)))
+
+    def test_persistent_and_growing(self):
+        index = PositionIndex(self.path, self.size, capacity=2)
+        index.add_games(self.games)
+        num_positions = len(index)
+        self.assertGreater(index.capacity, 2)
+        self.assertLessEqual(num_positions, index.capacity / 2)
+
+        reopened = PositionIndex(self.path)
+        self.assertEqual(len(reopened), num_positions)
+        self.assertEqual(reopened.lookup(gogame.init_state(self.size))['visits'], 5)
+
+        # Adding again accumulates
+        reopened.add_games(self.games)
+        self.assertEqual(len(reopened), num_positions)
+        self.assertEqual(reopened.lookup(gogame.init_state(self.size))['visits'], 10)
+
+    def test_archive_and_max_depth(self):
+        archive = GameArchive(self.size, checkpoint_interval=2)
+        archive.extend(self.games)
+        index = PositionIndex.build(self.path, archive, max_depth=1)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.lookup(gogame.init_state(self.size))['visits'], 5)
+
+    def test_sample(self):
+        index = PositionIndex.build(self.path, self.games, board_size=self.size)
+        rng = gogame.make_rng(0)
+        states = index.sample(64, rng, min_visits=4)
+        keys, _ = batch_position_keys(states)
+        allowed = set(index.table['key'][index.table['visits'] >= 4])
+        self.assertTrue(set(keys) <= allowed)
+        self.assertEqual(set(keys), allowed)
+
+    def test_sample_after_add(self):
+        index = PositionIndex.build(self.path, self.games, board_size=self.size)
+        rng = gogame.make_rng(0)
+        empty_key = batch_position_keys(gogame.init_state(self.size)[np.newaxis])[0][0]
+        keys, _ = batch_position_keys(index.sample(16, rng, min_visits=5))
+        self.assertEqual(set(keys), {empty_key})
+
+        # New visits are sampled from right away, proportionally to the visits
+        index.add_games([self.center_game] * 5)
+        keys, _ = batch_position_keys(index.sample(4000, rng, min_visits=5))
+        self.assertEqual(len(set(keys)), 3)
+        self.assertAlmostEqual(np.mean(keys == empty_key), 10 / 22, delta=0.03)
+
+    def test_env_reset_from_book(self):
+        index = PositionIndex.build(self.path, self.games, board_size=self.size)
+        env = gym.make('gym_go:go-v0', size=self.size)
+        allowed = set(index.table['key'][index.table['visits'] >= 4])
+        for seed in range(8):
+            state = env.reset(seed=seed, options={'opening_book': index, 'min_visits': 4})
+            self.assertIn(batch_position_keys(state[np.newaxis])[0][0], allowed)
+            self.assertTrue(np.array_equal(state, env.state()))
+            env.step(env.uniform_random_action())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+import numpy as np
+
+import gym_go
+from gym_go import gogame, profiling
+from gym_go.gogame import next_state
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        profiling.reset()
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_counts_nothing(self):
+        gogame.next_state(gogame.init_state(5), 0)
+        self.assertEqual(gym_go.stats()['counters'], {})
+
+    def test_prebound_callers(self):
+        # Functions imported before profiling is enabled are counted too, as is the labelling in areas
+        profiling.enable()
+        state = next_state(gogame.init_state(5), 0)
+        calls = gym_go.stats()['counters'].get('label_groups_calls', 0)
+        gogame.areas(state)
+        profiling.disable()
+        next_state(state, 1)
+
+        counters = gym_go.stats()['counters']
+        self.assertEqual(counters['next_state_calls'], 1)
+        self.assertEqual(counters['label_groups_calls'], calls + 1)
+
+    def test_threads(self):
+        def play():
+            state = gogame.init_state(5)
+            for action in range(10):
+                state = gogame.next_state(state, action)
+
+        with profiling.profile():
+            threads = [threading.Thread(target=play) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(gym_go.stats()['counters']['next_state_calls'], 40)
+
+    def test_counters(self):
+        state = gogame.init_state(5)
+        with profiling.profile():
+            # Black captures the white stone in the corner
+            for action in [1, 0, 5]:
+                state = gogame.next_state(state, action)
+            gogame.batch_next_states(np.tile(state[np.newaxis], (3, 1, 1, 1)), np.array([2, 3, 4]),
+                                     canonical=True)
+        self.assertFalse(profiling.enabled())
+
+        snapshot = gym_go.stats(reset=True)
+        counters = snapshot['counters']
+        self.assertEqual(counters['next_state_calls'], 3)
+        self.assertEqual(counters['batch_next_states_calls'], 1)
+        self.assertEqual(counters['boards'], 6)
+        self.assertEqual(counters['captures'], 1)
+        self.assertEqual(counters['captured_stones'], 1)
+        self.assertGreater(counters['groups_labelled'], 0)
+        for phase in ['next_state', 'batch_next_states', 'labelling', 'capture', 'invalid_moves', 'canonical']:
+            self.assertGreater(snapshot['timings'][phase], 0)
+
+        self.assertEqual(gym_go.stats()['counters'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_go import gogame
+from gym_go.records import GameRecord, GameArchive, encode_varint, decode_varint
+
+
+def random_records(n, size, rng):
+    records = []
+    for _ in range(n):
+        state = gogame.init_state(size)
+        actions = []
+        while not gogame.game_ended(state) and len(actions) < rng.integers(1, 3 * size ** 2):
+            weights = np.ones(size ** 2 + 1)
+            weights[-1] = 0.05
+            action = gogame.random_weighted_action(weights * gogame.valid_moves(state), rng)
+            actions.append(action)
+            state = gogame.next_state(state, action)
+        records.append(GameRecord(actions, size, int(gogame.winning(state)), komi=0.5))
+    return records
+
+
+class TestRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = gogame.make_rng(0)
+        self.records = random_records(12, 5, self.rng)
+
+    def test_varint(self):
+        values = [0, 1, 127, 128, 361, 16383, 16384]
+        encoded = encode_varint(values)
+        self.assertEqual(len(encode_varint([127])), 1)
+        self.assertEqual(len(encode_varint([361])), 2)
+        self.assertEqual(list(decode_varint(encoded)), values)
+
+        record = self.records[0]
+        decoded = GameRecord.from_bytes(record.to_bytes())
+        self.assertEqual(list(decoded.actions), list(record.actions))
+        self.assertEqual((decoded.board_size, decoded.result, decoded.komi), (5, record.result, 0.5))
+
+    def test_archive_positions(self):
+        archive = GameArchive(5, checkpoint_interval=4)
+        archive.extend(self.records[:5], lanes=3)
+        archive.extend(self.records[5:])
+        self.assertEqual(len(archive), 12)
+
+        games, moves, expected = [], [], []
+        for game, record in enumerate(self.records):
+            self.assertEqual(list(archive.game_actions(game)), list(record.actions))
+            states = record.states()
+            for move in [0, len(record) // 2, len(record)]:
+                self.assertTrue((archive.position(game, move) == states[move]).all(), (game, move))
+                games.append(game)
+                moves.append(move)
+                expected.append(states[move])
+
+        order = self.rng.permutation(len(games))
+        batch = archive.batch_positions(np.array(games)[order], np.array(moves)[order])
+        self.assertTrue((batch == np.array(expected)[order]).all())
+
+        with self.assertRaises(IndexError):
+            archive.position(0, len(self.records[0]) + 1)
+
+    def test_save_load(self):
+        archive = GameArchive(5, checkpoint_interval=3)
+        archive.extend(self.records)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'archive')
+            archive.save(path)
+            loaded = GameArchive.load(path)
+            self.assertEqual(len(loaded), len(archive))
+            game = len(archive) - 1
+            move = archive.game_length(game)
+            self.assertTrue((loaded.position(game, move) == archive.position(game, move)).all())
+            self.assertEqual(loaded.record(game).result, self.records[game].result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.replay_buffer import ReplayBuffer
+
+
+def single_stone_examples(n, size, rng):
+    """
+    States with one black stone and a one-hot policy on the stone's location
+    """
+    locations = rng.integers(0, size ** 2, size=n)
+    states = gogame.batch_init_state(n, size)
+    states[np.arange(n), govars.BLACK, locations // size, locations % size] = 1
+    policies = np.zeros((n, size ** 2 + 1), dtype=np.float32)
+    policies[np.arange(n), locations] = 1
+    policies[:, -1] = 0.5
+    return states, policies, locations.astype(np.float32)
+
+
+class TestReplayBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = gogame.make_rng(0)
+
+    def test_batch_symmetries_match_all_symmetries(self):
+        images = self.rng.random((8, 3, 5, 5))
+        orientations = np.arange(8)
+        batch = gogame.batch_symmetries(images, orientations)
+        for i in range(8):
+            self.assertTrue((batch[i] == gogame.all_symmetries(images[i])[i]).all())
+
+    def test_augmentation_is_consistent(self):
+        buffer = ReplayBuffer(64, 5, seed=1)
+        buffer.add(*single_stone_examples(64, 5, self.rng))
+        states, policies, values = buffer.sample(256)
+        stone_locations = np.argmax(states[:, govars.BLACK].reshape(256, -1), axis=1)
+        self.assertTrue((np.argmax(policies[:, :-1], axis=1) == stone_locations).all())
+        self.assertTrue((policies[:, -1] == 0.5).all())
+        # Some examples were transformed
+        self.assertTrue((stone_locations != values).any())
+
+    def test_ring_overwrites_oldest(self):
+        buffer = ReplayBuffer(10, 5, augment=False, seed=1)
+        for _ in range(3):
+            buffer.add(*single_stone_examples(4, 5, self.rng))
+        self.assertEqual(len(buffer), 10)
+        self.assertEqual(buffer.next_idx, 2)
+        states, policies, values = single_stone_examples(25, 5, self.rng)
+        buffer.add(states, policies, values)
+        self.assertTrue((np.sort(buffer.values) == np.sort(values[-10:])).all())
+
+        states, policies, values = buffer.sample(32)
+        self.assertTrue((np.argmax(policies[:, :-1], axis=1) == values).all())
+
+    def test_prefetch(self):
+        buffer = ReplayBuffer(16, 5, seed=1)
+        with self.assertRaises(ValueError):
+            next(buffer.batches(4))
+
+        buffer.add(*single_stone_examples(16, 5, self.rng))
+        batches = buffer.batches(4, prefetch=2)
+        for _ in range(5):
+            states, policies, values = next(batches)
+            self.assertEqual(states.shape, (4, govars.NUM_CHNLS, 5, 5))
+        batches.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
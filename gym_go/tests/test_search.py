@@ -0,0 +1,125 @@
+import time
+import unittest
+
+import gym
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.envs import GoExtraHardVecEnv
+from gym_go.search import MCTS, batch_playouts
+
+
+class TestSearch(unittest.TestCase):
+
+    def test_playouts(self):
+        rng = gogame.make_rng(0)
+        states = gogame.batch_init_state(16, 5)
+        results = batch_playouts(states, komi=0.5, rng=rng)
+        self.assertEqual(results.shape, (16,))
+        self.assertTrue(np.isin(results, [-1, 1]).all())
+
+    def test_finds_capture(self):
+        # Black to move captures three white stones by playing at (2, 0)
+        state = gogame.init_state(5)
+        for action in [16, 11, 22, 5, 20, 24, 21, 23, 2, 3, 6, 9, 1, 4, 0, 19, 12, 15]:
+            state = gogame.next_state(state, action)
+        self.assertEqual(gogame.turn(state), govars.BLACK)
+
+        mcts = MCTS(simulations=128, seed=0)
+        actions = mcts.search(np.array([state, state]))
+        self.assertEqual(actions.tolist(), [10, 10])
+        self.assertEqual(mcts.counters['searches'], 2)
+
+    def test_budgets(self):
+        state = gogame.init_state(5)
+        mcts = MCTS(simulations=16, leaves_per_root=4, seed=0)
+        root = mcts.new_root(state)
+        mcts.run([root])
+        self.assertEqual(root.num_visits(), 16)
+        mcts.run([root], simulations=8)
+        self.assertEqual(root.num_visits(), 24)
+
+        timed = MCTS(simulations=None, time_ms=50, seed=0)
+        start = time.perf_counter()
+        timed.search(state[np.newaxis])
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_env(self):
+        env = gym.make('gym_go:go-extrahard-v0', size=5, simulations=8, seed=0)
+        env.reset()
+        state, reward, done, _ = env.step(12)
+        # The agent's move and the opponent's reply
+        self.assertEqual(np.sum(state[[govars.BLACK, govars.WHITE]]), 2)
+        self.assertEqual(gogame.turn(state), govars.BLACK)
+
+        white = gym.make('gym_go:go-extrahard-v0', size=5, agent_color='white', simulations=8, seed=0)
+        state = white.reset()
+        self.assertEqual(np.sum(state[govars.BLACK]), 1)
+        self.assertEqual(gogame.turn(state), govars.WHITE)
+
+    def test_env_rewards(self):
+        # Black opens in the center, then the player who is not the agent passes
+        for agent_color, moves in [('black', [12, 25]), ('white', [12, 0, 25])]:
+            sign = 1 if agent_color == 'black' else -1
+            start = gogame.init_state(5)
+            for action in moves:
+                start = gogame.next_state(start, action)
+
+            env = gym.make('gym_go:go-extrahard-v0', size=5, komi=0.5, reward_method='heuristic',
+                           agent_color=agent_color, simulations=8, seed=0)
+            env.reset(options={'state': start})
+            state, reward, done, _ = env.step(6)
+            self.assertFalse(done)
+            black_area, white_area = gogame.areas(state)
+            self.assertEqual(reward, sign * (black_area - white_area - 0.5), agent_color)
+
+            # Passing after the opponent's pass ends the game, and the result reaches the agent
+            for reward_method, won in [('real', 1), ('heuristic', 25)]:
+                env = gym.make('gym_go:go-extrahard-v0', size=5, komi=0.5, reward_method=reward_method,
+                               agent_color=agent_color, simulations=8, seed=0)
+                env.reset(options={'state': start})
+                _, reward, done, _ = env.step(25)
+                self.assertTrue(done)
+                # A lone black stone owns the board, and two stones split it so white wins by komi
+                self.assertEqual(reward, won, (agent_color, reward_method))
+
+    def test_vec_env(self):
+        envs = GoExtraHardVecEnv(4, 5, simulations=8, seed=0)
+        envs.reset()
+        for _ in range(3):
+            states, rewards, dones, _ = envs.step(envs.uniform_random_actions())
+        self.assertTrue((gogame.batch_turn(states[~dones]) == govars.BLACK).all())
+        self.assertEqual(envs.opponent.counters['searches'], 12)
+
+    def test_vec_env_invalid_actions(self):
+        for agent_color in ['black', 'white']:
+            envs = GoExtraHardVecEnv(3, 5, agent_color=agent_color, simulations=8, seed=0)
+            envs.reset()
+            states, _, _, _ = envs.step(envs.uniform_random_actions())
+            actions = envs.uniform_random_actions()
+            # An action off the board and an occupied point only end their own games
+            actions[1] = 26
+            actions[2] = np.flatnonzero(states[2, [govars.BLACK, govars.WHITE]].sum(axis=0))[0]
+            states, rewards, dones, _ = envs.step(actions)
+            self.assertEqual(dones.tolist(), [False, True, True], agent_color)
+            self.assertEqual(rewards[1:].tolist(), [-np.inf, -np.inf])
+            self.assertTrue(np.isfinite(rewards[0]))
+            # Ended games keep their reward
+            _, rewards, _, _ = envs.step(envs.uniform_random_actions())
+            self.assertEqual(rewards[1:].tolist(), [-np.inf, -np.inf])
+
+    def test_vec_env_reset_to(self):
+        envs = GoExtraHardVecEnv(3, 5, agent_color='white', simulations=8, seed=0)
+        envs.reset()
+        self.assertTrue((envs.turns() == govars.WHITE).all())
+        # The opponent replies in the restarted games where it is to move, e.g. refilled from a StartStatePool
+        white_to_move = gogame.next_state(gogame.init_state(5), 12)
+        states = envs.reset_to([0, 2], np.stack([gogame.init_state(5), white_to_move]))
+        self.assertTrue((gogame.batch_turn(states) == govars.WHITE).all())
+        self.assertEqual(states[0, govars.BLACK].sum(), 1)
+        self.assertEqual(states[2, govars.BLACK].sum(), 1)
+        self.assertEqual(envs.moves.tolist(), [1, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
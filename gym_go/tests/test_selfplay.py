@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.selfplay import SelfPlay, heuristic_evaluator
+
+
+class TestSelfPlay(unittest.TestCase):
+
+    def run_selfplay(self, evaluator, num_games, **kwargs):
+        games = []
+        selfplay = SelfPlay(5, evaluator=evaluator, num_actors=2, games_in_parallel=3, max_moves=30, seed=0,
+                            **kwargs)
+        selfplay.run(num_games, callback=lambda *game: games.append(game))
+        return selfplay, games
+
+    def test_heuristic_evaluator(self):
+        states = gogame.batch_init_state(1, 3)
+        states[0, govars.BLACK] = 1
+        states[0, govars.BLACK, 1, 1] = 0
+        states[0, govars.INVD_CHNL] = states[0, govars.BLACK]
+        policies, values = heuristic_evaluator(states)
+        # Only the pass is left
+        self.assertEqual(policies[0, -1], 1)
+        self.assertGreater(values[0], 0)
+
+    def test_games(self):
+        selfplay, games = self.run_selfplay('heuristic', 7, dirichlet_alpha=0.3, temperature_moves=10,
+                                            superko='positional')
+        self.assertEqual(len(games), 7)
+        for states, policies, outcomes in games:
+            self.assertEqual(states.shape[1:], (govars.NUM_CHNLS, 5, 5))
+            self.assertEqual(policies.shape, (len(states), 26))
+            self.assertLessEqual(len(states), 30)
+            # Canonical states: always black to move
+            self.assertTrue((states[:, govars.TURN_CHNL] == 0).all())
+            # Outcomes alternate between the players' perspectives
+            self.assertTrue((outcomes[1:] == -outcomes[:-1]).all())
+
+        stats = selfplay.stats()
+        self.assertEqual(stats['games'], 7)
+        self.assertEqual(stats['positions'], sum(len(game[0]) for game in games))
+        self.assertGreater(stats['positions_per_sec'], 0)
+        self.assertTrue(0 < stats['mean_batch_fill'] <= 1)
+
+    def test_custom_evaluator(self):
+        calls = []
+
+        def first_valid_move(batch_states):
+            calls.append(len(batch_states))
+            valid = gogame.batch_valid_moves(batch_states)
+            policies = np.zeros_like(valid)
+            policies[np.arange(len(valid)), np.argmax(valid, axis=1)] = 1
+            return policies, np.zeros(len(batch_states))
+
+        selfplay, games = self.run_selfplay(first_valid_move, 2)
+        self.assertEqual(len(games), 2)
+        self.assertLessEqual(max(calls), selfplay.max_batch)
+        for states, policies, outcomes in games:
+            self.assertTrue((policies.max(axis=1) == 1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars, sgf
+
+COLLECTION = r"""
+(;GM[1]FF[4]SZ[5]KM[0.5]RE[B+2.5]C[a comment with ) and \] inside]
+;B[cc];W[dc]C[(tricky];B[cd];W[];B[bb](;W[aa];B[])(;W[ee]))
+(;GM[1]SZ[5]KM[0]RE[W+R]AB[aa][bb]
+;W[cc];W[dd];B[ee])
+(;GM[1]SZ[7]RE[B+R];B[aa])
+"""
+
+
+class TestSgf(unittest.TestCase):
+
+    def test_streaming_parse(self):
+        for chunk_size in [3, 7, 1 << 16]:
+            games = list(sgf.iter_games(io.StringIO(COLLECTION), chunk_size))
+            self.assertEqual(len(games), 3)
+
+            first = games[0]
+            self.assertEqual(first.size, 5)
+            self.assertEqual(first.komi, 0.5)
+            self.assertEqual(first.result, 'B+2.5')
+            self.assertEqual(first.properties['C'], ['a comment with ) and ] inside'])
+            # Main line only
+            self.assertEqual(first.actions, [12, 13, 17, 25, 6, 0, 25])
+            self.assertEqual(first.colors, [0, 1, 0, 1, 0, 1, 0])
+
+            second = games[1]
+            self.assertEqual(second.black_stones, [0, 6])
+            self.assertEqual(second.first_player, govars.WHITE)
+
+    def test_round_trip(self):
+        actions = [0, 24, 12, 25, 25]
+        text = sgf.dumps(actions, 5, komi=7.5, result=sgf.format_result(-1, 7.5), PB='agent')
+        game, = sgf.loads(text)
+        self.assertEqual(game.actions, actions)
+        self.assertEqual(game.komi, 7.5)
+        self.assertEqual(game.result, 'W+7.5')
+        self.assertEqual(game.properties['PB'], ['agent'])
+        self.assertEqual(sgf.result_winner(game.result), -1)
+
+    def test_batch_convert(self):
+        rng = gogame.make_rng(0)
+        games, trajectories = [], []
+        for _ in range(5):
+            state = gogame.init_state(5)
+            actions, states = [], []
+            while not gogame.game_ended(state) and len(actions) < 30:
+                action = gogame.random_action(state, rng)
+                states.append(state)
+                actions.append(action)
+                state = gogame.next_state(state, action)
+            games.extend(sgf.loads(sgf.dumps(actions, 5, result='B+1')))
+            trajectories.append((np.array(states), np.array(actions)))
+
+        chunks = list(sgf.batch_convert(games, 5, chunk_size=16, lanes=2))
+        self.assertTrue(all(len(chunk[0]) == 16 for chunk in chunks[:-1]))
+        states, actions, outcomes = [np.concatenate(arrays) for arrays in zip(*chunks)]
+        expected_states = np.concatenate([t[0] for t in trajectories])
+        expected_actions = np.concatenate([t[1] for t in trajectories])
+
+        self.assertEqual(len(states), len(expected_states))
+        self.assertTrue((outcomes == 1).all())
+        # Lanes interleave games, so compare as multisets of (state, action) rows
+        rows = sorted(map(bytes, np.concatenate([states.reshape(len(states), -1), actions[:, None]], 1)
+                          .astype(np.int8)))
+        expected_rows = sorted(map(bytes, np.concatenate([expected_states.reshape(len(states), -1),
+                                                          expected_actions[:, None]], 1).astype(np.int8)))
+        self.assertEqual(rows, expected_rows)
+
+    def test_batch_convert_setup_and_illegal(self):
+        games = list(sgf.iter_games(io.StringIO(COLLECTION)))
+        states, actions, outcomes = [np.concatenate(arrays) for arrays in zip(*sgf.batch_convert(games, 5, lanes=1))]
+        # First game has 7 moves, second has a pass inserted between white's two moves
+        self.assertEqual(len(actions), 10)
+        handicap = states[7]
+        self.assertEqual(gogame.turn(handicap), govars.WHITE)
+        self.assertEqual(handicap[govars.BLACK].sum(), 2)
+        self.assertEqual(list(actions[7:]), [12, 18, 24])
+        self.assertEqual(list(outcomes), [1] * 7 + [-1] * 3)
+
+        # Playing on an occupied point truncates the game
+        game, = sgf.loads('(;SZ[5]RE[B+R];B[aa];W[aa];B[bb])')
+        states, actions, outcomes = next(sgf.batch_convert([game], 5))
+        self.assertEqual(list(actions), [0])
+
+        # Games without moves are skipped
+        games = sgf.loads('(;SZ[5]RE[B+R])(;SZ[5]RE[W+R];B[aa];W[bb])')
+        states, actions, outcomes = next(sgf.batch_convert(games, 5, lanes=2))
+        self.assertEqual(list(actions), [0, 6])
+        self.assertEqual(list(outcomes), [-1, -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from gym_go.envs import GoEnv
+
+
+def play(env, moves):
+    for _ in range(moves):
+        if env.done:
+            break
+        env.step(env.uniform_random_action())
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.env = GoEnv(size=7, superko='positional', history=3)
+        self.env.reset(seed=0)
+        play(self.env, 20)
+
+    def assertSameGame(self, env, other):
+        self.assertTrue((env.state_ == other.state_).all())
+        self.assertTrue((env.observation() == other.observation()).all())
+        self.assertEqual(env.position_hashes, other.position_hashes)
+        self.assertEqual(env.done, other.done)
+
+    def test_restore(self):
+        snapshot = self.env.snapshot()
+        observation = self.env.observation()
+        hashes = set(self.env.position_hashes)
+        for _ in range(2):
+            play(self.env, 10)
+            self.env.restore(snapshot)
+            self.assertTrue((self.env.observation() == observation).all())
+            self.assertEqual(self.env.position_hashes, hashes)
+
+    def test_clone(self):
+        clone = self.env.clone()
+        self.assertSameGame(clone, self.env)
+        self.assertIs(clone.observation_space, self.env.observation_space)
+
+        # Both go on independently, with the same random stream
+        observation = self.env.observation()
+        action = clone.uniform_random_action()
+        clone.step(action)
+        self.assertTrue((self.env.observation() == observation).all())
+        self.assertEqual(self.env.uniform_random_action(), action)
+
+    def test_pickle(self):
+        buffers = []
+        data = pickle.dumps(self.env, protocol=5, buffer_callback=buffers.append)
+        env = pickle.loads(data, buffers=buffers)
+        self.assertSameGame(env, self.env)
+        # The board is serialised as bits, not as a float64 array
+        self.assertNotIn(self.env.state_.nbytes, [buffer.raw().nbytes for buffer in buffers])
+        self.assertIn(7 * 7 * 3 // 8 + 1, [buffer.raw().nbytes for buffer in buffers])
+        self.assertEqual(env.state_.dtype, np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars, hashing
+from gym_go.solver import Solver, SolverBudgetExceeded
+
+
+def play(board_size, actions):
+    state = gogame.init_state(board_size)
+    history = {int(hashing.position_hash(state, include_turn=False))}
+    for action in actions:
+        state = gogame.next_state(state, action)
+        history.add(int(hashing.position_hash(state, include_turn=False)))
+    return state, history
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_3x3(self):
+        # Black wins the whole board with the center
+        solver = Solver(3)
+        self.assertEqual(solver.outcome(gogame.init_state(3)).value, 1)
+        state, _ = play(3, [4])
+        self.assertEqual(solver.solve(state).value, 9)
+
+        state, _ = play(3, [0])
+        self.assertEqual(solver.solve(state).value, -9)
+
+    def test_superko_history(self):
+        # Whether earlier positions can be repeated changes the value, which the table has to respect
+        state, history = play(3, [6, 3, 7, 4, 5, 1])
+        solver = Solver(3)
+        self.assertEqual(solver.solve(state, history).value, -9)
+        self.assertEqual(solver.solve(state).value, Solver(3).solve(state).value)
+
+    def test_komi(self):
+        state, _ = play(4, [13, 9, 7, 3, 4, 0, 1, 2, 5, 14, 11])
+        value, action = Solver(4).solve(state)
+        self.assertEqual(value, 16)
+        self.assertEqual(Solver(4, komi=value - 0.5).outcome(state).value, 1)
+        self.assertEqual(Solver(4, komi=value).outcome(state).value, 0)
+        self.assertEqual(Solver(4, komi=value + 0.5).outcome(state).value, -1)
+
+        # The action achieves the value
+        next_state = gogame.next_state(state, action)
+        self.assertEqual(Solver(4).solve(next_state).value, value)
+
+    def test_cache(self):
+        state, _ = play(3, [4, 0, 1])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'solved.npz')
+            solver = Solver(3, cache=path)
+            value, action = solver.solve(state)
+            solver.save()
+
+            cached = Solver(3, cache=path)
+            self.assertEqual(cached.lookup(state), (value, action))
+            # Rotated positions share the entry, with a rotated action
+            rotated = gogame.all_symmetries(state)[1]
+            rotated_action = hashing.batch_transform_actions(np.array([action]), np.array([1]), 3)[0]
+            self.assertEqual(cached.lookup(rotated), (value, rotated_action))
+            self.assertEqual(cached.solve(rotated).value, value)
+            self.assertLess(cached.counters['nodes'], solver.counters['nodes'])
+
+            self.assertRaises(ValueError, Solver, 4, cache=path)
+
+    def test_budget(self):
+        solver = Solver(3, max_nodes=100)
+        self.assertRaises(SolverBudgetExceeded, solver.solve, gogame.init_state(3))
+        self.assertEqual(solver.lookup(gogame.init_state(3)), None)
+
+    def test_game_ended(self):
+        state, _ = play(3, [4, 9, 9])
+        self.assertTrue(gogame.game_ended(state))
+        self.assertEqual(Solver(3, komi=0.5).solve(state), (8.5, None))
+        self.assertEqual(gogame.turn(state), govars.WHITE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+
+import gym
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.dataset import DatasetWriter, PositionDataset
+from gym_go.envs import GoVecEnv
+from gym_go.start_states import StartStatePool
+
+
+def random_states(num_states, size, moves, seed=0):
+    """
+    :return: States after the given numbers of uniformly random moves
+    """
+    rng = np.random.default_rng(seed)
+    states = []
+    for i in range(num_states):
+        state = gogame.init_state(size)
+        for _ in range(moves[i % len(moves)]):
+            if gogame.game_ended(state):
+                break
+            state = gogame.next_state(state, gogame.random_action(state, rng=rng))
+        states.append(state)
+    return np.array(states)
+
+
+class TestStartStates(unittest.TestCase):
+
+    def setUp(self):
+        self.size = 5
+        self.states = random_states(40, self.size, [0, 4, 12])
+
+    def test_env_reset_to_state(self):
+        env = gym.make('gym_go:go-v0', size=self.size, superko='positional')
+        state = self.states[2]
+        env.reset(options={'state': state})
+        self.assertTrue((env.state_[[govars.BLACK, govars.WHITE]] == state[[govars.BLACK, govars.WHITE]]).all())
+        self.assertEqual(env.turn(), gogame.turn(state))
+        self.assertFalse(env.game_ended())
+        self.assertEqual(len(env.position_hashes), 1)
+        # The given state is copied
+        env.step(env.uniform_random_action())
+        self.assertTrue((self.states[2] == state).all())
+
+        ended = np.copy(state)
+        ended[govars.DONE_CHNL] = 1
+        env.reset(options={'state': ended})
+        self.assertTrue(env.game_ended())
+        env.reset()
+        self.assertTrue((env.state_ == gogame.init_state(self.size)).all())
+
+    def test_vec_env_reset_to(self):
+        envs = GoVecEnv(4, self.size, seed=0, history=2)
+        envs.reset()
+        for _ in range(3):
+            envs.step(envs.uniform_random_actions())
+        before = np.copy(envs.states_)
+        moves = np.copy(envs.moves)
+
+        observations = envs.reset_to([1, 3], self.states[[1, 2]])
+        self.assertTrue((envs.states_[[1, 3]] == self.states[[1, 2]]).all())
+        self.assertTrue((envs.states_[[0, 2]] == before[[0, 2]]).all())
+        self.assertTrue((envs.moves[[1, 3]] == 0).all())
+        self.assertTrue((envs.moves[[0, 2]] == moves[[0, 2]]).all())
+        self.assertFalse(envs.dones.any())
+        # The history of a restarted game only has its start state
+        self.assertTrue((observations[1, :2] == self.states[1, :2]).all())
+        self.assertTrue((observations[1, 2:4] == 0).all())
+        self.assertTrue((observations[0, 2:4] != 0).any())
+
+    def test_array_pool_filters(self):
+        pool = StartStatePool(self.states, min_stones=8, seed=0)
+        stones = self.states[:, [govars.BLACK, govars.WHITE]].sum(axis=(1, 2, 3))
+        self.assertEqual(len(pool.source), np.sum(stones >= 8))
+        states = pool.sample(32)
+        self.assertEqual(states.shape, (32, govars.NUM_CHNLS, self.size, self.size))
+        self.assertTrue((states[:, [govars.BLACK, govars.WHITE]].sum(axis=(1, 2, 3)) >= 8).all())
+        self.assertTrue((gogame.batch_game_ended(states) == 0).all())
+
+        # Samples are symmetries of pooled states
+        keys = {gogame.batch_symmetries(pool.source[[i]], [k])[0].tobytes()
+                for i in range(len(pool.source)) for k in range(8)}
+        self.assertTrue(all(state.tobytes() in keys for state in states))
+
+        with self.assertRaises(ValueError):
+            StartStatePool(self.states, min_stones=self.size ** 2 + 1)
+
+    def test_dataset_pool_refills_finished_games(self):
+        with tempfile.TemporaryDirectory() as path:
+            with DatasetWriter(path, board_size=self.size) as writer:
+                writer.append(self.states)
+            pool = StartStatePool(PositionDataset(path), min_stones=8, max_stones=14, seed=0)
+            states = pool.sample(16)
+            stones = states[:, [govars.BLACK, govars.WHITE]].sum(axis=(1, 2, 3))
+            self.assertTrue(((stones >= 8) & (stones <= 14)).all())
+
+            envs = GoVecEnv(6, self.size, seed=0)
+            envs.reset()
+            envs.step(np.full(6, self.size ** 2))
+            envs.step(np.array([self.size ** 2] * 3 + [0] * 3))
+            self.assertTrue((envs.dones == [True] * 3 + [False] * 3).all())
+            restarted = pool.refill(envs)
+            self.assertTrue((restarted == [0, 1, 2]).all())
+            self.assertFalse(envs.dones.any())
+            self.assertTrue((envs.states_[:3, [govars.BLACK, govars.WHITE]].sum(axis=(1, 2, 3)) >= 8).all())
+            self.assertEqual(len(pool.refill(envs)), 0)
+
+            with self.assertRaises(ValueError):
+                StartStatePool(PositionDataset(path), min_stones=self.size ** 2, max_tries=3).sample(4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+import gym
+import numpy as np
+
+from gym_go import gogame, govars, hashing
+from gym_go.envs import GoVecEnv
+from gym_go.search import MCTS
+from gym_go.selfplay import random_evaluator
+from gym_go.tournament import play_games
+
+
+class TestSuperko(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = gogame.make_rng(0)
+
+    def test_next_hashes(self):
+        # A batch of different boards, with captures along the way
+        states = gogame.batch_init_state(8, 5)
+        for _ in range(30):
+            states = gogame.batch_next_states(states, gogame.batch_random_action(states, rng=self.rng))
+        for include_turn in [False, True]:
+            next_hashes = hashing.batch_next_hashes(states, include_turn)
+            for state, state_next_hashes in zip(states, next_hashes):
+                moves = np.flatnonzero(state[govars.INVD_CHNL] == 0)
+                children = gogame.batch_next_states(np.repeat(state[np.newaxis], len(moves), axis=0), moves)
+                expected = hashing.batch_position_hashes(children, include_turn)
+                self.assertTrue((state_next_hashes[moves] == expected).all())
+
+    def test_marks_repeated_positions(self):
+        state = gogame.next_state(gogame.init_state(5), 6)
+        history = {int(hashing.position_hash(gogame.next_state(state, 8), include_turn=False))}
+        superko = hashing.superko_invalid_moves(state, history)
+        self.assertEqual(np.argwhere(superko).tolist(), [[1, 3]])
+
+    def test_no_repeated_positions(self):
+        for superko in ['positional', 'situational']:
+            include_turn = superko == 'situational'
+            env = GoVecEnv(32, 3, seed=0, superko=superko)
+            histories = [{int(h)} for h in hashing.batch_position_hashes(env.states_, include_turn)]
+            for _ in range(60):
+                actions = env.uniform_random_actions()
+                active = ~env.dones
+                states, _, _, _ = env.step(actions)
+                position_hashes = hashing.batch_position_hashes(states, include_turn)
+                for i in np.flatnonzero(active):
+                    if actions[i] != 9:
+                        self.assertNotIn(int(position_hashes[i]), histories[i])
+                    histories[i].add(int(position_hashes[i]))
+
+    def test_next_states_with_histories(self):
+        # The batch functions mark superko like the env, which keeps the histories itself
+        env = GoVecEnv(16, 3, seed=0, superko='positional')
+        states = np.copy(env.states_)
+        histories = [{int(h)} for h in hashing.batch_position_hashes(states, False)]
+        for _ in range(40):
+            actions = env.uniform_random_actions()
+            active = np.flatnonzero(~env.dones)
+            env.step(actions)
+            next_states = gogame.batch_next_states(states[active], actions[active],
+                                                   histories=[histories[i] for i in active])
+            for i, next_state in zip(active, next_states):
+                self.assertTrue((next_state == gogame.next_state(states[i], actions[i], history=histories[i])).all())
+            states[active] = next_states
+            for i, h in zip(active, hashing.batch_position_hashes(next_states, False).tolist()):
+                histories[i].add(h)
+            self.assertTrue((states == env.states_).all())
+
+    def test_search_tree(self):
+        mcts = MCTS(simulations=64, superko='positional', seed=0)
+        state = gogame.init_state(3)
+        for action in [0, 4, 2, 8]:
+            state = gogame.next_state(state, action)
+        root = mcts.new_root(state, {int(hashing.position_hash(gogame.init_state(3), include_turn=False))})
+        mcts.run([root])
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            for action, child in node.children.items():
+                position_hash = int(hashing.position_hash(child.state, include_turn=False))
+                if action != 9:
+                    self.assertNotIn(position_hash, node.history)
+                self.assertEqual(child.history, node.history | {position_hash})
+                nodes.append(child)
+        self.assertGreater(len(root.children), 1)
+
+        results = play_games(random_evaluator, random_evaluator, 8, 3, superko='situational', seed=0)
+        self.assertEqual(results.shape, (8,))
+
+    def test_env(self):
+        env = gym.make('gym_go:go-v0', size=3, superko='positional')
+        env.seed(1)
+        seen = {int(hashing.position_hash(env.state(), include_turn=False))}
+        for _ in range(40):
+            if env.game_ended():
+                break
+            action = env.uniform_random_action()
+            state, _, _, _ = env.step(action)
+            position_hash = int(hashing.position_hash(state, include_turn=False))
+            if action != 9:
+                self.assertNotIn(position_hash, seen)
+            seen.add(position_hash)
+        self.assertEqual(env.position_hashes, seen)
+
+
+if __name__ == '__main__':
+    unittest.main()
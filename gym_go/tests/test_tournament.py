@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gym_go.selfplay import heuristic_evaluator, random_evaluator
+from gym_go.tournament import Tournament, play_games, ratings
+
+
+class TestTournament(unittest.TestCase):
+
+    def test_play_games(self):
+        results = play_games(heuristic_evaluator, random_evaluator, 16, board_size=5, seed=0)
+        self.assertEqual(results.shape, (16,))
+        self.assertTrue(np.isin(results, [-1, 0, 1]).all())
+        self.assertTrue((results == play_games(heuristic_evaluator, random_evaluator, 16, board_size=5,
+                                               seed=0)).all())
+
+    def test_ratings(self):
+        records = [{'black': 'a', 'white': 'b', 'wins': 15, 'losses': 5, 'draws': 0},
+                   {'black': 'b', 'white': 'a', 'wins': 5, 'losses': 15, 'draws': 0}]
+        # A 3:1 score is a 400 * log10(3) Elo difference
+        a, b = ratings(records, method='elo', prior=0)
+        self.assertEqual((a.name, b.name), ('a', 'b'))
+        self.assertAlmostEqual(a.elo - b.elo, 400 * np.log10(3))
+        self.assertAlmostEqual(a.elo, -b.elo)
+        self.assertLess(a.lower, a.elo)
+        self.assertAlmostEqual(a.upper - a.elo, a.elo - a.lower)
+        self.assertEqual((a.games, a.score), (40, 0.75))
+
+        # More games narrow the intervals, the prior keeps an undefeated player finite
+        narrow, _ = ratings([dict(record, wins=4 * record['wins'], losses=4 * record['losses'])
+                             for record in records], method='elo', prior=0)
+        self.assertLess(narrow.upper - narrow.lower, a.upper - a.lower)
+        records.append({'black': 'c', 'white': 'a', 'wins': 10, 'losses': 0, 'draws': 0})
+        best = ratings(records)[0]
+        self.assertEqual(best.name, 'c')
+        self.assertTrue(np.isfinite(best.elo))
+
+    def test_resume(self):
+        players = {'random': 'random', 'heuristic': heuristic_evaluator}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.jsonl')
+            tournament = Tournament(players, board_size=5, games_per_pairing=10, games_per_task=3, num_workers=0,
+                                    results=path, seed=0)
+            records = tournament.run()
+            # Both colours, in chunks of at most 3 games
+            self.assertEqual(len(records), 4)
+            self.assertEqual(sum(r['wins'] + r['losses'] + r['draws'] for r in records if r['black'] == 'random'), 5)
+
+            # A third player only plays the new pairings, an interrupted last line is ignored
+            with open(path, 'a') as f:
+                f.write('{"task": ')
+            played = []
+            resumed = Tournament(dict(players, other='random'), board_size=5, games_per_pairing=10,
+                                 games_per_task=3, num_workers=0, results=path, seed=0)
+            self.assertEqual(len(resumed.run(callback=played.append)), 12)
+            self.assertEqual(len(played), 8)
+            self.assertTrue(all('other' in (r['black'], r['white']) for r in played))
+            self.assertEqual(len(Tournament(players, board_size=5, games_per_pairing=10, games_per_task=3,
+                                            results=path).records()), 4)
+            self.assertEqual(len(resumed.ratings()), 3)
+
+            # Games of another configuration are not mixed in
+            for config in [{'board_size': 7}, {'komi': 0.5}, {'games_per_pairing': 12}, {'games_per_task': 5}]:
+                kwargs = dict({'board_size': 5, 'games_per_pairing': 10, 'games_per_task': 3}, **config)
+                with self.assertRaises(ValueError):
+                    Tournament(players, results=path, **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+
+import numpy as np
+
+from gym_go import gogame, govars
+from gym_go.envs import GoEnv, GoVecEnv
+
+
+class TestGoVecEnv(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.env = GoVecEnv(8, size=5)
+
+    def setUp(self):
+        self.env.reset(seed=0)
+
+    def rollout(self, env, seed, steps=20):
+        env.reset(seed=seed)
+        trajectory = []
+        for _ in range(steps):
+            actions = env.uniform_random_actions()
+            trajectory.append(actions)
+            env.step(actions)
+        return np.array(trajectory)
+
+    def test_matches_single_env(self):
+        actions = np.arange(8)
+        states, _, dones, info = self.env.step(actions)
+        for i, a in enumerate(actions):
+            expected = gogame.next_state(gogame.init_state(5), a)
+            self.assertTrue((states[i] == expected).all())
+        self.assertFalse(dones.any())
+        self.assertTrue((info['turn'] == govars.WHITE).all())
+
+    def test_seeded_rollouts_reproducible(self):
+        first = self.rollout(self.env, 42)
+        second = self.rollout(self.env, 42)
+        self.assertTrue((first == second).all())
+
+        other = self.rollout(self.env, 43)
+        self.assertFalse((first == other).all())
+
+    def test_spawned_streams_are_independent(self):
+        rngs = gogame.spawn_rngs(np.random.SeedSequence(7), 4)
+        draws = [r.integers(0, 2 ** 32, size=4) for r in rngs]
+        for i in range(4):
+            for j in range(i + 1, 4):
+                self.assertFalse((draws[i] == draws[j]).all())
+
+    def test_ended_games_are_frozen(self):
+        pass_action = gogame.action_size(board_size=5) - 1
+        actions = np.full(8, pass_action)
+        actions[1:] = 0
+        self.env.step(actions)
+        _, rewards, dones, _ = self.env.step(np.full(8, pass_action))
+        self.assertTrue(dones[0])
+        self.assertEqual(rewards[0], 0)
+        ended = np.copy(self.env.states_[0])
+        self.env.step(np.full(8, pass_action))
+        self.assertTrue((self.env.states_[0] == ended).all())
+
+    def test_single_env_seed(self):
+        env = GoEnv(size=5)
+        actions = []
+        for _ in range(2):
+            env.reset(seed=3)
+            actions.append([env.uniform_random_action() for _ in range(10)])
+        self.assertEqual(actions[0], actions[1])
+
+    def test_influence_rewards(self):
+        env = GoVecEnv(8, size=5, reward_method='influence')
+        single = GoEnv(size=5, reward_method='influence')
+        env.reset(seed=0)
+        single.reset()
+        pass_action = gogame.action_size(board_size=5) - 1
+        actions = np.full(8, 12)
+        actions[0] = pass_action
+        _, rewards, dones, _ = env.step(actions)
+        _, reward, _, _ = single.step(12)
+        self.assertFalse(dones.any())
+        # A center stone is estimated to own more than its own point
+        self.assertGreater(rewards[1], 1)
+        # Both envs reward in black's perspective
+        self.assertEqual(rewards[1], reward)
+
+        _, rewards, dones, _ = env.step(np.full(8, pass_action))
+        self.assertTrue(dones[0])
+        self.assertEqual(rewards[0], -25)
+        self.assertTrue((rewards[1:] == rewards[1]).all())
+
+    def test_adjudication(self):
+        env = GoVecEnv(4, size=5, adjudicate_margin=0, adjudicate_moves=2)
+        single = GoEnv(size=5, adjudicate_margin=0, adjudicate_moves=2)
+        env.reset(seed=0)
+        pass_action = gogame.action_size(board_size=5) - 1
+        actions = np.full(4, 12)
+        actions[0] = pass_action
+        _, _, dones, _ = env.step(actions)
+        single.step(12)
+        self.assertFalse(dones.any())
+
+        # Black has led for two moves on the boards with a stone, the first board ends by passing
+        _, rewards, dones, info = env.step(np.full(4, pass_action))
+        _, _, done, single_info = single.step(None)
+        self.assertTrue(dones.all())
+        self.assertEqual(info['adjudicated'].tolist(), [False, True, True, True])
+        self.assertEqual(rewards.tolist(), [0, 1, 1, 1])
+        self.assertEqual(env.steps_saved, 3 * (2 * 25 - 2))
+        self.assertTrue(done and single_info['adjudicated'])
+        self.assertEqual(single.winner(), 1)
+        self.assertEqual(single.steps_saved, 2 * 25 - 2)
+
+        ended = np.copy(env.states_)
+        env.step(np.zeros(4, dtype=int))
+        self.assertTrue((env.states_ == ended).all())
+
+        env.reset()
+        self.assertFalse(env.info()['adjudicated'].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
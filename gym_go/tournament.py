@@ -0,0 +1,328 @@
+"""
+Round robin matches between policies, with Elo/BayesElo ratings. Every pairing is played with swapped colours in
+batched games that are spread over a process pool. Finished tasks are appended to a JSONL file, so an interrupted
+tournament resumes where it stopped.
+
+    tournament = Tournament({'random': 'random', 'heuristic': 'heuristic', 'net': net_evaluator}, board_size=9,
+                            games_per_pairing=200, results='tournament.jsonl')
+    tournament.run()
+    for rating in tournament.ratings():
+        print(rating)
+
+A player is an evaluator as in selfplay: a function from a batch of canonical states to (policies, values),
+or the name of one of selfplay.EVALUATORS. Actions are sampled from the policies over the valid moves.
+"""
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+from scipy.special import expit, ndtri
+
+from gym_go import gogame, hashing
+from gym_go.selfplay import EVALUATORS
+
+Rating = collections.namedtuple('Rating', ['name', 'elo', 'lower', 'upper', 'games', 'score'])
+
+ELO_SCALE = np.log(10) / 400
+
+
+def play_games(black, white, num_games, board_size, komi=0, max_moves=None, temperature=1, temperature_moves=None,
+               superko=None, seed=None):
+    """
+    Plays num_games games between two evaluators in lockstep, with one evaluator call per move over all games
+    :param max_moves: Games are cut off (and scored) after this many moves, defaults to 2 * board_size ** 2
+    :param temperature_moves: After this many moves actions are picked greedily, defaults to never
+    :param superko: None (simple ko only), 'positional' or 'situational' (see GoEnv)
+    :return: (num_games,) results in black's perspective, 1, 0 or -1
+    """
+    rng = gogame.make_rng(seed)
+    max_moves = max_moves or 2 * board_size ** 2
+    temperature_moves = np.inf if temperature_moves is None else temperature_moves
+    states = gogame.batch_init_state(num_games, board_size)
+    include_turn = superko == 'situational'
+    if superko is not None:
+        position_hashes = [set(hashing.batch_position_hashes(states[:1], include_turn).tolist())
+                           for _ in range(num_games)]
+    for move in range(max_moves):
+        active = np.nonzero(gogame.batch_game_ended(states) == 0)[0]
+        if len(active) == 0:
+            break
+        # All games start together, so the same player is to move in every ongoing game
+        evaluator = black if move % 2 == 0 else white
+        canonical = gogame.batch_canonical_form(states[active])
+        policies, _ = evaluator(canonical)
+        actions = gogame.batch_random_action(canonical, policies, temperature if move < temperature_moves else 0,
+                                             rng=rng)
+        if superko is None:
+            states[active] = gogame.batch_next_states(states[active], actions)
+            continue
+        states[active] = gogame.batch_next_states(states[active], actions,
+                                                  histories=[position_hashes[i] for i in active],
+                                                  include_turn=include_turn)
+        for i, position_hash in zip(active, hashing.batch_position_hashes(states[active], include_turn).tolist()):
+            position_hashes[i].add(position_hash)
+    return gogame.batch_winning(states, komi).astype(int)
+
+
+_worker = {}
+
+
+def _init_worker(players, config):
+    _worker['players'] = players
+    _worker['config'] = config
+
+
+def _play_task(task):
+    task_id, black, white, num_games, seed = task
+    players = _worker['players']
+    results = play_games(players[black], players[white], num_games, seed=seed, **_worker['config'])
+    return {
+        'task': task_id,
+        'black': black,
+        'white': white,
+        'wins': int(np.sum(results > 0)),
+        'losses': int(np.sum(results < 0)),
+        'draws': int(np.sum(results == 0)),
+    }
+
+
+class Tournament:
+    """
+    Round robin between named players. Records count the wins, losses and draws of black per task.
+    """
+
+    def __init__(self, players, board_size, games_per_pairing=100, games_per_task=None, komi=0, max_moves=None,
+                 temperature=1, temperature_moves=None, superko=None, num_workers=2, results=None, seed=None,
+                 start_method=None):
+        '''
+        @param players: Dict from names to evaluators or names of selfplay.EVALUATORS. With the spawn start method
+        the evaluators have to be picklable
+        @param games_per_pairing: Games per pair of players, half of them with each player as black
+        @param games_per_task: Most games played in lockstep by one task, defaults to half a pairing
+        @param num_workers: Processes in the pool, 0 plays all tasks in this process
+        @param results: Optional JSONL path. Records are appended as tasks finish, and tasks already in the file
+        are skipped. Every record keeps the tournament's configuration, and a file with records of another
+        configuration is refused
+        @param seed: Seeds the tasks' streams (spawned from one SeedSequence in task order)
+        Other arguments are passed to play_games
+        '''
+        self.players = {name: EVALUATORS[player] if isinstance(player, str) else player
+                        for name, player in players.items()}
+        self.board_size = board_size
+        self.games_per_pairing = games_per_pairing
+        self.games_per_task = games_per_task or (games_per_pairing + 1) // 2
+        self.config = {
+            'board_size': board_size,
+            'komi': komi,
+            'max_moves': max_moves,
+            'temperature': temperature,
+            'temperature_moves': temperature_moves,
+            'superko': superko,
+        }
+        # Everything that decides what a task's games were, checked when resuming
+        self.record_config = dict(self.config, games_per_pairing=games_per_pairing,
+                                  games_per_task=self.games_per_task)
+        self.num_workers = num_workers
+        self.results = results
+        self.seed = seed
+        self.ctx = multiprocessing.get_context(start_method)
+        self._records = {}
+        if results is not None and os.path.exists(results):
+            self._load()
+
+    def tasks(self):
+        """
+        :return: List of (task id, black, white, number of games, SeedSequence) covering every pairing in both colours
+        """
+        tasks = []
+        for first, second in itertools.combinations(self.players, 2):
+            halves = [(first, second, (self.games_per_pairing + 1) // 2),
+                      (second, first, self.games_per_pairing // 2)]
+            for black, white, num_games in halves:
+                for chunk, start in enumerate(range(0, num_games, self.games_per_task)):
+                    task_id = '{}|{}|{}'.format(black, white, chunk)
+                    tasks.append((task_id, black, white, min(self.games_per_task, num_games - start)))
+        seeds = np.random.SeedSequence(self.seed).spawn(len(tasks))
+        return [task + (seed,) for task, seed in zip(tasks, seeds)]
+
+    def run(self, callback=None):
+        """
+        Plays the tasks that have no record yet
+        :param callback: Optional function called with each new record
+        :return: All records
+        """
+        tasks = [task for task in self.tasks() if task[0] not in self._records]
+        if not tasks:
+            return self.records()
+
+        if self.num_workers == 0:
+            _init_worker(self.players, self.config)
+            self._collect(map(_play_task, tasks), callback)
+        else:
+            with self.ctx.Pool(self.num_workers, _init_worker, (self.players, self.config)) as pool:
+                self._collect(pool.imap_unordered(_play_task, tasks), callback)
+        return self.records()
+
+    def _collect(self, records, callback):
+        f = None
+        try:
+            if self.results is not None:
+                partial = False
+                if os.path.exists(self.results) and os.path.getsize(self.results) > 0:
+                    with open(self.results, 'rb') as last:
+                        last.seek(-1, os.SEEK_END)
+                        partial = last.read(1) != b'\n'
+                f = open(self.results, 'a')
+                # An interrupted write leaves a partial last line, start on a fresh one
+                if partial:
+                    f.write('\n')
+            for record in records:
+                record['config'] = self.record_config
+                self._records[record['task']] = record
+                if f is not None:
+                    f.write(json.dumps(record) + '\n')
+                    f.flush()
+                if callback is not None:
+                    callback(record)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _load(self):
+        with open(self.results) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('config') != self.record_config:
+                    raise ValueError('{} has records of another tournament configuration: {}'.format(
+                        self.results, record.get('config')))
+                self._records[record['task']] = record
+
+    def records(self):
+        """
+        :return: Records of the finished tasks of this tournament's players
+        """
+        return [record for record in self._records.values()
+                if record['black'] in self.players and record['white'] in self.players]
+
+    def ratings(self, **kwargs):
+        """
+        :return: Ratings of the players from the finished tasks, see ratings
+        """
+        return ratings(self.records(), players=list(self.players), **kwargs)
+
+
+def _likelihood(deltas, counts, advantages, draw, method):
+    """
+    :param deltas: (N,) black's minus white's rating in natural units (Elo * ELO_SCALE)
+    :param counts: (N, 3) black wins, black losses and draws
+    :return: log-likelihood, and its first and second derivatives in each delta
+    """
+    u = deltas + advantages
+    if method == 'elo':
+        # Draws count as half a win and half a loss
+        counts = np.stack([counts[:, 0] + counts[:, 2] / 2, counts[:, 1] + counts[:, 2] / 2], axis=1)
+        p = expit(u)
+        q = p * (1 - p)
+        probs = [p, 1 - p]
+        first = [q, -q]
+        second = [q * (1 - 2 * p), -q * (1 - 2 * p)]
+    elif method == 'bayeselo':
+        win, loss = expit(u - draw), expit(-u - draw)
+        q_win, q_loss = win * (1 - win), loss * (1 - loss)
+        probs = [win, loss, 1 - win - loss]
+        first = [q_win, -q_loss, q_loss - q_win]
+        second = [q_win * (1 - 2 * win), q_loss * (1 - 2 * loss),
+                  -q_win * (1 - 2 * win) - q_loss * (1 - 2 * loss)]
+    else:
+        raise ValueError('Unknown rating method {}'.format(method))
+
+    log_likelihood, d1, d2 = 0, 0, 0
+    for k, (p, dp, ddp) in enumerate(zip(probs, first, second)):
+        n = counts[:, k]
+        log_likelihood += np.sum(n * np.log(p))
+        d1 = d1 + n * dp / p
+        d2 = d2 + n * (ddp / p - (dp / p) ** 2)
+    return log_likelihood, d1, d2
+
+
+def ratings(records, players=None, method='bayeselo', prior=2, advantage=0, draw_elo=97.3, confidence=0.95):
+    """
+    Maximum a posteriori ratings with confidence intervals from the curvature of the log-likelihood.
+    'elo' is the logistic Elo model with draws as half points, 'bayeselo' is Coulom's model with a separate
+    draw probability
+    :param records: Dicts with 'black', 'white', 'wins', 'losses' and 'draws', in black's perspective
+    :param players: Names to rate, defaults to everyone in the records
+    :param prior: Virtual draws of every player against an opponent rated 0, so undefeated players get finite ratings
+    :param advantage: Elo advantage of playing black
+    :param draw_elo: Draw parameter of bayeselo, larger values make draws more likely
+    :return: Ratings sorted from best to worst, with a mean of 0
+    """
+    if players is None:
+        players = sorted({record[color] for record in records for color in ('black', 'white')})
+    index = {name: i for i, name in enumerate(players)}
+    n = len(players)
+    records = [record for record in records if record['black'] in index and record['white'] in index]
+
+    # Virtual games against the opponent rated 0 have index n
+    blacks = np.array([index[record['black']] for record in records] + list(range(n)), dtype=int)
+    whites = np.array([index[record['white']] for record in records] + [n] * n, dtype=int)
+    counts = np.array([[record['wins'], record['losses'], record['draws']] for record in records] +
+                      [[0, 0, prior]] * n, dtype=np.float64).reshape(-1, 3)
+    advantages = np.where(whites < n, advantage * ELO_SCALE, 0)
+    draw = draw_elo * ELO_SCALE
+
+    def fit_terms(x):
+        x = np.append(x, 0)
+        log_likelihood, d1, d2 = _likelihood(x[blacks] - x[whites], counts, advantages, draw, method)
+        gradient = np.zeros(n + 1)
+        np.add.at(gradient, blacks, d1)
+        np.add.at(gradient, whites, -d1)
+        hessian = np.zeros((n + 1, n + 1))
+        np.add.at(hessian, (blacks, blacks), d2)
+        np.add.at(hessian, (whites, whites), d2)
+        np.add.at(hessian, (blacks, whites), -d2)
+        np.add.at(hessian, (whites, blacks), -d2)
+        return log_likelihood, gradient[:n], hessian[:n, :n]
+
+    # Newton's method, the log-likelihood is concave in the ratings. Without a prior it only depends on their
+    # differences, hence the pseudo-inverses
+    x = np.zeros(n)
+    log_likelihood, gradient, hessian = fit_terms(x)
+    for _ in range(100):
+        step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+        while True:
+            new_log_likelihood, new_gradient, new_hessian = fit_terms(x - step)
+            if new_log_likelihood >= log_likelihood or np.max(np.abs(step)) < 1e-12:
+                break
+            step /= 2
+        x = x - step
+        log_likelihood, gradient, hessian = new_log_likelihood, new_gradient, new_hessian
+        if np.max(np.abs(step)) < 1e-9:
+            break
+
+    # Ratings and their covariance relative to the mean rating
+    centering = np.eye(n) - 1 / n
+    elos = centering @ x / ELO_SCALE
+    covariance = centering @ np.linalg.pinv(-hessian) @ centering.T / ELO_SCALE ** 2
+    margins = ndtri((1 + confidence) / 2) * np.sqrt(np.maximum(np.diag(covariance), 0))
+
+    games = np.zeros(n)
+    scores = np.zeros(n)
+    for record in records:
+        total = record['wins'] + record['losses'] + record['draws']
+        black, white = index[record['black']], index[record['white']]
+        games[black] += total
+        games[white] += total
+        scores[black] += record['wins'] + record['draws'] / 2
+        scores[white] += record['losses'] + record['draws'] / 2
+    scores = scores / np.maximum(games, 1)
+
+    order = np.argsort(-elos)
+    return [Rating(players[i], elos[i], elos[i] - margins[i], elos[i] + margins[i], int(games[i]), scores[i])
+            for i in order]
@@ -4,5 +4,7 @@ setuptools.setup(
     name='gym_go',
     version='0.0.1',
     # packages=setuptools.find_packages(),
-    install_requires=['gym']  # and other dependencies
+    install_requires=['gym'],  # and other dependencies
+    # Lets gym register the envs when it is imported
+    entry_points={'gym.envs': ['__root__ = gym_go:register_envs']},
 )